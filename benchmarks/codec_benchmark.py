@@ -0,0 +1,131 @@
+"""
+Compare api.codec with the previous EnhancedJSONEncoder-based serialization.
+
+Encodes and decodes a ConversationOverallAnalysis with 10, 100 and 1000
+messages and reports the time per operation, plus the memory taken by the
+decoded messages.
+
+Usage:
+    poetry run python benchmarks/codec_benchmark.py [--repeat 200]
+"""
+
+import argparse
+import dataclasses
+import json
+import timeit
+import tracemalloc
+from datetime import datetime
+
+from api import codec
+from api.models import (
+    AnalysisScore,
+    Conversation,
+    ConversationAnalysis,
+    ConversationOverallAnalysis,
+    Message,
+)
+
+SIZES = (10, 100, 1000)
+
+
+class EnhancedJSONEncoder(json.JSONEncoder):
+    """The encoder conversations were saved with before api.codec."""
+
+    def default(self, o):
+        if dataclasses.is_dataclass(o):
+            return dataclasses.asdict(o)
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def legacy_encode(analysis: ConversationOverallAnalysis) -> str:
+    return json.dumps(analysis, cls=EnhancedJSONEncoder)
+
+
+def legacy_decode(data: str) -> ConversationOverallAnalysis:
+    return ConversationOverallAnalysis(**json.loads(data))
+
+
+def make_analysis(size: int) -> ConversationOverallAnalysis:
+    messages = [
+        Message(
+            role="user" if i % 2 else "assistant",
+            content=f"Message {i}: " + "I would start by segmenting the users. " * 8,
+            timestamp=datetime.now(),
+            id=f"0191b3c4-{i:04d}-7000-8000-000000000000",
+        )
+        for i in range(size)
+    ]
+    score = AnalysisScore(
+        name="communication",
+        human_name="Communication",
+        description="Clear and structured communication.",
+        score=3,
+        feedback="Structured answers with a clear recommendation.",
+    )
+    return ConversationOverallAnalysis(
+        conversation=Conversation(messages=messages),
+        analysis=ConversationAnalysis(
+            **{field: score for field in codec.ANALYSIS_FIELDS}
+        ),
+        overall_score=3,
+        overall_feedback="Strong overall.",
+    )
+
+
+def per_op_us(fn, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat * 1e6
+
+
+def message_memory(data: str, decode) -> int:
+    tracemalloc.start()
+    decoded = decode(data)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del decoded
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    backend = "orjson" if codec.orjson is not None else "json"
+    print(f"api.codec backend: {backend}")
+    columns = (
+        "encode legacy",
+        "encode codec",
+        "decode legacy",
+        "decode codec",
+        "memory legacy",
+        "memory codec",
+    )
+    print(f"{'messages':>8}  " + "  ".join(f"{column:>14}" for column in columns))
+    for size in SIZES:
+        analysis = make_analysis(size)
+        legacy_data = legacy_encode(analysis)
+        codec_data = codec.encode(analysis)
+        repeat = max(1, args.repeat * 10 // size)
+
+        results = [
+            per_op_us(lambda: legacy_encode(analysis), repeat),
+            per_op_us(lambda: codec.encode(analysis), repeat),
+            per_op_us(lambda: legacy_decode(legacy_data), repeat),
+            per_op_us(lambda: codec.decode_overall_analysis(codec_data), repeat),
+        ]
+        memory = [
+            message_memory(legacy_data, legacy_decode),
+            message_memory(codec_data, codec.decode_overall_analysis),
+        ]
+        print(
+            f"{size:>8}  "
+            + "  ".join(f"{us:>11.1f} us" for us in results)
+            + "  "
+            + "  ".join(f"{kib:>10.1f} KiB" for kib in (m / 1024 for m in memory))
+        )
+
+
+if __name__ == "__main__":
+    main()
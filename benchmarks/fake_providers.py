@@ -0,0 +1,196 @@
+"""
+Local stand-ins for the OpenRouter, Deepgram and Rime APIs.
+
+A single Quart app serves all three under their own path prefixes, with
+configurable latency and payload sizes, so the API can be benchmarked
+without network access or provider costs. Point the API at it with:
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:9000/openrouter
+    DEEPGRAM_BASE_URL=http://127.0.0.1:9000/deepgram
+    RIME_BASE_URL=http://127.0.0.1:9000/rime
+
+Usage:
+    poetry run python benchmarks/fake_providers.py [--port 9000] [--llm-latency 0.5]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+from dataclasses import dataclass, fields
+from typing import Any, Dict
+
+from quart import Quart, Response, make_response, request
+
+FILLER = "The candidate segmented users clearly and tied the design back to them. "
+
+
+@dataclass
+class FakeProviderConfig:
+    # Seconds before a non-streamed completion returns
+    llm_latency: float = 0.5
+    # Seconds before the first token of a streamed completion
+    llm_first_token_latency: float = 0.2
+    # Seconds between streamed tokens
+    llm_token_interval: float = 0.01
+    completion_tokens: int = 60
+    stt_latency: float = 0.3
+    tts_latency: float = 0.4
+    tts_bytes: int = 64 * 1024
+    # Relative random variation applied to every latency
+    jitter: float = 0.1
+
+    def delay(self, seconds: float) -> float:
+        return max(0.0, seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+def fake_completion_text(config: FakeProviderConfig) -> str:
+    # A verdict line followed by the justification, as the analysis expects
+    words = (FILLER * (config.completion_tokens // 10 + 1)).split()
+    return "Strong\n" + " ".join(words[: config.completion_tokens])
+
+
+def fake_from_schema(schema: Dict[str, Any]) -> Any:
+    """Build a value that satisfies a (strict, simple) JSON schema."""
+    if "enum" in schema:
+        return "Strong" if "Strong" in schema["enum"] else schema["enum"][0]
+    if schema.get("type") == "object":
+        return {
+            name: fake_from_schema(property_schema)
+            for name, property_schema in schema.get("properties", {}).items()
+        }
+    if schema.get("type") == "array":
+        return [fake_from_schema(schema.get("items", {}))]
+    if schema.get("type") in ("integer", "number"):
+        return 3
+    if schema.get("type") == "boolean":
+        return True
+    return FILLER.strip()
+
+
+def create_fake_app(config: FakeProviderConfig) -> Quart:
+    app = Quart(__name__)
+    app.config["fake"] = config
+    audio = b"RIFF" + bytes(max(0, config.tts_bytes - 4))
+
+    @app.post("/openrouter/chat/completions")
+    async def chat_completions():
+        body = await request.get_json()
+        usage = {
+            "prompt_tokens": sum(len(m["content"]) // 4 for m in body["messages"]),
+            "completion_tokens": config.completion_tokens,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        chunk_base = {"id": "fake", "created": int(time.time()), "model": body["model"]}
+
+        if body.get("stream"):
+
+            async def chunks():
+                await asyncio.sleep(config.delay(config.llm_first_token_latency))
+                for word in fake_completion_text(config).split(" "):
+                    chunk = {
+                        **chunk_base,
+                        "object": "chat.completion.chunk",
+                        "choices": [{"index": 0, "delta": {"content": word + " "}}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n".encode()
+                    await asyncio.sleep(config.llm_token_interval)
+                final = {
+                    **chunk_base,
+                    "object": "chat.completion.chunk",
+                    "choices": [],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode()
+
+            response = await make_response(
+                chunks(), {"Content-Type": "text/event-stream"}
+            )
+            response.timeout = None
+            return response
+
+        await asyncio.sleep(config.delay(config.llm_latency))
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            content = json.dumps(
+                fake_from_schema(response_format["json_schema"]["schema"])
+            )
+        else:
+            content = fake_completion_text(config)
+        return {
+            **chunk_base,
+            "object": "chat.completion",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+            "usage": usage,
+        }
+
+    @app.post("/deepgram/listen")
+    async def listen():
+        await request.get_data()
+        await asyncio.sleep(config.delay(config.stt_latency))
+        transcript = "I would start by clarifying who the users are."
+        return {
+            "results": {
+                "channels": [
+                    {"alternatives": [{"transcript": transcript, "confidence": 0.99}]}
+                ]
+            }
+        }
+
+    @app.post("/deepgram/speak")
+    async def speak():
+        await asyncio.sleep(config.delay(config.tts_latency))
+        return Response(audio, content_type="audio/wav")
+
+    @app.post("/rime/rime-tts")
+    async def rime_tts():
+        await asyncio.sleep(config.delay(config.tts_latency))
+        return {"audioContent": base64.b64encode(audio).decode()}
+
+    return app
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add a --<field> option for every FakeProviderConfig field."""
+    for config_field in fields(FakeProviderConfig):
+        parser.add_argument(
+            "--" + config_field.name.replace("_", "-"),
+            type=config_field.type,
+            default=config_field.default,
+        )
+
+
+def config_from_arguments(args: argparse.Namespace) -> FakeProviderConfig:
+    return FakeProviderConfig(
+        **{
+            config_field.name: getattr(args, config_field.name)
+            for config_field in fields(FakeProviderConfig)
+        }
+    )
+
+
+def main() -> None:
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    hypercorn_config = Config()
+    hypercorn_config.bind = [f"{args.host}:{args.port}"]
+    asyncio.run(serve(create_fake_app(config_from_arguments(args)), hypercorn_config))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Load test the API against local provider stand-ins.
+
+Starts the fake providers from fake_providers.py and the API on localhost,
+points the API at the fakes through its base-URL settings, then drives
+/transcribe, /chat, /chat/save and /analysis/<id> at each concurrency level.
+For every scenario it reports p50/p95/p99 latency, throughput, errors and
+the resident memory of the process. Nothing leaves the machine, so runs are
+comparable across commits.
+
+The API, the fakes and the load generator share one process and event loop
+unless --url points at an API started separately (with its base URLs set to
+the fakes, see --fake-port); memory is only reported for the in-process API.
+Files the API writes go to a temporary directory.
+
+Usage:
+    poetry run python benchmarks/load_test.py [--concurrency 1,8,32] [--requests 100]
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_providers import (  # noqa: E402
+    add_config_arguments,
+    config_from_arguments,
+    create_fake_app,
+)
+
+SCENARIOS = ("transcribe", "chat", "save", "analysis")
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    concurrency: int
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+    rss_bytes: Optional[int] = None
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes() -> Optional[int]:
+    """Return the current resident memory of this process, if known."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Peak rather than current, but all that's available on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def make_wav(size: int) -> bytes:
+    return b"RIFF" + bytes(max(0, size - 4))
+
+
+def make_conversation(messages: int) -> Dict:
+    return {
+        "messages": [
+            {"role": "system", "content": "You are an interviewer for a PM role."}
+        ]
+        + [
+            {
+                "role": "assistant" if i % 2 else "user",
+                "content": f"Turn {i}: " + "I would start by segmenting users. " * 6,
+            }
+            for i in range(messages)
+        ]
+    }
+
+
+async def serve_app(app, port: int, shutdown: asyncio.Event) -> asyncio.Task:
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{port}"]
+    config.accesslog = None
+    config.errorlog = None
+    task = asyncio.create_task(serve(app, config, shutdown_trigger=shutdown.wait))
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"http://127.0.0.1:{port}/")
+                return task
+            except httpx.TransportError:
+                await asyncio.sleep(0.05)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def build_scenarios(
+    client: httpx.AsyncClient, args: argparse.Namespace
+) -> Dict[str, Callable[[], Awaitable[bool]]]:
+    """Return a coroutine function per scenario that makes one request."""
+    wav = make_wav(args.upload_bytes)
+    conversation = make_conversation(args.messages)
+
+    async def transcribe() -> bool:
+        res = await client.post(
+            "/transcribe", files={"file": ("speech.wav", wav, "audio/wav")}
+        )
+        return res.status_code == 200
+
+    async def chat() -> bool:
+        res = await client.post("/chat", json={"conversation": conversation})
+        return res.status_code == 200 and bool(res.json()["content"])
+
+    async def save() -> bool:
+        res = await client.post("/chat/save", json={"conversation": conversation})
+        return res.status_code == 200
+
+    async def analysis() -> bool:
+        res = await client.post("/chat/save", json={"conversation": conversation})
+        if res.status_code != 200:
+            return False
+        conversation_id = res.json()["conversation_id"]
+        # Poll like the results page does until the analysis is ready
+        while True:
+            res = await client.get(f"/analysis/{conversation_id}")
+            if res.status_code != 202:
+                return res.status_code == 200
+            await asyncio.sleep(args.poll_interval)
+
+    return {
+        "transcribe": transcribe,
+        "chat": chat,
+        "save": save,
+        "analysis": analysis,
+    }
+
+
+async def run_scenario(
+    name: str,
+    request: Callable[[], Awaitable[bool]],
+    concurrency: int,
+    requests: int,
+    measure_memory: bool,
+) -> ScenarioResult:
+    result = ScenarioResult(scenario=name, concurrency=concurrency)
+    remaining = requests
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                ok = await request()
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                result.latencies.append(time.perf_counter() - start)
+            else:
+                result.errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - start
+    if measure_memory:
+        result.rss_bytes = rss_bytes()
+    return result
+
+
+def print_result(result: ScenarioResult) -> None:
+    memory = "-"
+    if result.rss_bytes is not None:
+        memory = f"{result.rss_bytes / 1024**2:.1f}"
+    print(
+        f"{result.scenario:<11} {result.concurrency:>5} "
+        f"{result.percentile(0.5) * 1000:>9.1f} {result.percentile(0.95) * 1000:>9.1f} "
+        f"{result.percentile(0.99) * 1000:>9.1f} {result.throughput:>9.1f} "
+        f"{result.errors:>6} {memory:>8}"
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    shutdown = asyncio.Event()
+    fake_port = args.fake_port or free_port()
+    servers = [
+        await serve_app(
+            create_fake_app(config_from_arguments(args)), fake_port, shutdown
+        )
+    ]
+
+    if args.url:
+        base_url = args.url
+    else:
+        fake_url = f"http://127.0.0.1:{fake_port}"
+        os.environ["OPENROUTER_BASE_URL"] = f"{fake_url}/openrouter"
+        os.environ["DEEPGRAM_BASE_URL"] = f"{fake_url}/deepgram"
+        os.environ["RIME_BASE_URL"] = f"{fake_url}/rime"
+        os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+        os.environ.setdefault("DEEPGRAM_API_KEY", "benchmark")
+        os.environ.setdefault("RIME_API_KEY", "benchmark")
+        os.environ.setdefault("RETENTION_ENABLED", "false")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        if not args.tts_cache:
+            # Every fake reply is the same text, which the cache would serve
+            os.environ["TTS_CACHE_MAX_BYTES"] = "0"
+        if not args.analysis_cache:
+            # Likewise every analysis is of the same conversation
+            os.environ["ANALYSIS_CACHE_ENABLED"] = "false"
+
+        # Imported only now, since the API reads its settings on import
+        from api import app
+
+        api_port = free_port()
+        servers.append(await serve_app(app, api_port, shutdown))
+        base_url = f"http://127.0.0.1:{api_port}"
+
+    print(
+        f"{'scenario':<11} {'conc':>5} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'p99 ms':>9} {'req/s':>9} {'errors':>6} {'RSS MiB':>8}"
+    )
+    try:
+        for concurrency in args.concurrency:
+            async with httpx.AsyncClient(
+                base_url=base_url,
+                timeout=args.timeout,
+                limits=httpx.Limits(max_connections=concurrency),
+            ) as client:
+                scenarios = build_scenarios(client, args)
+                for name in args.scenarios:
+                    result = await run_scenario(
+                        name,
+                        scenarios[name],
+                        concurrency,
+                        args.requests,
+                        measure_memory=not args.url,
+                    )
+                    print_result(result)
+    finally:
+        shutdown.set()
+        await asyncio.gather(*servers, return_exceptions=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(level) for level in value.split(",")],
+        default=[1, 8, 32],
+        help="comma-separated concurrency levels",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=100, help="requests per scenario and level"
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=lambda value: value.split(","),
+        default=list(SCENARIOS),
+        help=f"comma-separated subset of {','.join(SCENARIOS)}",
+    )
+    parser.add_argument(
+        "--messages", type=int, default=20, help="messages per conversation"
+    )
+    parser.add_argument("--upload-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument(
+        "--tts-cache", action="store_true", help="keep the TTS cache enabled"
+    )
+    parser.add_argument(
+        "--analysis-cache",
+        action="store_true",
+        help="keep the analysis cache enabled",
+    )
+    parser.add_argument("--url", help="benchmark an API that is already running")
+    parser.add_argument(
+        "--fake-port", type=int, default=0, help="port of the fake providers"
+    )
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if not args.url:
+        # Keep the files the API writes out of the working tree
+        os.chdir(tempfile.mkdtemp(prefix="leetpro-benchmark-"))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
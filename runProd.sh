@@ -1 +1 @@
-poetry run uvicorn api:app --host 0.0.0.0 --port 5000 --env-file .env
\ No newline at end of file
+poetry run serve
\ No newline at end of file
@@ -4,31 +4,92 @@ Main API module for the LeetPro application.
 This module sets up the Quart application, defines routes, and handles API requests.
 """
 
+import asyncio
+import dataclasses
+import logging
 import os
 from datetime import datetime
 from dataclasses import dataclass
+from typing import AsyncIterator, Callable, List, Optional, Union
 
 from dotenv import load_dotenv
+
+# Before the api modules are imported, since they read their settings from
+# the environment on import
+load_dotenv()
+
 import uvicorn
-from quart import Quart, Response, send_from_directory
+from pydantic import TypeAdapter, ValidationError
+from quart import (
+    Quart,
+    Response,
+    make_response,
+    request,
+    websocket,
+)
 from quart_cors import cors
 from quart_schema import QuartSchema, DataSource, validate_request, validate_response
 from quart_schema.pydantic import File
 
-from api.stt import transcribe_audio, write_speech_file
-from api.tts import generate_tts
-from api.txt2txt import get_txt2txt_completion
+from api.admission import Overloaded, retry_after_header
+from api.analysis_jobs import ANALYSIS_EAGER, analysis_jobs
+from api.audio_formats import (
+    AUDIO_FORMATS_BY_EXTENSION,
+    DEFAULT_AUDIO_FORMAT,
+    AudioFormat,
+    negotiate_audio_format,
+)
+from api.clients import provider_clients
+from api.stt import (
+    MAX_SPEECH_FILE_SIZE,
+    SPEECH_IN_PERSIST,
+    SpeechFormDataParser,
+    read_speech_file,
+    transcribe_audio,
+    write_speech_file,
+)
+from api.stt_stream import UtteranceAssembler, create_streaming_backend
+from api.tts import DEFAULT_SPEAKER, generate_tts
+from api.tts_router import TTSError
+from api.tts_pipeline import AudioSegment, SentenceSplitter, TTSPipeline
+from api.txt2txt import get_txt2txt_completion, stream_txt2txt_completion
+from api.context import context_manager
 from api.conversation import save_conversation, get_conversation_analysis
+from api.storage import conversation_store
 from api.models import (
     Conversation,
     ConversationOverallAnalysis,
+    Message,
 )
-from api.utils import generate_uuid
-
-
-load_dotenv()
+from api.layout import SPEECH_IN_DIR, VO_DIR
+from api.metrics import (
+    METRICS_ENABLED,
+    TRACING_ENABLED,
+    registry,
+    start_trace,
+    stats_samples,
+    trace_id,
+)
+from api.model_router import LLMError, ModelRouter
+from api.retention import RETENTION_ENABLED, retention_sweeper
+from api.sessions import ChatSession, sessions
+from api.static_audio import send_audio
+from api.tts_cache import tts_cache
+from api.tts import tts_router
+from api.utils import format_sse, generate_uuid
+from api.warmup import warmup
+
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(
+    level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+# httpx logs every provider request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
 
 app = Quart(__name__)
+app.request_class.form_data_parser_class = SpeechFormDataParser
 app = cors(
     app,
     allow_origin=[
@@ -42,27 +103,133 @@ app = cors(
 )
 QuartSchema(app)
 
+# Gauges read from the components' own stats when /metrics is scraped
+registry.gauge(
+    "leetpro_llm_model",
+    "Rolling health of each LLM model.",
+    ["model", "stat"],
+    lambda: stats_samples(ModelRouter.stats()),
+)
+registry.gauge(
+    "leetpro_tts_provider",
+    "Rolling health of each TTS provider.",
+    ["provider", "stat"],
+    lambda: stats_samples(tts_router.stats()),
+)
+registry.gauge(
+    "leetpro_tts_cache",
+    "TTS cache counters and size.",
+    ["stat"],
+    lambda: stats_samples(tts_cache.stats()),
+)
+registry.gauge(
+    "leetpro_context",
+    "Context compaction counters.",
+    ["stat"],
+    lambda: stats_samples(dataclasses.asdict(context_manager.stats)),
+)
+registry.gauge(
+    "leetpro_analysis_jobs",
+    "Tracked analysis jobs by status.",
+    ["status"],
+    lambda: stats_samples(analysis_jobs.counts()),
+)
+registry.gauge(
+    "leetpro_sessions",
+    "Active chat sessions.",
+    [],
+    lambda: [((), len(sessions))],
+)
+
+
+@app.before_serving
+async def startup() -> None:
+    """Open the pooled provider clients and start the background workers."""
+    await provider_clients.start()
+    await warmup.start()
+    await analysis_jobs.start()
+    if RETENTION_ENABLED:
+        await retention_sweeper.start()
+
+
+@app.after_serving
+async def shutdown() -> None:
+    """Stop the background workers and close the provider clients and store."""
+    await retention_sweeper.stop()
+    await analysis_jobs.stop()
+    await warmup.stop()
+    await provider_clients.aclose()
+    await conversation_store.close()
+
+
+if TRACING_ENABLED:
+
+    @app.before_request
+    async def begin_trace() -> None:
+        start_trace(request.headers)
+
+    @app.after_request
+    async def return_trace_id(response: Response) -> Response:
+        current = trace_id.get()
+        if current is not None:
+            response.headers["X-Trace-Id"] = current
+        return response
+
+
+@app.errorhandler(Overloaded)
+async def overloaded(error: Overloaded) -> Response:
+    """Shed load with a 503 when a provider's queue is full."""
+    return Response(
+        "Server busy, retry later",
+        status=503,
+        headers={"Retry-After": retry_after_header(error)},
+    )
+
+
 # Route definitions
 
 
-@app.route("/vo/<vo_id>.wav")
-async def vo(vo_id: str):
+@app.route("/vo/<vo_id>.<any(wav, mp3, ogg):extension>")
+async def vo(vo_id: str, extension: str):
     """Serve voice output files."""
-    return await send_from_directory("public/vo", f"{vo_id}.wav")
+    audio_format = AUDIO_FORMATS_BY_EXTENSION[extension]
+    return await send_audio(
+        VO_DIR, audio_format.filename(vo_id), mimetype=audio_format.mimetype
+    )
+
+
+@app.route("/vo/<vo_id>.m3u")
+async def vo_playlist(vo_id: str):
+    """Serve voice output playlists of sentence-pipelined replies."""
+    return await send_audio(VO_DIR, f"{vo_id}.m3u", mimetype="audio/x-mpegurl")
 
 
 @app.route("/speech_in/<speech_file_id>.wav")
 async def speech_in(speech_file_id: str):
     """Serve speech input files."""
-    return await send_from_directory("public/speech_in", f"{speech_file_id}.wav")
+    return await send_audio(
+        SPEECH_IN_DIR, f"{speech_file_id}.wav", mimetype="audio/wav"
+    )
 
 
 @app.get("/health")
 async def health():
-    """Health check endpoint."""
+    """Health check endpoint, failing until the startup warmup is done."""
+    if not warmup.ready:
+        return Response("Warming up", status=503, headers={"Retry-After": "1"})
     return Response("OK", status=200)
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Expose the app's metrics in the Prometheus text format."""
+    if not METRICS_ENABLED:
+        return Response("Metrics are disabled", status=404)
+    return Response(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # Data models for request/response validation
 
 
@@ -89,9 +256,42 @@ class ChatOutput:
     id: str
 
 
+@dataclass
+class TurnInput:
+    file: File
+    session_id: Optional[str] = None
+    # The conversation so far as JSON, for clients without a session
+    conversation: Optional[str] = None
+
+
+@dataclass
+class TurnOutput:
+    transcript: str
+    content: str
+    vo_id: str
+    timestamp: datetime
+    id: str
+
+
+@dataclass
+class SessionInput:
+    messages: List[Message]
+
+
+@dataclass
+class SessionOutput:
+    session_id: str
+
+
+@dataclass
+class SessionChatInput:
+    message: Message
+
+
 @dataclass
 class SaveChatInput:
-    conversation: Conversation
+    conversation: Optional[Conversation] = None
+    session_id: Optional[str] = None
 
 
 @dataclass
@@ -99,68 +299,590 @@ class SaveChatOutput:
     conversation_id: str
 
 
+@dataclass
+class AnalysisJobOutput:
+    conversation_id: str
+    status: str
+    progress: float
+
+
 # API endpoints
 
 
+def check_speech_upload(file: File) -> Optional[Response]:
+    """Return the error response for an unacceptable speech upload, if any."""
+    if file.content_type != "audio/wav":
+        return Response("audio/wav is required", status=415)
+    if file.content_length > MAX_SPEECH_FILE_SIZE:
+        return Response("file too large", status=413)
+    return None
+
+
 @app.post("/transcribe")
 @validate_request(TranscribeInput, source=DataSource.FORM_MULTIPART)
 @validate_response(TranscribeOutput)
 async def transcribe(data: TranscribeInput) -> TranscribeOutput:
     """Transcribe audio file to text."""
-    if data.file.content_type != "audio/wav":
-        return Response("audio/wav is required", status=415)
-    if data.file.content_length > 10 * 1024 * 1024:  # 10 MB
+    error = check_speech_upload(data.file)
+    if error is not None:
+        return error
+
+    audio = read_speech_file(data.file)
+    if len(audio) > MAX_SPEECH_FILE_SIZE:
         return Response("file too large", status=413)
 
-    speech_file_id = await write_speech_file(data.file)
-    text = await transcribe_audio(speech_file_id)
+    if SPEECH_IN_PERSIST:
+        app.add_background_task(write_speech_file, generate_uuid(), audio)
+
+    text = await transcribe_audio(audio)
     return TranscribeOutput(text=text)
 
 
-@app.post("/chat")
-@validate_request(ChatInput)
-@validate_response(ChatOutput)
-async def chat(data: ChatInput) -> ChatOutput:
-    """Process chat input and generate response."""
-    
-    messages = [
-        {"role": msg.role, "content": msg.content} for msg in data.conversation.messages
-    ]
-    res = await get_txt2txt_completion(messages)
+@app.websocket("/transcribe/stream")
+async def transcribe_stream():
+    """
+    Transcribe audio streamed over a WebSocket while the candidate speaks.
+
+    The client sends binary audio frames (optionally declaring the raw
+    encoding and sample_rate as query parameters) and a "finish" text message
+    when done. The server sends JSON messages of type "interim", "final" and
+    "utterance_end"; the latter carries the whole utterance once the candidate
+    stops talking, so the next /chat can start immediately. If the
+    transcription stream fails, an "error" message is sent and the WebSocket
+    is closed.
+    """
+    sample_rate = websocket.args.get("sample_rate", type=int)
+    backend = create_streaming_backend(
+        encoding=websocket.args.get("encoding"), sample_rate=sample_rate
+    )
+    await backend.start()
+
+    async def receive_audio() -> None:
+        try:
+            while True:
+                data = await websocket.receive()
+                if isinstance(data, str):
+                    if data == "finish":
+                        break
+                    continue
+                await backend.send(data)
+        finally:
+            await backend.finish()
+
+    receiver = asyncio.create_task(receive_audio())
+    try:
+        assembler = UtteranceAssembler()
+        async for event in backend.events():
+            for message in assembler.process(event):
+                await websocket.send_json(message)
+    finally:
+        receiver.cancel()
+        await asyncio.gather(receiver, return_exceptions=True)
+
+
+def request_audio_format() -> AudioFormat:
+    """
+    Choose the voice output format from the `format` query parameter or Accept.
+
+    Raises:
+        ValueError: If the requested format is not supported.
+    """
+    return negotiate_audio_format(
+        request.args.get("format"), request.accept_mimetypes
+    )
+
+
+async def generate_reply(
+    messages: List[Message],
+    context_key: Optional[str] = None,
+    audio_format: AudioFormat = DEFAULT_AUDIO_FORMAT,
+) -> ChatOutput:
+    """
+    Generate the interviewer's reply to a conversation, with voice output.
+
+    Args:
+        messages (List[Message]): The conversation so far.
+        context_key (str, optional): Identifies the conversation for context
+            compaction, e.g. a session ID.
+        audio_format (AudioFormat): The format of the voice output.
+
+    Returns:
+        ChatOutput: The reply.
+    """
+    try:
+        res = await get_txt2txt_completion(
+            context_manager.compact(
+                [{"role": msg.role, "content": msg.content} for msg in messages],
+                key=context_key,
+            )
+        )
+    except LLMError as e:
+        logger.warning("Error getting completion: %r", e)
+        res = ""
 
     vo_id = generate_uuid()
     if not res or res == "":
         return ChatOutput(content="", vo_id="", timestamp=datetime.now(), id='')
 
-    await generate_tts(speaker="joy", text=res, id=vo_id)
-
+    try:
+        await generate_tts(
+            speaker=DEFAULT_SPEAKER, text=res, id=vo_id, audio_format=audio_format
+        )
+        vo_path = f"vo/{audio_format.filename(vo_id)}"
+    except TTSError as e:
+        # Still return the text, without pointing at missing audio
+        logger.warning("Error generating voice output: %r", e)
+        vo_path = ""
 
     return ChatOutput(
         content=res,
-        vo_id=f"vo/{vo_id}.wav",
+        vo_id=vo_path,
         timestamp=datetime.now(),
         id=vo_id,
     )
 
 
+@app.post("/chat")
+@validate_request(ChatInput)
+@validate_response(ChatOutput)
+async def chat(data: ChatInput) -> ChatOutput:
+    """Process chat input and generate response."""
+    try:
+        audio_format = request_audio_format()
+    except ValueError as e:
+        return Response(str(e), status=400)
+    return await generate_reply(data.conversation.messages, audio_format=audio_format)
+
+
+@app.post("/sessions")
+@validate_request(SessionInput)
+@validate_response(SessionOutput)
+async def create_session(data: SessionInput) -> SessionOutput:
+    """Create a server-side chat session, seeded with the given messages."""
+    session = sessions.create(data.messages)
+    return SessionOutput(session_id=session.id)
+
+
+@app.delete("/sessions/<session_id>")
+async def delete_session(session_id: str):
+    """End a chat session."""
+    sessions.delete(session_id)
+    return Response(status=204)
+
+
+def assistant_message(output: ChatOutput) -> Message:
+    return Message(
+        role="assistant",
+        content=output.content,
+        timestamp=output.timestamp,
+        id=output.id,
+    )
+
+
+async def session_reply(
+    session: ChatSession, message: Message, audio_format: AudioFormat
+) -> ChatOutput:
+    """
+    Add a message to a session and generate the reply, holding the session lock.
+
+    If no reply could be generated, the message is taken back out so the
+    client can retry it.
+    """
+    async with session.lock:
+        sessions.append(session, message)
+        try:
+            output = await generate_reply(
+                session.messages, context_key=session.id, audio_format=audio_format
+            )
+        except Overloaded:
+            sessions.pop(session)
+            raise
+        if not output.content:
+            sessions.pop(session)
+            return output
+
+        sessions.append(session, assistant_message(output))
+    return output
+
+
+@app.post("/sessions/<session_id>/chat")
+@validate_request(SessionChatInput)
+@validate_response(ChatOutput)
+async def session_chat(session_id: str, data: SessionChatInput) -> ChatOutput:
+    """
+    Add a message to a session and generate the response.
+
+    Only the new message is sent; the session holds the rest of the history.
+    """
+    try:
+        audio_format = request_audio_format()
+    except ValueError as e:
+        return Response(str(e), status=400)
+
+    session = sessions.get(session_id)
+    if session is None:
+        return Response("Session not found", status=404)
+
+    return await session_reply(session, data.message, audio_format)
+
+
+async def reply_events(
+    messages: List[Message],
+    audio_format: AudioFormat,
+    context_key: Optional[str] = None,
+    on_reply: Optional[Callable[[ChatOutput], None]] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Generate the interviewer's reply as Server-Sent Events.
+
+    Args:
+        messages (List[Message]): The conversation so far.
+        audio_format (AudioFormat): The format of the voice output.
+        context_key (str, optional): Identifies the conversation for context
+            compaction, e.g. a session ID.
+        on_reply (Callable[[ChatOutput], None], optional): Called with the
+            reply once it is complete, unless it is empty.
+
+    Yields:
+        bytes: The "token", "audio", "done" or "error" events.
+    """
+    compacted = context_manager.compact(
+        [{"role": msg.role, "content": msg.content} for msg in messages],
+        key=context_key,
+    )
+
+    def audio_event(segment: AudioSegment) -> bytes:
+        return format_sse(
+            "audio",
+            {
+                "index": segment.index,
+                # Empty when the sentence could not be synthesized
+                "vo_id": (
+                    f"vo/{audio_format.filename(segment.id)}" if segment.ok else ""
+                ),
+                "text": segment.text,
+            },
+        )
+
+    vo_id = generate_uuid()
+    splitter = SentenceSplitter()
+    pipeline = TTSPipeline(
+        speaker=DEFAULT_SPEAKER, vo_id=vo_id, audio_format=audio_format
+    )
+    # Stop synthesizing if the client goes away (GeneratorExit or
+    # CancelledError) or the completion fails; a no-op once it completed
+    try:
+        tokens = []
+        try:
+            async for token in stream_txt2txt_completion(compacted):
+                tokens.append(token)
+                yield format_sse("token", {"content": token})
+
+                for sentence in splitter.feed(token):
+                    pipeline.submit(sentence)
+                for segment in pipeline.ready():
+                    yield audio_event(segment)
+        except Overloaded as e:
+            yield format_sse(
+                "error",
+                {"message": "overloaded", "retry_after": retry_after_header(e)},
+            )
+            return
+        except Exception as e:
+            logger.warning("Error streaming completion: %r", e)
+            yield format_sse("error", {"message": "completion failed"})
+            return
+
+        res = "".join(tokens)
+        if not res:
+            yield format_sse(
+                "done",
+                {
+                    "content": "",
+                    "vo_id": "",
+                    "timestamp": datetime.now().isoformat(),
+                    "id": "",
+                },
+            )
+            return
+
+        remaining = splitter.flush()
+        if remaining:
+            pipeline.submit(remaining)
+        while segment := await pipeline.next():
+            yield audio_event(segment)
+        await pipeline.write_playlist()
+        has_audio = any(segment.ok for segment in pipeline.segments)
+
+        output = ChatOutput(
+            content=res,
+            vo_id=f"vo/{vo_id}.m3u" if has_audio else "",
+            timestamp=datetime.now(),
+            id=vo_id,
+        )
+        if on_reply is not None:
+            on_reply(output)
+        yield format_sse(
+            "done",
+            {
+                "content": output.content,
+                "vo_id": output.vo_id,
+                "timestamp": output.timestamp.isoformat(),
+                "id": output.id,
+            },
+        )
+    finally:
+        await pipeline.cancel()
+
+
+async def event_stream(events: AsyncIterator[bytes]) -> Response:
+    response = await make_response(
+        events,
+        {
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+    response.timeout = None
+    return response
+
+
+@app.post("/chat/stream")
+@validate_request(ChatInput)
+async def chat_stream(data: ChatInput) -> Response:
+    """
+    Process chat input and stream the response as Server-Sent Events.
+
+    Emits a "token" event per completion token and an "audio" event per
+    synthesized sentence, in order, as soon as it is ready. Finishes with a
+    "done" event carrying the ChatOutput fields, where vo_id points to the
+    playlist of the reply's sentences. An "error" event is sent instead if the
+    completion fails.
+    """
+    try:
+        audio_format = request_audio_format()
+    except ValueError as e:
+        return Response(str(e), status=400)
+
+    return await event_stream(
+        reply_events(data.conversation.messages, audio_format)
+    )
+
+
+conversation_adapter = TypeAdapter(Conversation)
+
+
+@dataclass
+class Turn:
+    """A transcribed voice turn, ready for the reply."""
+
+    audio_format: AudioFormat
+    message: Message
+    session: Optional[ChatSession] = None
+    conversation: Optional[Conversation] = None
+
+
+async def begin_turn(data: TurnInput) -> Union[Turn, Response]:
+    """
+    Validate a voice turn and transcribe its speech.
+
+    Returns:
+        Union[Turn, Response]: The turn, or the error response for an
+            invalid request.
+    """
+    try:
+        audio_format = request_audio_format()
+    except ValueError as e:
+        return Response(str(e), status=400)
+
+    error = check_speech_upload(data.file)
+    if error is not None:
+        return error
+
+    session = None
+    conversation = None
+    if data.session_id is not None:
+        session = sessions.get(data.session_id)
+        if session is None:
+            return Response("Session not found", status=404)
+    elif data.conversation is not None:
+        try:
+            conversation = conversation_adapter.validate_json(data.conversation)
+        except ValidationError as e:
+            return Response(
+                f"conversation is not a valid Conversation: {e}", status=400
+            )
+    else:
+        return Response("conversation or session_id is required", status=400)
+
+    audio = read_speech_file(data.file)
+    if len(audio) > MAX_SPEECH_FILE_SIZE:
+        return Response("file too large", status=413)
+
+    # The speech file shares its ID with the candidate's message
+    message_id = generate_uuid()
+    if SPEECH_IN_PERSIST:
+        app.add_background_task(write_speech_file, message_id, audio)
+
+    transcript = await transcribe_audio(audio)
+    return Turn(
+        audio_format=audio_format,
+        message=Message(
+            role="user", content=transcript, timestamp=datetime.now(), id=message_id
+        ),
+        session=session,
+        conversation=conversation,
+    )
+
+
+@app.post("/turn")
+@validate_request(TurnInput, source=DataSource.FORM_MULTIPART)
+@validate_response(TurnOutput)
+async def turn(data: TurnInput) -> TurnOutput:
+    """
+    Run a whole voice turn: transcribe the candidate's speech and reply to it.
+
+    Takes the speech as a multipart "file" along with either a session_id or
+    the conversation so far as JSON. The transcript becomes the candidate's
+    message; in a session it is added to the history along with the reply.
+    """
+    turn = await begin_turn(data)
+    if isinstance(turn, Response):
+        return turn
+
+    transcript = turn.message.content
+    if not transcript.strip():
+        output = ChatOutput(content="", vo_id="", timestamp=datetime.now(), id="")
+    elif turn.session is not None:
+        output = await session_reply(turn.session, turn.message, turn.audio_format)
+    else:
+        output = await generate_reply(
+            turn.conversation.messages + [turn.message],
+            audio_format=turn.audio_format,
+        )
+    return TurnOutput(
+        transcript=transcript,
+        content=output.content,
+        vo_id=output.vo_id,
+        timestamp=output.timestamp,
+        id=output.id,
+    )
+
+
+@app.post("/turn/stream")
+@validate_request(TurnInput, source=DataSource.FORM_MULTIPART)
+async def turn_stream(data: TurnInput) -> Response:
+    """
+    Run a whole voice turn, streaming the reply as Server-Sent Events.
+
+    Takes the same form as /turn. Emits a "transcript" event with the
+    candidate's message, then the events of /chat/stream.
+    """
+    turn = await begin_turn(data)
+    if isinstance(turn, Response):
+        return turn
+
+    async def send_events():
+        message = turn.message
+        yield format_sse("transcript", {"text": message.content, "id": message.id})
+        if not message.content.strip():
+            yield format_sse(
+                "done",
+                {
+                    "content": "",
+                    "vo_id": "",
+                    "timestamp": datetime.now().isoformat(),
+                    "id": "",
+                },
+            )
+            return
+
+        session = turn.session
+        if session is None:
+            async for event in reply_events(
+                turn.conversation.messages + [message], turn.audio_format
+            ):
+                yield event
+            return
+
+        replied = False
+
+        def on_reply(output: ChatOutput) -> None:
+            nonlocal replied
+            replied = True
+            sessions.append(session, assistant_message(output))
+
+        async with session.lock:
+            sessions.append(session, message)
+            try:
+                async for event in reply_events(
+                    session.messages,
+                    turn.audio_format,
+                    context_key=session.id,
+                    on_reply=on_reply,
+                ):
+                    yield event
+            finally:
+                if not replied:
+                    # Let the client retry the turn
+                    sessions.pop(session)
+
+    return await event_stream(send_events())
+
+
 @app.post("/chat/save")
 @validate_request(SaveChatInput)
 @validate_response(SaveChatOutput)
 async def save_chat(data: SaveChatInput) -> SaveChatOutput:
-    """Save chat conversation."""
-    conversation_id = await save_conversation(data.conversation)
+    """Save a chat conversation, sent in full or held by a session."""
+    if data.session_id is not None:
+        session = sessions.get(data.session_id)
+        if session is None:
+            return Response("Session not found", status=404)
+        conversation = session.conversation
+    elif data.conversation is not None:
+        conversation = data.conversation
+    else:
+        return Response("conversation or session_id is required", status=400)
+
+    conversation_id = await save_conversation(conversation)
+    if ANALYSIS_EAGER:
+        analysis_jobs.enqueue(conversation_id)
     return SaveChatOutput(conversation_id=conversation_id)
 
 
 @app.get("/analysis/<conversation_id>")
 async def analyze_conversation(conversation_id: str) -> ConversationOverallAnalysis:
-    """Analyze a saved conversation."""
+    """
+    Get the analysis of a saved conversation.
+
+    Until the analysis is ready this enqueues it (sharing any job already in
+    flight for the conversation) and returns 202 with the job's progress.
+    """
 
     overall_analysis = await get_conversation_analysis(conversation_id)
 
     if not overall_analysis:
         return Response("Conversation not found", status=404)
 
+    if overall_analysis.analysis is None:
+        job = analysis_jobs.get(conversation_id)
+        if job is not None and job.status == "failed":
+            # Report the failure once; the next request retries the analysis
+            analysis_jobs.discard(conversation_id)
+            return Response("Analysis failed", status=502)
+
+        job = analysis_jobs.enqueue(conversation_id)
+        return (
+            AnalysisJobOutput(
+                conversation_id=conversation_id,
+                status=job.status,
+                progress=job.progress,
+            ),
+            202,
+        )
+
     return overall_analysis
 
 
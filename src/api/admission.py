@@ -0,0 +1,220 @@
+"""
+Admission control for provider calls.
+
+Each provider gets a limiter that bounds its concurrent calls. Calls are
+made on behalf of a traffic class: "interactive" for requests a candidate is
+waiting on (/chat, /transcribe) and "batch" for background work (analyses,
+context summaries). Interactive calls are always admitted first, and batch
+calls may only take a share of the slots, so a burst of analyses can't
+starve the interview itself.
+
+When no slot is free a call waits in its class's queue until its deadline.
+If the queue is full or the deadline passes, Overloaded is raised, which the
+app turns into a 503 with Retry-After.
+"""
+
+import asyncio
+import contextvars
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict
+
+from api.metrics import registry
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+OPENROUTER_MAX_CONCURRENCY = int(os.environ.get("OPENROUTER_MAX_CONCURRENCY", "32"))
+DEEPGRAM_MAX_CONCURRENCY = int(os.environ.get("DEEPGRAM_MAX_CONCURRENCY", "32"))
+RIME_MAX_CONCURRENCY = int(os.environ.get("RIME_MAX_CONCURRENCY", "16"))
+# Share of each provider's slots that batch traffic may use
+ADMISSION_BATCH_SHARE = float(os.environ.get("ADMISSION_BATCH_SHARE", "0.5"))
+# Calls waiting per provider and class before new ones are shed
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_INTERACTIVE_TIMEOUT_SECONDS = float(
+    os.environ.get("ADMISSION_INTERACTIVE_TIMEOUT_SECONDS", "5")
+)
+ADMISSION_BATCH_TIMEOUT_SECONDS = float(
+    os.environ.get("ADMISSION_BATCH_TIMEOUT_SECONDS", "120")
+)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+traffic_class: "contextvars.ContextVar[str]" = contextvars.ContextVar(
+    "traffic_class", default=INTERACTIVE
+)
+
+admission_wait_seconds = registry.histogram(
+    "leetpro_admission_wait_seconds",
+    "Time provider calls waited for a slot.",
+    ["provider", "traffic_class"],
+)
+admission_rejected_total = registry.counter(
+    "leetpro_admission_rejected_total",
+    "Provider calls shed because the queue was full or the deadline passed.",
+    ["provider", "traffic_class", "reason"],
+)
+
+
+class Overloaded(Exception):
+    """Raised when a provider call is shed instead of queued."""
+
+    def __init__(self, provider: str, reason: str, retry_after: float):
+        super().__init__(f"{provider} is overloaded ({reason})")
+        self.provider = provider
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class PriorityLimiter:
+    """Bounds the concurrent calls to one provider, favouring interactive ones."""
+
+    def __init__(
+        self,
+        provider: str,
+        limit: int,
+        batch_share: float = ADMISSION_BATCH_SHARE,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        enabled: bool = ADMISSION_ENABLED,
+    ):
+        self.provider = provider
+        self.limit = limit
+        self.batch_limit = max(1, int(limit * batch_share))
+        self.max_queue = max_queue
+        self.enabled = enabled
+        self.in_use = 0
+        self.batch_in_use = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {
+            INTERACTIVE: deque(),
+            BATCH: deque(),
+        }
+
+    def queue_depth(self, cls: str) -> int:
+        return sum(not waiter.done() for waiter in self._waiters[cls])
+
+    def _can_start(self, cls: str) -> bool:
+        if self.in_use >= self.limit:
+            return False
+        return cls == INTERACTIVE or self.batch_in_use < self.batch_limit
+
+    def _start(self, cls: str) -> None:
+        self.in_use += 1
+        if cls == BATCH:
+            self.batch_in_use += 1
+
+    def _release(self, cls: str) -> None:
+        self.in_use -= 1
+        if cls == BATCH:
+            self.batch_in_use -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        # Interactive waiters go first; batch ones get whatever is left
+        for cls in (INTERACTIVE, BATCH):
+            waiters = self._waiters[cls]
+            while waiters and self._can_start(cls):
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    self._start(cls)
+                    waiter.set_result(None)
+
+    def _reject(self, cls: str, reason: str, timeout: float) -> Overloaded:
+        admission_rejected_total.inc(
+            provider=self.provider, traffic_class=cls, reason=reason
+        )
+        return Overloaded(self.provider, reason, retry_after=timeout)
+
+    async def _acquire(self, cls: str, timeout: float) -> None:
+        start = time.monotonic()
+        waiting_ahead = self.queue_depth(INTERACTIVE) + (
+            self.queue_depth(BATCH) if cls == BATCH else 0
+        )
+        if not waiting_ahead and self._can_start(cls):
+            self._start(cls)
+        else:
+            if self.queue_depth(cls) >= self.max_queue:
+                raise self._reject(cls, "queue_full", timeout)
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[cls].append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except BaseException as e:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was granted just as we gave up on it
+                    self._release(cls)
+                else:
+                    waiter.cancel()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._reject(cls, "deadline", timeout) from None
+                raise
+        admission_wait_seconds.observe(
+            time.monotonic() - start, provider=self.provider, traffic_class=cls
+        )
+
+    @asynccontextmanager
+    async def slot(self, timeout: float = 0) -> AsyncIterator[None]:
+        """
+        Hold one of the provider's slots for the enclosed call.
+
+        The traffic class is taken from the traffic_class context variable.
+
+        Args:
+            timeout (float): Seconds to wait for a slot. Default is the
+                class's ADMISSION_*_TIMEOUT_SECONDS.
+
+        Raises:
+            Overloaded: If the queue is full or no slot freed up in time.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        cls = traffic_class.get()
+        if not timeout:
+            timeout = (
+                ADMISSION_INTERACTIVE_TIMEOUT_SECONDS
+                if cls == INTERACTIVE
+                else ADMISSION_BATCH_TIMEOUT_SECONDS
+            )
+        await self._acquire(cls, timeout)
+        try:
+            yield
+        finally:
+            self._release(cls)
+
+
+def retry_after_header(error: Overloaded) -> str:
+    return str(max(1, math.ceil(error.retry_after)))
+
+
+limiters = {
+    "openrouter": PriorityLimiter("openrouter", OPENROUTER_MAX_CONCURRENCY),
+    "deepgram": PriorityLimiter("deepgram", DEEPGRAM_MAX_CONCURRENCY),
+    "rime": PriorityLimiter("rime", RIME_MAX_CONCURRENCY),
+}
+
+registry.gauge(
+    "leetpro_admission_queue_depth",
+    "Provider calls waiting for a slot.",
+    ["provider", "traffic_class"],
+    lambda: [
+        ((name, cls), limiter.queue_depth(cls))
+        for name, limiter in limiters.items()
+        for cls in (INTERACTIVE, BATCH)
+    ],
+)
+registry.gauge(
+    "leetpro_admission_in_use",
+    "Provider calls holding a slot.",
+    ["provider", "traffic_class"],
+    lambda: [
+        sample
+        for name, limiter in limiters.items()
+        for sample in (
+            ((name, INTERACTIVE), limiter.in_use - limiter.batch_in_use),
+            ((name, BATCH), limiter.batch_in_use),
+        )
+    ],
+)
@@ -0,0 +1,186 @@
+"""
+Background conversation analysis jobs.
+
+Analyses run on a small pool of worker tasks instead of inside the HTTP
+request. Requests for a conversation that is already queued or running share
+that job, so refreshing or polling the results page never starts a second
+set of LLM calls.
+
+An analysis shed by admission control is put back on the queue once the
+provider's Retry-After has passed, rather than failing, up to
+ANALYSIS_OVERLOAD_RETRIES times.
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from api.admission import BATCH, Overloaded, traffic_class
+from api.conversation import run_conversation_analysis
+from api.metrics import span, trace_id
+
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "2"))
+
+# Whether /chat/save enqueues the analysis straight away instead of waiting
+# for the first /analysis request.
+ANALYSIS_EAGER = os.environ.get("ANALYSIS_EAGER", "false").lower() == "true"
+
+# How long shutdown waits for queued and running analyses before cancelling
+ANALYSIS_DRAIN_SECONDS = float(os.environ.get("ANALYSIS_DRAIN_SECONDS", "25"))
+
+# Times a shed analysis is requeued before it is reported as failed
+ANALYSIS_OVERLOAD_RETRIES = int(os.environ.get("ANALYSIS_OVERLOAD_RETRIES", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnalysisJob:
+    conversation_id: str
+    status: str = "queued"  # queued, running, done or failed
+    completed: int = 0
+    total: int = 1
+    error: Optional[str] = None
+    # Times the job was shed under load and requeued
+    retries: int = 0
+    # The trace of the request that queued the job, when tracing
+    trace_id: Optional[str] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def progress(self) -> float:
+        return self.completed / self.total if self.total else 0.0
+
+    def advance(self, completed: int, total: int) -> None:
+        self.completed = completed
+        self.total = total
+
+
+class AnalysisJobManager:
+    """Queues analysis jobs and runs them on a pool of worker tasks."""
+
+    def __init__(
+        self,
+        workers: int = ANALYSIS_WORKERS,
+        overload_retries: int = ANALYSIS_OVERLOAD_RETRIES,
+    ):
+        self.workers = workers
+        self.overload_retries = overload_retries
+        self._queue: "asyncio.Queue[AnalysisJob]" = asyncio.Queue()
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._tasks: List[asyncio.Task] = []
+        # Shed jobs waiting to be requeued, by conversation ID
+        self._requeues: Dict[str, asyncio.TimerHandle] = {}
+
+    async def start(self) -> None:
+        """Start the worker tasks."""
+        for _ in range(self.workers - len(self._tasks)):
+            self._tasks.append(asyncio.create_task(self._work()))
+
+    async def stop(self, drain_timeout: float = ANALYSIS_DRAIN_SECONDS) -> None:
+        """
+        Let the queued and running analyses finish, then cancel the workers.
+
+        Args:
+            drain_timeout (float): Seconds to wait for the analyses before
+                cancelling them. 0 cancels straight away.
+        """
+        if self._tasks and drain_timeout > 0 and self._unfinished():
+            try:
+                await asyncio.wait_for(self._queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Cancelling %d unfinished analyses", self._unfinished())
+        for handle in self._requeues.values():
+            handle.cancel()
+        self._requeues.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _unfinished(self) -> int:
+        return sum(
+            job.status in ("queued", "running") for job in self._jobs.values()
+        )
+
+    def get(self, conversation_id: str) -> Optional[AnalysisJob]:
+        return self._jobs.get(conversation_id)
+
+    def discard(self, conversation_id: str) -> None:
+        self._jobs.pop(conversation_id, None)
+
+    def counts(self) -> Dict[str, int]:
+        """Return the number of tracked jobs in each status."""
+        counts = {"queued": 0, "running": 0, "failed": 0}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def enqueue(self, conversation_id: str) -> AnalysisJob:
+        """
+        Queue an analysis, or return the job already analyzing the conversation.
+
+        Args:
+            conversation_id (str): The ID of the conversation to analyze.
+
+        Returns:
+            AnalysisJob: The job, shared by every caller until it finishes.
+        """
+        job = self._jobs.get(conversation_id)
+        if job is not None and job.status in ("queued", "running"):
+            return job
+
+        job = AnalysisJob(conversation_id=conversation_id, trace_id=trace_id.get())
+        self._jobs[conversation_id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def _requeue(self, job: AnalysisJob) -> None:
+        self._requeues.pop(job.conversation_id, None)
+        self._queue.put_nowait(job)
+
+    async def _work(self) -> None:
+        # Analyses yield provider capacity to interactive requests
+        traffic_class.set(BATCH)
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            trace_id.set(job.trace_id)
+            try:
+                with span("analysis"):
+                    await run_conversation_analysis(
+                        job.conversation_id, progress=job.advance
+                    )
+                job.status = "done"
+                # The stored analysis is the result from now on
+                self.discard(job.conversation_id)
+            except Overloaded as e:
+                if job.retries >= self.overload_retries:
+                    logger.warning(
+                        "Giving up on conversation %s: %s", job.conversation_id, e
+                    )
+                    job.status = "failed"
+                    job.error = str(e)
+                else:
+                    # Not the conversation's fault: grade it once there's room
+                    job.retries += 1
+                    job.status = "queued"
+                    job.completed = 0
+                    self._requeues[job.conversation_id] = (
+                        asyncio.get_running_loop().call_later(
+                            e.retry_after, self._requeue, job
+                        )
+                    )
+            except Exception as e:
+                logger.exception("Error analyzing conversation %s", job.conversation_id)
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                if job.status != "queued":
+                    job.done.set()
+                self._queue.task_done()
+
+
+analysis_jobs = AnalysisJobManager()
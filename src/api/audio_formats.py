@@ -0,0 +1,111 @@
+"""
+Voice output codecs.
+
+Voice output is written as WAV (uncompressed PCM), MP3 or Opus in an Ogg
+container. Clients pick one per request with a `format` query parameter or an
+audio type in the Accept header; otherwise VO_FORMAT is used.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    name: str
+    extension: str
+    mimetype: str
+    # Media types clients may ask for this format by
+    aliases: Tuple[str, ...]
+    # Deepgram speak encoding and container
+    deepgram_encoding: str
+    deepgram_container: Optional[str]
+    # Rime audioFormat, or None if Rime can't produce this format
+    rime_audio_format: Optional[str]
+
+    def filename(self, id: str) -> str:
+        return f"{id}.{self.extension}"
+
+
+WAV = AudioFormat(
+    name="wav",
+    extension="wav",
+    mimetype="audio/wav",
+    aliases=("audio/wav", "audio/wave", "audio/x-wav"),
+    deepgram_encoding="linear16",
+    deepgram_container="wav",
+    rime_audio_format="wav",
+)
+
+MP3 = AudioFormat(
+    name="mp3",
+    extension="mp3",
+    mimetype="audio/mpeg",
+    aliases=("audio/mpeg", "audio/mp3"),
+    deepgram_encoding="mp3",
+    deepgram_container=None,
+    rime_audio_format="mp3",
+)
+
+OPUS = AudioFormat(
+    name="opus",
+    extension="ogg",
+    mimetype="audio/ogg",
+    aliases=("audio/ogg", "audio/opus"),
+    deepgram_encoding="opus",
+    deepgram_container="ogg",
+    rime_audio_format=None,
+)
+
+AUDIO_FORMATS: Dict[str, AudioFormat] = {
+    audio_format.name: audio_format for audio_format in (WAV, MP3, OPUS)
+}
+
+# Lookup by file extension, for serving files
+AUDIO_FORMATS_BY_EXTENSION: Dict[str, AudioFormat] = {
+    audio_format.extension: audio_format for audio_format in AUDIO_FORMATS.values()
+}
+
+# "wav", "mp3" or "opus"
+VO_FORMAT = os.environ.get("VO_FORMAT", "wav")
+
+DEFAULT_AUDIO_FORMAT = AUDIO_FORMATS.get(VO_FORMAT, WAV)
+
+
+def negotiate_audio_format(
+    requested: Optional[str], accept: Iterable[Tuple[str, float]] = ()
+) -> AudioFormat:
+    """
+    Choose the voice output format for a request.
+
+    Args:
+        requested (str, optional): The `format` query parameter, which takes
+            precedence when given.
+        accept (Iterable[Tuple[str, float]]): The Accept header's media types
+            and qualities, best first. Non-audio types and wildcards are
+            ignored, since they describe the response body rather than the
+            voice output.
+
+    Returns:
+        AudioFormat: The chosen format.
+
+    Raises:
+        ValueError: If the requested format is not supported.
+    """
+    if requested:
+        audio_format = AUDIO_FORMATS.get(requested.lower())
+        if audio_format is None:
+            raise ValueError(
+                f"Unsupported audio format {requested!r}, expected one of "
+                + ", ".join(AUDIO_FORMATS)
+            )
+        return audio_format
+
+    for mimetype, quality in accept:
+        if quality <= 0:
+            continue
+        for audio_format in AUDIO_FORMATS.values():
+            if mimetype.lower() in audio_format.aliases:
+                return audio_format
+    return DEFAULT_AUDIO_FORMAT
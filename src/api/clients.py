@@ -0,0 +1,147 @@
+"""
+Shared, pooled clients for the OpenRouter, Deepgram and Rime APIs.
+
+A single keep-alive connection pool is opened when the app starts serving and
+closed when it stops, so provider calls on the hot path reuse warm TCP/TLS
+connections instead of paying a fresh handshake each time.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+from typing import Optional
+
+import httpx
+from deepgram import DeepgramClient
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+load_dotenv()
+
+OPENROUTER_BASE_URL = os.environ.get(
+    "OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"
+)
+DEEPGRAM_BASE_URL = os.environ.get("DEEPGRAM_BASE_URL", "https://api.deepgram.com/v1")
+RIME_BASE_URL = os.environ.get("RIME_BASE_URL", "https://users.rime.ai/v1")
+
+# HTTP/2 is only used when requested and the h2 package is installed.
+PROVIDER_HTTP2 = os.environ.get("PROVIDER_HTTP2", "false").lower() == "true"
+PROVIDER_MAX_CONNECTIONS = int(os.environ.get("PROVIDER_MAX_CONNECTIONS", "100"))
+PROVIDER_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.environ.get("PROVIDER_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+PROVIDER_KEEPALIVE_EXPIRY = float(os.environ.get("PROVIDER_KEEPALIVE_EXPIRY", "60"))
+PROVIDER_CONNECT_TIMEOUT = float(os.environ.get("PROVIDER_CONNECT_TIMEOUT", "5"))
+PROVIDER_TIMEOUT = float(os.environ.get("PROVIDER_TIMEOUT", "60"))
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderClients:
+    """
+    Holds the application-scoped provider clients.
+
+    The clients are opened by start() from the app's before_serving hook and
+    closed by aclose() from after_serving. They are also created lazily on
+    first use, so code running outside the app (scripts, the shell) still works.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        # A custom transport routes every provider call elsewhere, e.g. to
+        # in-process stand-ins when benchmarking
+        self.transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+        self._openai: Optional[AsyncOpenAI] = None
+        self._deepgram: Optional[DeepgramClient] = None
+
+    async def start(self) -> None:
+        """Open the connection pool and the clients built on top of it."""
+        if self._http is None or self._http.is_closed:
+            self._connect()
+
+    def _connect(self) -> None:
+        http2 = PROVIDER_HTTP2 and importlib.util.find_spec("h2") is not None
+        self._http = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=PROVIDER_MAX_CONNECTIONS,
+                max_keepalive_connections=PROVIDER_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=PROVIDER_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(PROVIDER_TIMEOUT, connect=PROVIDER_CONNECT_TIMEOUT),
+            transport=self.transport,
+        )
+        self._openai = AsyncOpenAI(
+            base_url=OPENROUTER_BASE_URL,
+            api_key=os.environ.get("OPENROUTER_API_KEY"),
+            default_headers={
+                "HTTP-Referer": "https://tryleetpro.com",
+                "X-Title": "LeetPro - Practice Interviews Online",
+            },
+            http_client=self._http,
+        )
+
+    async def warm(self, connections: int = 1) -> int:
+        """
+        Open pooled connections to every provider ahead of real requests.
+
+        Each request to a provider's base URL pays the DNS, TCP and TLS setup
+        and leaves a keep-alive connection in the pool; its response is
+        ignored. Concurrent requests to a host open separate connections.
+
+        Args:
+            connections (int): Connections to open to each provider.
+
+        Returns:
+            int: The number of requests that failed to connect.
+        """
+        urls = [
+            url
+            for url in (OPENROUTER_BASE_URL, DEEPGRAM_BASE_URL, RIME_BASE_URL)
+            for _ in range(connections)
+        ]
+        results = await asyncio.gather(
+            *(self.http.head(url) for url in urls), return_exceptions=True
+        )
+        failures = 0
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                failures += 1
+                logger.debug("Could not warm a connection to %s: %r", url, result)
+        return failures
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """The pooled HTTP client used for Deepgram and Rime requests."""
+        if self._http is None or self._http.is_closed:
+            self._connect()
+        return self._http
+
+    @property
+    def openai(self) -> AsyncOpenAI:
+        """The OpenRouter client, sharing the pooled HTTP client."""
+        if self._http is None or self._http.is_closed:
+            self._connect()
+        return self._openai
+
+    @property
+    def deepgram(self) -> DeepgramClient:
+        """
+        The Deepgram SDK client, used for live (WebSocket) transcription.
+
+        REST calls to Deepgram go through the pooled HTTP client instead.
+        """
+        if self._deepgram is None:
+            self._deepgram = DeepgramClient(os.environ.get("DEEPGRAM_API_KEY"))
+        return self._deepgram
+
+    async def aclose(self) -> None:
+        """Close the connection pool."""
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = None
+        self._openai = None
+
+
+provider_clients = ProviderClients()
@@ -0,0 +1,157 @@
+"""
+JSON encoding and decoding of the api.models types.
+
+Uses orjson when it is installed, which serializes dataclasses and datetimes
+natively, and the stdlib json module otherwise. Models are converted to and
+from plain dicts field by field in a single pass, so decoding returns real
+Message and AnalysisScore objects rather than nested dicts.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional, Union
+
+from api.models import (
+    AnalysisScore,
+    Conversation,
+    ConversationAnalysis,
+    ConversationOverallAnalysis,
+    Message,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ANALYSIS_FIELDS = ConversationAnalysis.__dataclass_fields__.keys()
+
+
+def _datetime_to_str(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _datetime_from_str(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def message_to_dict(message: Message) -> Dict[str, Any]:
+    return {
+        "role": message.role,
+        "content": message.content,
+        "timestamp": _datetime_to_str(message.timestamp),
+        "id": message.id,
+    }
+
+
+def message_from_dict(data: Dict[str, Any]) -> Message:
+    return Message(
+        role=data["role"],
+        content=data["content"],
+        timestamp=_datetime_from_str(data.get("timestamp")),
+        id=data.get("id"),
+    )
+
+
+def conversation_to_dict(conversation: Conversation) -> Dict[str, Any]:
+    return {"messages": [message_to_dict(msg) for msg in conversation.messages]}
+
+
+def conversation_from_dict(data: Dict[str, Any]) -> Conversation:
+    return Conversation(messages=[message_from_dict(msg) for msg in data["messages"]])
+
+
+def score_to_dict(score: AnalysisScore) -> Dict[str, Any]:
+    return {
+        "name": score.name,
+        "human_name": score.human_name,
+        "description": score.description,
+        "score": score.score,
+        "feedback": score.feedback,
+    }
+
+
+def analysis_to_dict(analysis: ConversationAnalysis) -> Dict[str, Any]:
+    data = {}
+    for field in ANALYSIS_FIELDS:
+        score = getattr(analysis, field)
+        data[field] = score_to_dict(score) if score is not None else None
+    return data
+
+
+def analysis_from_dict(data: Dict[str, Any]) -> ConversationAnalysis:
+    return ConversationAnalysis(
+        **{
+            field: AnalysisScore(**score) if score else None
+            for field, score in data.items()
+            if field in ANALYSIS_FIELDS
+        }
+    )
+
+
+def overall_analysis_to_dict(analysis: ConversationOverallAnalysis) -> Dict[str, Any]:
+    return {
+        "conversation": conversation_to_dict(analysis.conversation),
+        "analysis": (
+            analysis_to_dict(analysis.analysis)
+            if analysis.analysis is not None
+            else None
+        ),
+        "overall_score": analysis.overall_score,
+        "overall_feedback": analysis.overall_feedback,
+    }
+
+
+def overall_analysis_from_dict(data: Dict[str, Any]) -> ConversationOverallAnalysis:
+    """Build a ConversationOverallAnalysis, with nested models, from its JSON form."""
+    return ConversationOverallAnalysis(
+        conversation=conversation_from_dict(data["conversation"]),
+        analysis=analysis_from_dict(data["analysis"]) if data.get("analysis") else None,
+        overall_score=data.get("overall_score"),
+        overall_feedback=data.get("overall_feedback"),
+    )
+
+
+_TO_DICT = {
+    Message: message_to_dict,
+    Conversation: conversation_to_dict,
+    AnalysisScore: score_to_dict,
+    ConversationAnalysis: analysis_to_dict,
+    ConversationOverallAnalysis: overall_analysis_to_dict,
+}
+
+
+def _default(obj: Any) -> Any:
+    to_dict = _TO_DICT.get(type(obj))
+    if to_dict is not None:
+        return to_dict(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode(obj: Any) -> bytes:
+    """
+    Encode a value, which may contain api.models objects, as JSON.
+
+    orjson serializes the dataclasses itself; the stdlib encoder falls back
+    to the field-by-field converters above.
+
+    Returns:
+        bytes: UTF-8 encoded JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, ensure_ascii=False).encode()
+
+
+def decode(data: Union[bytes, str]) -> Any:
+    """Decode JSON into plain Python values."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def decode_overall_analysis(data: Union[bytes, str]) -> ConversationOverallAnalysis:
+    """Decode a stored conversation and its analysis into model objects."""
+    return overall_analysis_from_dict(decode(data))
@@ -0,0 +1,230 @@
+"""
+Context-window compaction for long interviews.
+
+Before a chat completion, ContextManager.compact keeps the system prompt and
+the most recent turns verbatim and replaces older turns with a running
+summary, so the prompt stays within CONTEXT_TOKEN_BUDGET however long the
+interview runs. Summaries are refreshed in the background and reused across
+turns rather than recomputed on every request.
+
+Summaries are only kept for conversations with a key (a chat session ID).
+Conversations sent without one can't be told apart from another candidate's
+interview with the same opening, so their older turns are dropped instead.
+"""
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from api.admission import BATCH, traffic_class
+from api.txt2txt import get_txt2txt_completion
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _encoding = None
+
+# Prompt budget in tokens. Set to 0 to disable compaction.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "12000"))
+
+# Number of most recent messages that are always sent verbatim.
+CONTEXT_KEEP_RECENT = int(os.environ.get("CONTEXT_KEEP_RECENT", "6"))
+
+CONTEXT_SUMMARY_MODEL = os.environ.get(
+    "CONTEXT_SUMMARY_MODEL", "openai/gpt-4o-mini-2024-07-18"
+)
+
+# Number of conversations whose running summaries are kept.
+CONTEXT_MAX_SUMMARIES = int(os.environ.get("CONTEXT_MAX_SUMMARIES", "1000"))
+
+# Tokens added per message for the role and message framing.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You maintain a running summary of a product management mock interview between an interviewer (assistant) and a candidate (user). Keep the question being discussed, the candidate's key answers, assumptions and decisions, and any open threads. Be concise and factual.",
+}
+
+
+@lru_cache(maxsize=16384)
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in a piece of text.
+
+    Uses tiktoken when it is installed and a 4-characters-per-token estimate
+    otherwise. Results are cached, so each message is only counted once
+    across turns.
+    """
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass
+class SummaryState:
+    summary: str = ""
+    # Number of non-system messages the summary covers
+    covered: int = 0
+    refresh: Optional[asyncio.Task] = None
+
+
+@dataclass
+class ContextStats:
+    turns: int = 0
+    compacted_turns: int = 0
+    tokens_in: int = 0
+    tokens_sent: int = 0
+    last_tokens_saved: int = 0
+    summary_refreshes: int = 0
+    summary_failures: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_sent
+
+
+class ContextManager:
+    """Compacts conversations into a token budget using running summaries."""
+
+    def __init__(
+        self,
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        keep_recent: int = CONTEXT_KEEP_RECENT,
+        summary_model: str = CONTEXT_SUMMARY_MODEL,
+        max_summaries: int = CONTEXT_MAX_SUMMARIES,
+    ):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.summary_model = summary_model
+        self.max_summaries = max_summaries
+        self.stats = ContextStats()
+        self._states: "OrderedDict[str, SummaryState]" = OrderedDict()
+
+    def _state(self, key: str) -> SummaryState:
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = SummaryState()
+            while len(self._states) > self.max_summaries:
+                self._states.popitem(last=False)
+        self._states.move_to_end(key)
+        return state
+
+    def compact(
+        self, messages: List[Dict[str, str]], key: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Fit a conversation into the token budget.
+
+        Args:
+            messages (List[Dict[str, str]]): The full conversation.
+            key (str, optional): Identifies the conversation (e.g. a session ID)
+                so its running summary can be reused across turns. Without
+                one, older turns are dropped rather than summarized.
+
+        Returns:
+            List[Dict[str, str]]: The messages to send to the model.
+        """
+        tokens = [count_message_tokens(message) for message in messages]
+        total = sum(tokens)
+        self.stats.turns += 1
+        self.stats.tokens_in += total
+
+        if not self.budget or total <= self.budget:
+            self.stats.tokens_sent += total
+            self.stats.last_tokens_saved = 0
+            return messages
+
+        head_length = 0
+        while head_length < len(messages) and messages[head_length]["role"] == "system":
+            head_length += 1
+        head, body = messages[:head_length], messages[head_length:]
+        body_tokens = tokens[head_length:]
+
+        state = self._state(key) if key is not None else None
+        covered = 0
+        summary_messages = []
+        if state is not None:
+            if state.covered > len(body):
+                # The history was rewritten; the summary no longer applies
+                state.summary, state.covered = "", 0
+            covered = state.covered
+        if state is not None and state.summary:
+            summary_messages.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier part of the interview:\n{state.summary}",
+                }
+            )
+        available = self.budget - sum(tokens[:head_length]) - sum(
+            count_message_tokens(message) for message in summary_messages
+        )
+
+        # Keep as many recent messages verbatim as fit, but at least keep_recent
+        start = len(body)
+        used = 0
+        while start > covered:
+            next_tokens = body_tokens[start - 1]
+            if used + next_tokens > available and len(body) - start >= self.keep_recent:
+                break
+            used += next_tokens
+            start -= 1
+
+        # Fold everything older than the recent window into the summary
+        if (
+            state is not None
+            and start > covered
+            and (state.refresh is None or state.refresh.done())
+        ):
+            state.refresh = asyncio.create_task(
+                self._refresh(state, body[state.covered : start], start)
+            )
+
+        compacted = head + summary_messages + body[start:]
+        sent = sum(count_message_tokens(message) for message in compacted)
+        self.stats.compacted_turns += 1
+        self.stats.tokens_sent += sent
+        self.stats.last_tokens_saved = total - sent
+        return compacted
+
+    async def _refresh(
+        self, state: SummaryState, messages: List[Dict[str, str]], covered: int
+    ) -> None:
+        transcript = "\n".join(
+            f"{message['role'].capitalize()}: {message['content']}"
+            for message in messages
+        )
+        prompt = [
+            SUMMARY_SYSTEM_MESSAGE,
+            {
+                "role": "user",
+                "content": f"Current summary:\n{state.summary or '(none)'}\n\nNew turns:\n{transcript}\n\nReply with the updated summary only.",
+            },
+        ]
+        # Runs in its own task, so this doesn't affect the request
+        traffic_class.set(BATCH)
+        try:
+            summary = await get_txt2txt_completion(prompt, model=self.summary_model)
+        except Exception as e:
+            logger.warning("Error refreshing context summary: %r", e)
+            self.stats.summary_failures += 1
+            return
+
+        if summary:
+            state.summary = summary
+            state.covered = covered
+            self.stats.summary_refreshes += 1
+
+
+context_manager = ContextManager()
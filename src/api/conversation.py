@@ -3,25 +3,47 @@ Conversation-related operations for the LeetPro application.
 """
 
 import dataclasses
-from datetime import datetime
-import json
-import aiofiles
+import os
+from typing import Optional
+
+from api.metrics import registry
 from api.models import Conversation, ConversationOverallAnalysis
+from api.storage import conversation_store
 from api.utils import generate_uuid
-from api.txt2txt import analyze_conversation
+from api.txt2txt import (
+    RUBRICS,
+    AnalysisProgress,
+    analysis_cache_key,
+    analyze_conversation,
+)
+
+# Reuse the analysis of an identical transcript instead of grading it again
+ANALYSIS_CACHE_ENABLED = (
+    os.environ.get("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+)
+
+analysis_cache_total = registry.counter(
+    "leetpro_analysis_cache_total",
+    "Analysis cache lookups.",
+    ["outcome"],
+)
 
 
-class EnhancedJSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if dataclasses.is_dataclass(o):
-            return dataclasses.asdict(o)
-        if isinstance(o, datetime):
-            return o.isoformat()
-        return super().default(o)
+def is_complete_analysis(overall_analysis: ConversationOverallAnalysis) -> bool:
+    """Whether an analysis graded every rubric criterion and has overall feedback."""
+    analysis = overall_analysis.analysis
+    if analysis is None or not (overall_analysis.overall_feedback or "").strip():
+        return False
+    for criterion in RUBRICS:
+        score = getattr(analysis, criterion, None)
+        if score is None or not score.feedback.strip():
+            return False
+    return True
+
 
 async def save_conversation(conversation: Conversation) -> str:
     """
-    Save a conversation to a file.
+    Save a conversation to the conversation store.
 
     Args:
         conversation (Conversation): The conversation to save.
@@ -30,10 +52,7 @@ async def save_conversation(conversation: Conversation) -> str:
         str: The generated conversation ID.
     """
     conversation_id = generate_uuid()
-    async with aiofiles.open(f"public/analyze/{conversation_id}.json", "w") as f:
-        await f.write(
-            json.dumps({"conversation": conversation}, cls=EnhancedJSONEncoder)
-        )
+    await conversation_store.save_conversation(conversation_id, conversation)
     return conversation_id
 
 
@@ -41,29 +60,53 @@ async def get_conversation_analysis(
     conversation_id: str,
 ) -> ConversationOverallAnalysis | None:
     """
-    Retrieve and analyze a saved conversation.
+    Retrieve a saved conversation and its analysis, if it has been analyzed.
 
     Args:
-        conversation_id (str): The ID of the conversation to analyze.
+        conversation_id (str): The ID of the conversation.
 
     Returns:
-        ConversationOverallAnalysis: The analysis results for the conversation.
+        ConversationOverallAnalysis: The saved conversation, with analysis set
+        to None until it has been analyzed, or None if it does not exist.
     """
-    try:
-        async with aiofiles.open(f"public/analyze/{conversation_id}.json", "r") as f:
-            data = await f.read()
-            json_data = json.loads(data)
-    except FileNotFoundError:
-        return None
+    return await conversation_store.load(conversation_id)
 
-    if not json_data.get("analysis"):
-        analysis = await analyze_conversation(json_data["conversation"])
 
-        json_data["analysis"] = analysis.analysis
-        json_data["overall_score"] = analysis.overall_score
-        json_data["overall_feedback"] = analysis.overall_feedback
+async def run_conversation_analysis(
+    conversation_id: str,
+    progress: Optional[AnalysisProgress] = None,
+) -> ConversationOverallAnalysis | None:
+    """
+    Analyze a saved conversation and store the results with it.
+
+    Conversations that already have an analysis are returned as they are,
+    and conversations whose transcript was analyzed before (with the same
+    rubrics and models) reuse that analysis.
+
+    Args:
+        conversation_id (str): The ID of the conversation to analyze.
+        progress (AnalysisProgress, optional): Called as the analysis progresses.
+
+    Returns:
+        ConversationOverallAnalysis: The analysis results for the conversation.
+    """
+    overall_analysis = await conversation_store.load(conversation_id)
+    if overall_analysis is None or overall_analysis.analysis is not None:
+        return overall_analysis
 
-        async with aiofiles.open(f"public/analyze/{conversation_id}.json", "wt") as f:
-            await f.write(json.dumps(json_data, cls=EnhancedJSONEncoder))
+    conversation = overall_analysis.conversation
+    cached = None
+    if ANALYSIS_CACHE_ENABLED:
+        cache_key = analysis_cache_key(conversation)
+        cached = await conversation_store.load_cached_analysis(cache_key)
+        analysis_cache_total.inc(outcome="hit" if cached is not None else "miss")
 
-    return ConversationOverallAnalysis(**json_data)
+    if cached is not None:
+        overall_analysis = dataclasses.replace(cached, conversation=conversation)
+    else:
+        overall_analysis = await analyze_conversation(conversation, progress)
+        # A degraded result would otherwise be served for every later save
+        if ANALYSIS_CACHE_ENABLED and is_complete_analysis(overall_analysis):
+            await conversation_store.save_cached_analysis(cache_key, overall_analysis)
+    await conversation_store.save_analysis(conversation_id, overall_analysis)
+    return overall_analysis
@@ -0,0 +1,80 @@
+"""
+On-disk layout of the files under public/.
+
+Files are named after their uuid7 ID and stored in a subdirectory named
+after the ID's first SHARD_PREFIX_LENGTH hex digits, e.g.
+public/vo/06ad3f/06ad3fe4-....wav. uuid7 IDs start with their creation time,
+so each shard covers a few hours of files, stays small, and shards sort by
+age. Files written before sharding sit directly in the directory and are
+still found.
+"""
+
+import os
+from typing import Iterator, Optional
+
+from werkzeug.security import safe_join
+
+VO_DIR = "public/vo"
+SPEECH_IN_DIR = "public/speech_in"
+
+# 6 hex digits of the uuid7 millisecond timestamp make a shard of ~4.7 hours.
+SHARD_PREFIX_LENGTH = 6
+
+
+def shard_name(file_name: str) -> str:
+    return file_name[:SHARD_PREFIX_LENGTH]
+
+
+def sharded_path(directory: str, file_name: str) -> Optional[str]:
+    """Return the path of a file in the sharded layout, or None if the name is unsafe."""
+    return safe_join(directory, shard_name(file_name), file_name)
+
+
+def legacy_path(directory: str, file_name: str) -> Optional[str]:
+    """Return the path of a file in the old flat layout, or None if the name is unsafe."""
+    return safe_join(directory, file_name)
+
+
+def write_path(directory: str, file_name: str) -> str:
+    """
+    Return the path to write a new file to, creating its shard if needed.
+
+    Raises:
+        ValueError: If the file name is unsafe.
+    """
+    path = sharded_path(directory, file_name)
+    if path is None:
+        raise ValueError(f"Invalid file name {file_name!r}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def resolve_path(directory: str, file_name: str) -> Optional[str]:
+    """Find a file in the sharded or the old flat layout."""
+    for path in (
+        sharded_path(directory, file_name),
+        legacy_path(directory, file_name),
+    ):
+        if path is not None and os.path.isfile(path):
+            return path
+    return None
+
+
+def iter_files(directory: str) -> Iterator[os.DirEntry]:
+    """Yield every file in a directory, in both layouts."""
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            try:
+                shard = list(os.scandir(entry.path))
+            except FileNotFoundError:
+                # Removed by the retention sweeper in the meantime
+                continue
+            for file_entry in shard:
+                if file_entry.is_file(follow_symlinks=False):
+                    yield file_entry
+        elif entry.is_file(follow_symlinks=False):
+            yield entry
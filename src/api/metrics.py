@@ -0,0 +1,326 @@
+"""
+Instrumentation of the request pipeline.
+
+Each pipeline stage (upload parsing, STT, LLM, TTS, file and store I/O) is
+timed into a histogram, and every provider call is timed and counted along
+with the tokens and bytes it moved. The /metrics route renders all of it in
+the Prometheus text format. The metrics are kept in process memory, so under
+several workers (see api.serve) each scrape only reports the worker that
+answered it.
+
+With TRACING_ENABLED, each request also gets a trace ID, taken from an
+incoming X-Trace-Id or traceparent header or generated, and returned in
+X-Trace-Id. Every timed stage is then logged as a span carrying it, so a
+client that passes the ID along from /transcribe to /chat and /analysis can
+follow a whole interview turn through the logs.
+"""
+
+import contextvars
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from api.utils import generate_uuid
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)  # fmt: skip
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+trace_id: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar(
+    "trace_id", default=None
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    @abstractmethod
+    def samples(self) -> Iterable[str]:
+        """Render the metric's sample lines."""
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: the count of each bucket (not cumulative), the sum
+        # and the total count
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, totals = state
+        counts[bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return int(state[1][1]) if state else 0
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterable[str]:
+        names = self.labels + ("le",)
+        for key, (counts, (total, count)) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {int(count)}"
+
+
+class Gauge(Metric):
+    """A gauge whose values are read from a callback when rendering."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+    ):
+        super().__init__(name, description, labels)
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self.collect():
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Registry:
+    """Holds the app's metrics and renders them for Prometheus."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _add(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, description: str, labels: Sequence[str] = ()
+    ) -> Counter:
+        return self._add(Counter(name, description, labels))
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, description, labels, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+    ) -> Gauge:
+        """Register a gauge read from collect(), e.g. a component's stats()."""
+        return self._add(Gauge(name, description, labels, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                logger.exception("Error collecting metric %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "leetpro_stage_seconds",
+    "Time spent in each stage of the request pipeline.",
+    ["stage"],
+)
+provider_request_seconds = registry.histogram(
+    "leetpro_provider_request_seconds",
+    "Duration of calls to STT, LLM and TTS providers.",
+    ["provider", "operation"],
+)
+provider_requests_total = registry.counter(
+    "leetpro_provider_requests_total",
+    "Calls to providers by outcome.",
+    ["provider", "operation", "outcome"],
+)
+provider_tokens_total = registry.counter(
+    "leetpro_provider_tokens_total",
+    "Prompt and completion tokens reported by LLM providers.",
+    ["provider", "kind"],
+)
+provider_bytes_total = registry.counter(
+    "leetpro_provider_bytes_total",
+    "Audio bytes sent to and received from providers.",
+    ["provider", "direction"],
+)
+
+
+def start_trace(headers: Dict[str, str]) -> Optional[str]:
+    """
+    Set the trace ID of the current request, if tracing is enabled.
+
+    Args:
+        headers (Dict[str, str]): The request headers. An X-Trace-Id, or the
+            trace ID of a W3C traceparent, is continued; otherwise a new ID
+            is generated.
+
+    Returns:
+        str: The trace ID, or None when tracing is disabled.
+    """
+    if not TRACING_ENABLED:
+        return None
+    value = headers.get("X-Trace-Id")
+    if not value:
+        parts = headers.get("traceparent", "").split("-")
+        value = parts[1] if len(parts) == 4 else generate_uuid()
+    trace_id.set(value)
+    return value
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record the duration of a stage, logging it as a span when tracing."""
+    stage_seconds.observe(seconds, stage=stage)
+    current = trace_id.get()
+    if current is not None:
+        logger.info(
+            "span trace_id=%s stage=%s duration_ms=%.1f", current, stage, seconds * 1000
+        )
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed block as a stage of the request pipeline."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def record_provider_call(
+    provider: str, operation: str, seconds: float, outcome: str = "ok"
+) -> None:
+    """Record one call to a provider, e.g. a model or a TTS service."""
+    provider_request_seconds.observe(seconds, provider=provider, operation=operation)
+    provider_requests_total.inc(provider=provider, operation=operation, outcome=outcome)
+
+
+def stats_samples(stats: Dict[str, Any]) -> Iterator[Tuple[LabelValues, float]]:
+    """
+    Turn a component's stats() into gauge samples.
+
+    Flat stats give one label (the stat); stats keyed by e.g. provider give
+    two (the key and the stat).
+    """
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            for stat, stat_value in value.items():
+                yield (key, stat), float(stat_value)
+        else:
+            yield (key,), float(value)
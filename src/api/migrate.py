@@ -0,0 +1,68 @@
+"""
+Import conversations saved as JSON files into the SQLite conversation store.
+
+Usage:
+    python -m api.migrate [--source public/analyze] [--database public/leetpro.db]
+"""
+
+import argparse
+import asyncio
+
+from api.layout import iter_files
+from api.storage import (
+    ANALYZE_DIR,
+    SQLITE_PATH,
+    FileConversationStore,
+    SQLiteConversationStore,
+)
+
+
+async def migrate(source: str, database: str) -> int:
+    """
+    Copy every JSON conversation in source into the SQLite database.
+
+    Conversations that are already in the database are replaced, so the
+    migration can be re-run safely.
+
+    Returns:
+        int: The number of conversations imported.
+    """
+    file_store = FileConversationStore(source)
+    sqlite_store = SQLiteConversationStore(database)
+    imported = 0
+    try:
+        for name in sorted(entry.name for entry in iter_files(source)):
+            if not name.endswith(".json"):
+                continue
+            conversation_id = name[: -len(".json")]
+            try:
+                overall_analysis = await file_store.load(conversation_id)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Skipping unreadable conversation {conversation_id}", e)
+                continue
+            if overall_analysis is None:
+                continue
+
+            await sqlite_store.save_conversation(
+                conversation_id, overall_analysis.conversation
+            )
+            if overall_analysis.analysis is not None:
+                await sqlite_store.save_analysis(conversation_id, overall_analysis)
+            imported += 1
+    finally:
+        await sqlite_store.close()
+    return imported
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--source", default=ANALYZE_DIR)
+    parser.add_argument("--database", default=SQLITE_PATH)
+    args = parser.parse_args()
+
+    imported = asyncio.run(migrate(args.source, args.database))
+    print(f"Imported {imported} conversations into {args.database}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Latency-aware routing of completions across OpenRouter models.
+
+Each use case has a candidate list of models in preference order. The router
+tracks rolling latency and error rate per model and operation (a chat
+completion, the first token of a streamed one and an analysis take very
+different times), skips models whose circuit breaker is open or whose recent
+error rate is too high, and falls back to
+the next candidate when a model fails or times out. For the interactive chat
+path it can also hedge: if the first model hasn't answered within its p95
+latency, the next one is started as well and the first answer wins.
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from api.metrics import record_provider_call
+from api.resilience import (
+    CircuitBreaker,
+    FailoverError,
+    LatencyWindow,
+    failover,
+    guarded_call,
+)
+
+LLM_CHAT_MODELS = os.environ.get(
+    "LLM_CHAT_MODELS", "openai/gpt-4o-2024-08-06,openai/gpt-4o-mini-2024-07-18"
+)
+LLM_ANALYSIS_MODELS = os.environ.get(
+    "LLM_ANALYSIS_MODELS", "cohere/command-r-plus-08-2024,openai/gpt-4o-2024-08-06"
+)
+LLM_CHAT_TIMEOUT_SECONDS = float(os.environ.get("LLM_CHAT_TIMEOUT_SECONDS", "20"))
+LLM_ANALYSIS_TIMEOUT_SECONDS = float(
+    os.environ.get("LLM_ANALYSIS_TIMEOUT_SECONDS", "60")
+)
+# Time allowed for the first token of a streamed completion
+LLM_FIRST_TOKEN_TIMEOUT_SECONDS = float(
+    os.environ.get("LLM_FIRST_TOKEN_TIMEOUT_SECONDS", "10")
+)
+# Time allowed between the tokens of a streamed completion after the first
+LLM_TOKEN_TIMEOUT_SECONDS = float(os.environ.get("LLM_TOKEN_TIMEOUT_SECONDS", "10"))
+
+LLM_CHAT_HEDGE = os.environ.get("LLM_CHAT_HEDGE", "false").lower() == "true"
+# Hedge delay used until a model has LLM_HEDGE_MIN_SAMPLES latencies
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(
+    os.environ.get("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "5")
+)
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Models failing more often than this are tried after the healthy ones
+LLM_MAX_ERROR_RATE = float(os.environ.get("LLM_MAX_ERROR_RATE", "0.5"))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+
+T = TypeVar("T")
+
+
+class LLMError(Exception):
+    """Raised when no candidate model produced a completion."""
+
+
+class ModelStats:
+    """Rolling health of a single model."""
+
+    def __init__(self, model: str):
+        self.model = model
+        # Keyed by operation, e.g. "chat" or "chat_first_token"
+        self.latencies: Dict[str, LatencyWindow] = defaultdict(LatencyWindow)
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    def hedge_delay(self, operation: str) -> float:
+        latencies = self.latencies[operation]
+        if len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY_SECONDS
+        return latencies.percentile(0.95)
+
+
+def parse_models(models: str) -> List[str]:
+    return [model.strip() for model in models.split(",") if model.strip()]
+
+
+class ModelRouter:
+    """Routes the completions of one use case across its candidate models."""
+
+    # Stats are shared between routers, since a model's health doesn't
+    # depend on the use case; its latencies are kept per operation
+    _stats: Dict[str, ModelStats] = {}
+
+    def __init__(
+        self, name: str, models: List[str], timeout: float, hedge: bool = False
+    ):
+        self.name = name
+        self.models = models
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedges = 0
+
+    @classmethod
+    def stats_for(cls, model: str) -> ModelStats:
+        stats = cls._stats.get(model)
+        if stats is None:
+            stats = cls._stats[model] = ModelStats(model)
+        return stats
+
+    def candidates(
+        self, operation: str, models: Optional[List[str]] = None
+    ) -> List[ModelStats]:
+        """
+        Order the candidate models for a request.
+
+        Models with an open breaker are left out, and models with a high
+        recent error rate for the operation go after the healthy ones;
+        otherwise the configured preference order is kept.
+        """
+        stats = [self.stats_for(model) for model in models or self.models]
+        available = [model for model in stats if model.breaker.state != "open"]
+        return sorted(
+            available,
+            key=lambda model: (
+                model.latencies[operation].error_rate > LLM_MAX_ERROR_RATE
+            ),
+        )
+
+    async def run(
+        self,
+        call: Callable[[str], Awaitable[T]],
+        models: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+        operation: Optional[str] = None,
+    ) -> T:
+        """
+        Run a call against the candidate models until one succeeds.
+
+        Args:
+            call (Callable[[str], Awaitable[T]]): Makes the request for a model ID.
+            models (List[str], optional): Overrides the candidate models.
+            timeout (float, optional): Overrides the per-model timeout.
+            operation (str, optional): Names the call in the provider metrics.
+                Default is the router's name.
+
+        Returns:
+            T: The result of the first successful call.
+
+        Raises:
+            LLMError: If every candidate failed.
+        """
+        timeout = timeout or self.timeout
+        operation = operation or self.name
+
+        def attempt(model: ModelStats) -> Awaitable[T]:
+            return guarded_call(
+                lambda: call(model.model),
+                timeout,
+                model,
+                model.latencies[operation],
+                model.model,
+                operation,
+            )
+
+        def on_hedge() -> None:
+            self.hedges += 1
+
+        try:
+            _, result = await failover(
+                self.candidates(operation, models),
+                attempt,
+                hedge_delay=(
+                    (lambda model: model.hedge_delay(operation)) if self.hedge else None
+                ),
+                on_hedge=on_hedge,
+            )
+        except FailoverError as e:
+            if not e.failures:
+                raise LLMError("No model available") from None
+            raise LLMError(
+                "All models failed: "
+                + "; ".join(f"{model.model}: {error!r}" for model, error in e.failures)
+            ) from None
+        return result
+
+    async def stream(
+        self,
+        open_stream: Callable[[str], AsyncIterator[str]],
+        models: Optional[List[str]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a completion, falling back to the next model until the first token.
+
+        A model whose stream ends without any token has failed, like one that
+        raises. Once a model has produced its first token the stream is
+        committed to it, since the tokens already sent can't be taken back.
+
+        Raises:
+            LLMError: If no model produced a first token, or the committed
+                model stalled for LLM_TOKEN_TIMEOUT_SECONDS between tokens.
+        """
+
+        async def first_token(model: str):
+            tokens = open_stream(model).__aiter__()
+            try:
+                return model, tokens, await tokens.__anext__()
+            except StopAsyncIteration:
+                raise LLMError("Empty completion") from None
+            except BaseException:
+                await tokens.aclose()
+                raise
+
+        operation = f"{self.name}_first_token"
+        model, tokens, token = await self.run(
+            first_token,
+            models=models,
+            timeout=LLM_FIRST_TOKEN_TIMEOUT_SECONDS,
+            operation=operation,
+        )
+        yield token
+        try:
+            while True:
+                start = time.monotonic()
+                try:
+                    token = await asyncio.wait_for(
+                        tokens.__anext__(), LLM_TOKEN_TIMEOUT_SECONDS
+                    )
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    stats = self.stats_for(model)
+                    stats.failures += 1
+                    stats.timeouts += 1
+                    elapsed = time.monotonic() - start
+                    # Counted with the first tokens, which decide where the
+                    # next streams go
+                    stats.latencies[operation].record(elapsed, ok=False)
+                    stats.breaker.record_failure()
+                    record_provider_call(
+                        model, f"{self.name}_stream", elapsed, "timeout"
+                    )
+                    raise LLMError(f"{model}: stream stalled") from None
+                yield token
+        finally:
+            await tokens.aclose()
+
+    @classmethod
+    def stats(cls) -> Dict[str, Dict[str, float]]:
+        stats = {}
+        for model in cls._stats.values():
+            model_stats = {
+                "requests": model.requests,
+                "failures": model.failures,
+                "timeouts": model.timeouts,
+                "breaker_open": model.breaker.state == "open",
+            }
+            for operation, latencies in model.latencies.items():
+                model_stats.update(
+                    {
+                        f"{operation}_p50_seconds": latencies.percentile(0.5) or 0.0,
+                        f"{operation}_p95_seconds": latencies.percentile(0.95) or 0.0,
+                        f"{operation}_error_rate": latencies.error_rate,
+                    }
+                )
+            stats[model.model] = model_stats
+        return stats
+
+
+chat_router = ModelRouter(
+    "chat",
+    parse_models(LLM_CHAT_MODELS),
+    LLM_CHAT_TIMEOUT_SECONDS,
+    hedge=LLM_CHAT_HEDGE,
+)
+analysis_router = ModelRouter(
+    "analysis", parse_models(LLM_ANALYSIS_MODELS), LLM_ANALYSIS_TIMEOUT_SECONDS
+)
@@ -6,18 +6,18 @@ from dataclasses import dataclass
 from typing import Optional, List
 from datetime import datetime
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     role: str
     content: str
     timestamp: Optional[datetime] = None
     id: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class Conversation:
     messages: List[Message]
 
-@dataclass
+@dataclass(slots=True)
 class AnalysisScore:
     name: str
     human_name: str
@@ -25,7 +25,7 @@ class AnalysisScore:
     score: int
     feedback: str
 
-@dataclass
+@dataclass(slots=True)
 class ConversationAnalysis:
     business_acumen: Optional[AnalysisScore] = None
     user_centricity: Optional[AnalysisScore] = None
@@ -36,7 +36,7 @@ class ConversationAnalysis:
     communication: Optional[AnalysisScore] = None
     collaboration: Optional[AnalysisScore] = None
 
-@dataclass
+@dataclass(slots=True)
 class ConversationOverallAnalysis:
     conversation: Conversation
     analysis: Optional[ConversationAnalysis] = None
@@ -0,0 +1,267 @@
+"""
+Building blocks for calling flaky providers: rolling latency statistics,
+circuit breakers, jittered retry backoff, and the guarded calls and hedged
+failover that the model and TTS routers build on.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+    TypeVar,
+)
+
+from api.admission import Overloaded
+from api.metrics import record_provider_call
+
+T = TypeVar("T")
+
+
+class LatencyWindow:
+    """Latencies and outcomes of the most recent calls to a provider."""
+
+    def __init__(self, size: int = 200):
+        self._latencies: "deque[float]" = deque(maxlen=size)
+        self._outcomes: "deque[bool]" = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def record(self, latency: float, ok: bool = True) -> None:
+        if ok:
+            self._latencies.append(latency)
+        self._outcomes.append(ok)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Return the q-th quantile (0-1) of successful call latencies, if any."""
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider after consecutive failures.
+
+    After `failure_threshold` failures in a row the breaker opens and calls
+    are refused for `reset_timeout` seconds. Then a single trial call is let
+    through (half-open); its success closes the breaker, its failure opens it
+    again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Return whether a call may be made now."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give up a call without an outcome, e.g. when it was cancelled."""
+        self._trial_in_flight = False
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 5.0) -> float:
+    """Exponential backoff with full jitter for the given retry attempt (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class ProviderHealth(Protocol):
+    """The health a router tracks for each of its candidates."""
+
+    breaker: CircuitBreaker
+    requests: int
+    failures: int
+    timeouts: int
+
+
+async def guarded_call(
+    call: Callable[[], Awaitable[T]],
+    timeout: float,
+    health: ProviderHealth,
+    latencies: LatencyWindow,
+    provider: str,
+    operation: str,
+) -> T:
+    """
+    Await a provider call with a timeout, recording its outcome.
+
+    Failures and timeouts count against the provider's breaker and latency
+    window. Cancelled calls and calls shed by our own admission control only
+    release the breaker, since they say nothing about the provider's health.
+
+    Args:
+        call (Callable[[], Awaitable[T]]): Makes the provider call.
+        timeout (float): Seconds to wait for the call.
+        health (ProviderHealth): The provider's breaker and counters.
+        latencies (LatencyWindow): The window the call's latency goes into.
+        provider (str): Names the provider in the provider metrics.
+        operation (str): Names the call in the provider metrics.
+
+    Returns:
+        T: The result of the call.
+    """
+    health.requests += 1
+    start = time.monotonic()
+    try:
+        result = await asyncio.wait_for(call(), timeout)
+    except asyncio.CancelledError:
+        health.breaker.release()
+        record_provider_call(
+            provider, operation, time.monotonic() - start, "cancelled"
+        )
+        raise
+    except Overloaded:
+        health.breaker.release()
+        record_provider_call(provider, operation, time.monotonic() - start, "shed")
+        raise
+    except Exception as e:
+        elapsed = time.monotonic() - start
+        health.failures += 1
+        outcome = "error"
+        if isinstance(e, asyncio.TimeoutError):
+            health.timeouts += 1
+            outcome = "timeout"
+        latencies.record(elapsed, ok=False)
+        health.breaker.record_failure()
+        record_provider_call(provider, operation, elapsed, outcome)
+        raise
+    elapsed = time.monotonic() - start
+    latencies.record(elapsed)
+    health.breaker.record_success()
+    record_provider_call(provider, operation, elapsed)
+    return result
+
+
+H = TypeVar("H", bound=ProviderHealth)
+
+
+class FailoverError(Exception):
+    """Raised by failover when no candidate produced a result."""
+
+    def __init__(self, failures: List[Tuple[Any, BaseException]]):
+        super().__init__(f"{len(failures)} candidates failed")
+        # The candidates that were called and their errors; empty when no
+        # candidate's breaker let a call through
+        self.failures = failures
+
+
+async def failover(
+    candidates: List[H],
+    call: Callable[[H], Awaitable[T]],
+    hedge_delay: Optional[Callable[[H], float]] = None,
+    on_hedge: Optional[Callable[[], None]] = None,
+) -> Tuple[H, T]:
+    """
+    Call the candidates in order until one succeeds, optionally hedging.
+
+    Candidates whose breaker refuses the call are skipped, and a failed call
+    moves on to the next candidate. With hedge_delay, the next candidate is
+    also started when the current one hasn't answered within its delay, and
+    whichever answers first wins. Calls still running when one wins are
+    cancelled.
+
+    Args:
+        candidates (List[H]): The candidates in preference order.
+        call (Callable[[H], Awaitable[T]]): Makes the call to a candidate.
+        hedge_delay (Callable[[H], float], optional): Seconds to wait for a
+            candidate before hedging with the next one. Default is no hedging.
+        on_hedge (Callable[[], None], optional): Called whenever a hedge is
+            started.
+
+    Returns:
+        Tuple[H, T]: The candidate that answered, and its result.
+
+    Raises:
+        FailoverError: If no candidate produced a result.
+    """
+    candidates = list(candidates)
+    pending: Dict[asyncio.Task, H] = {}
+    failures: List[Tuple[H, BaseException]] = []
+    last_launched: Optional[H] = None
+
+    def launch() -> None:
+        """Start the next candidate whose breaker lets a call through."""
+        nonlocal last_launched
+        while candidates:
+            candidate = candidates.pop(0)
+            if candidate.breaker.allow():
+                last_launched = candidate
+                pending[asyncio.create_task(call(candidate))] = candidate
+                return
+
+    launch()
+    try:
+        while pending:
+            timeout = None
+            if hedge_delay is not None and candidates:
+                timeout = hedge_delay(last_launched)
+            done, _ = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # The candidate is slower than usual; race the next one
+                if on_hedge is not None:
+                    on_hedge()
+                launch()
+                continue
+
+            for task in done:
+                candidate = pending.pop(task)
+                if task.exception() is None:
+                    return candidate, task.result()
+                failures.append((candidate, task.exception()))
+            if not pending:
+                launch()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    raise FailoverError(failures)
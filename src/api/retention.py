@@ -0,0 +1,234 @@
+"""
+Retention of the files under public/.
+
+The sweeper deletes files older than a directory's TTL, then the oldest
+files until the directory fits its quota, and removes emptied shards. Audio
+belonging to a live chat session is never deleted. It runs inside the app
+every RETENTION_INTERVAL_SECONDS, or once from the command line:
+
+    poetry run retention [--dry-run]
+
+A separate process can't see the app's in-memory sessions, so when running
+it that way keep the TTLs well above the length of an interview.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Set
+
+from api.layout import SPEECH_IN_DIR, VO_DIR, iter_files, shard_name
+from api.sessions import sessions
+from api.storage import ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_TTL_SECONDS, ANALYZE_DIR
+from api.utils import generate_uuid
+
+RETENTION_ENABLED = os.environ.get("RETENTION_ENABLED", "true").lower() == "true"
+RETENTION_INTERVAL_SECONDS = float(
+    os.environ.get("RETENTION_INTERVAL_SECONDS", "600")
+)
+
+# A TTL or quota of 0 disables that limit for the directory.
+VO_TTL_SECONDS = float(os.environ.get("VO_TTL_SECONDS", str(7 * 24 * 3600)))
+VO_MAX_BYTES = int(os.environ.get("VO_MAX_BYTES", str(2 * 1024**3)))
+SPEECH_IN_TTL_SECONDS = float(
+    os.environ.get("SPEECH_IN_TTL_SECONDS", str(7 * 24 * 3600))
+)
+SPEECH_IN_MAX_BYTES = int(os.environ.get("SPEECH_IN_MAX_BYTES", str(1024**3)))
+# Saved conversations are kept forever unless configured otherwise
+ANALYZE_TTL_SECONDS = float(os.environ.get("ANALYZE_TTL_SECONDS", "0"))
+ANALYZE_MAX_BYTES = int(os.environ.get("ANALYZE_MAX_BYTES", "0"))
+# Cached analyses can always be recomputed, and old rubrics leave stale ones
+ANALYSIS_CACHE_MAX_BYTES = int(
+    os.environ.get("ANALYSIS_CACHE_MAX_BYTES", str(256 * 1024**2))
+)
+
+logger = logging.getLogger(__name__)
+
+# Length of a uuid7 in its string form, which prefixes every file name
+ID_LENGTH = 36
+
+
+@dataclass
+class RetentionPolicy:
+    directory: str
+    ttl: float = 0
+    max_bytes: int = 0
+
+
+@dataclass
+class SweepResult:
+    directory: str
+    files: int = 0
+    bytes: int = 0
+    deleted_files: int = 0
+    deleted_bytes: int = 0
+
+
+def default_policies() -> List[RetentionPolicy]:
+    return [
+        RetentionPolicy(VO_DIR, VO_TTL_SECONDS, VO_MAX_BYTES),
+        RetentionPolicy(SPEECH_IN_DIR, SPEECH_IN_TTL_SECONDS, SPEECH_IN_MAX_BYTES),
+        RetentionPolicy(ANALYZE_DIR, ANALYZE_TTL_SECONDS, ANALYZE_MAX_BYTES),
+        RetentionPolicy(
+            ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_TTL_SECONDS, ANALYSIS_CACHE_MAX_BYTES
+        ),
+    ]
+
+
+def sweep_directory(
+    policy: RetentionPolicy,
+    protected: Set[str],
+    now: Optional[float] = None,
+    dry_run: bool = False,
+) -> SweepResult:
+    """
+    Apply a retention policy to one directory.
+
+    Args:
+        policy (RetentionPolicy): The directory and its limits.
+        protected (Set[str]): IDs whose files must be kept. A file is
+            protected when its name starts with one of them, which covers
+            sentence segments ("<id>-<n>.wav") as well.
+        now (float, optional): The current time, for tests.
+        dry_run (bool): Report what would be deleted without deleting it.
+
+    Returns:
+        SweepResult: What the directory held and what was deleted.
+    """
+    now = time.time() if now is None else now
+    result = SweepResult(directory=policy.directory)
+
+    files = []
+    for entry in iter_files(policy.directory):
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        result.files += 1
+        result.bytes += stat.st_size
+        if entry.name[:ID_LENGTH] not in protected:
+            # Voice output hard-linked from the TTS cache shares the cache
+            # entry's inode and mtime, but linking it updated the ctime
+            modified = max(stat.st_mtime, stat.st_ctime)
+            files.append((modified, stat.st_size, entry.path))
+    files.sort()
+
+    def delete(size: int, path: str) -> None:
+        if not dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return
+        result.deleted_files += 1
+        result.deleted_bytes += size
+
+    remaining = result.bytes
+    for modified, size, path in files:
+        expired = policy.ttl and now - modified > policy.ttl
+        over_quota = policy.max_bytes and remaining > policy.max_bytes
+        if not (expired or over_quota):
+            # Files are oldest first, so nothing later is expired either
+            break
+        delete(size, path)
+        remaining -= size
+
+    if not dry_run:
+        _remove_empty_shards(policy.directory)
+    return result
+
+
+def _remove_empty_shards(directory: str) -> None:
+    # Never remove the shard new files are being written to
+    current = shard_name(generate_uuid())
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False) and entry.name < current:
+            try:
+                os.rmdir(entry.path)
+            except OSError:
+                pass
+
+
+def sweep(
+    policies: Iterable[RetentionPolicy],
+    protected: Set[str],
+    dry_run: bool = False,
+) -> List[SweepResult]:
+    """Apply every retention policy."""
+    return [
+        sweep_directory(policy, protected, dry_run=dry_run) for policy in policies
+    ]
+
+
+class RetentionSweeper:
+    """Runs the retention sweep periodically inside the app."""
+
+    def __init__(
+        self,
+        protected: Callable[[], Set[str]],
+        policies: Optional[List[RetentionPolicy]] = None,
+        interval: float = RETENTION_INTERVAL_SECONDS,
+    ):
+        self.protected = protected
+        self.policies = policies if policies is not None else default_policies()
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def sweep_once(self) -> List[SweepResult]:
+        # Collected on the event loop, since sessions aren't thread safe
+        protected = self.protected()
+        return await asyncio.to_thread(sweep, self.policies, protected)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                for result in await self.sweep_once():
+                    if result.deleted_files:
+                        logger.info(
+                            "Retention deleted %d files (%d bytes) from %s",
+                            result.deleted_files,
+                            result.deleted_bytes,
+                            result.directory,
+                        )
+            except Exception:
+                logger.exception("Error sweeping public files")
+            await asyncio.sleep(self.interval)
+
+
+retention_sweeper = RetentionSweeper(protected=sessions.active_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="report what would be deleted without deleting it",
+    )
+    args = parser.parse_args()
+
+    for result in sweep(default_policies(), protected=set(), dry_run=args.dry_run):
+        print(
+            f"{result.directory}: {result.files} files ({result.bytes} bytes), "
+            f"deleted {result.deleted_files} ({result.deleted_bytes} bytes)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Production entry point for the API.
+
+Runs the app under uvicorn or hypercorn (SERVER) with WEB_CONCURRENCY worker
+processes on uvloop and httptools when they are installed
+(`poetry install --extras speed`). Each worker opens its own provider clients
+and background workers from the app's before_serving hook. On SIGTERM the
+server stops accepting connections, lets in-flight requests finish for
+GRACEFUL_TIMEOUT_SECONDS, then the app drains its queued analyses before
+exiting.
+
+    poetry run serve
+
+WEB_CONCURRENCY defaults to a single worker, because a lot of state lives in
+each worker's memory: chat sessions and their context summaries, analysis
+jobs and their deduplication, the TTS cache's index, warmup readiness and
+the /metrics counters. With several workers, a session created on one worker
+is unknown to the others (its ID travels in the URL, so load balancer
+stickiness can't route on it), analysis polls can start duplicate jobs and
+each /metrics scrape only sees the worker that answered it. Only raise it
+for clients that use neither sessions nor analysis polling.
+"""
+
+import importlib.util
+import logging
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SERVER = os.environ.get("SERVER", "uvicorn").lower()
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "5000"))
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+# Above the 60 second idle timeout of most load balancers, so they close
+# idle connections before we do and never send a request on a closed socket
+KEEPALIVE_TIMEOUT_SECONDS = int(os.environ.get("KEEPALIVE_TIMEOUT_SECONDS", "75"))
+# Connections waiting to be accepted when a worker is busy
+BACKLOG = int(os.environ.get("BACKLOG", "2048"))
+GRACEFUL_TIMEOUT_SECONDS = int(os.environ.get("GRACEFUL_TIMEOUT_SECONDS", "30"))
+
+APP = "api:app"
+
+logger = logging.getLogger(__name__)
+
+
+def has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def serve_uvicorn() -> None:
+    import uvicorn
+
+    loop = "uvloop" if has_module("uvloop") else "asyncio"
+    http = "httptools" if has_module("httptools") else "h11"
+    logger.info(
+        "Starting uvicorn with %d workers on %s:%d (%s, %s)",
+        WEB_CONCURRENCY,
+        HOST,
+        PORT,
+        loop,
+        http,
+    )
+    uvicorn.run(
+        APP,
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        loop=loop,
+        http=http,
+        lifespan="on",
+        backlog=BACKLOG,
+        timeout_keep_alive=KEEPALIVE_TIMEOUT_SECONDS,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT_SECONDS,
+        proxy_headers=True,
+        access_log=False,
+    )
+
+
+def serve_hypercorn() -> None:
+    from hypercorn.config import Config
+    from hypercorn.run import run
+
+    config = Config()
+    config.application_path = APP
+    config.bind = [f"{HOST}:{PORT}"]
+    config.workers = WEB_CONCURRENCY
+    config.worker_class = "uvloop" if has_module("uvloop") else "asyncio"
+    config.backlog = BACKLOG
+    config.keep_alive_timeout = KEEPALIVE_TIMEOUT_SECONDS
+    config.graceful_timeout = GRACEFUL_TIMEOUT_SECONDS
+    # Log through the root logger, like the rest of the app
+    config.errorlog = logging.getLogger("hypercorn.error")
+    logger.info(
+        "Starting hypercorn with %d workers on %s:%d (%s)",
+        WEB_CONCURRENCY,
+        HOST,
+        PORT,
+        config.worker_class,
+    )
+    run(config)
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    if SERVER == "uvicorn":
+        serve_uvicorn()
+    elif SERVER == "hypercorn":
+        serve_hypercorn()
+    else:
+        raise SystemExit(f"Unknown SERVER {SERVER!r}; use uvicorn or hypercorn")
+
+
+if __name__ == "__main__":
+    main()
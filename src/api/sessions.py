@@ -0,0 +1,137 @@
+"""
+Server-side chat sessions.
+
+A session keeps the conversation history on the server, so each /chat turn
+only carries the new message instead of the whole conversation. Sessions are
+held in memory, expire after SESSION_TTL_SECONDS of inactivity and are
+evicted least recently used first once SESSION_MAX_COUNT or
+SESSION_MAX_BYTES is exceeded.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Set
+
+from api.models import Conversation, Message
+from api.utils import generate_uuid
+
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_COUNT = int(os.environ.get("SESSION_MAX_COUNT", "1000"))
+SESSION_MAX_BYTES = int(
+    os.environ.get("SESSION_MAX_BYTES", str(64 * 1024 * 1024))
+)
+
+
+@dataclass
+class ChatSession:
+    id: str
+    messages: List[Message]
+    last_active: float = field(default_factory=time.monotonic)
+    # Approximate size of the message contents, in bytes
+    size: int = 0
+    # Serializes turns, so concurrent requests can't interleave the history
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    @property
+    def conversation(self) -> Conversation:
+        return Conversation(messages=list(self.messages))
+
+
+def _message_size(message: Message) -> int:
+    return len(message.content.encode())
+
+
+class SessionStore:
+    """An in-memory, LRU-ordered store of chat sessions."""
+
+    def __init__(
+        self,
+        ttl: float = SESSION_TTL_SECONDS,
+        max_count: int = SESSION_MAX_COUNT,
+        max_bytes: int = SESSION_MAX_BYTES,
+    ):
+        self.ttl = ttl
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, messages: Optional[List[Message]] = None) -> ChatSession:
+        """Create a session, optionally seeded with messages (e.g. a system prompt)."""
+        session = ChatSession(id=generate_uuid(), messages=[])
+        self._sessions[session.id] = session
+        for message in messages or []:
+            self.append(session, message)
+        self._evict()
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Return a live session and mark it as recently used."""
+        self._evict()
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        session.last_active = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._size -= session.size
+
+    def append(self, session: ChatSession, message: Message) -> None:
+        """Add a message to a session's history."""
+        session.messages.append(message)
+        size = _message_size(message)
+        session.size += size
+        if session.id in self._sessions:
+            self._size += size
+        self._evict()
+
+    def pop(self, session: ChatSession) -> None:
+        """Remove the last message from a session's history."""
+        size = _message_size(session.messages.pop())
+        session.size -= size
+        if session.id in self._sessions:
+            self._size -= size
+
+    def active_ids(self) -> Set[str]:
+        """
+        Return the message IDs of every live session.
+
+        Assistant message IDs are also the IDs of their voice output, which
+        the retention sweeper must keep while the session is in use.
+        """
+        self._evict()
+        return {
+            message.id
+            for session in self._sessions.values()
+            for message in session.messages
+            if message.id
+        }
+
+    def _evict(self) -> None:
+        """Drop expired sessions, then the least recently used ones over the limits."""
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            over_limit = (
+                len(self._sessions) > self.max_count or self._size > self.max_bytes
+            )
+            # Never evict the only session, however large it is
+            if len(self._sessions) > 1 and over_limit:
+                self.delete(session_id)
+            elif now - session.last_active > self.ttl:
+                self.delete(session_id)
+            else:
+                break
+
+
+sessions = SessionStore()
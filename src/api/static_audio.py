@@ -0,0 +1,79 @@
+"""
+Serving of voice output and speech input files.
+
+Audio files are written once under a uuid7 ID and never change, so responses
+carry a strong ETag derived from the file name and are cacheable forever.
+Conditional requests are answered with 304 before the file is touched, and
+byte ranges are supported so audio elements can seek.
+
+With AUDIO_ACCEL_REDIRECT_PREFIX set, the response only carries an
+X-Accel-Redirect header and a front proxy (e.g. nginx with an internal
+location for that prefix) sends the bytes itself.
+"""
+
+import os
+
+from quart import Response, abort, request, send_file
+
+from api.layout import resolve_path
+
+# How long clients and proxies may cache audio, in seconds.
+AUDIO_CACHE_MAX_AGE = int(os.environ.get("AUDIO_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+
+# Internal location the front proxy serves public/ from, e.g. "/_public/".
+# Empty to serve the files from Python.
+AUDIO_ACCEL_REDIRECT_PREFIX = os.environ.get("AUDIO_ACCEL_REDIRECT_PREFIX", "")
+
+# Size of the chunks files are read in when served from Python.
+AUDIO_READ_BUFFER_SIZE = int(os.environ.get("AUDIO_READ_BUFFER_SIZE", str(256 * 1024)))
+
+
+def _cache_headers(response: Response, etag: str) -> Response:
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = AUDIO_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+async def send_audio(directory: str, file_name: str, mimetype: str) -> Response:
+    """
+    Serve an immutable audio file.
+
+    Args:
+        directory (str): The directory under public/ holding the file, in
+            either layout.
+        file_name (str): The file name, "<id>.<extension>".
+        mimetype (str): The content type of the file.
+
+    Returns:
+        Response: The file, a 206 range of it, a 304, or an X-Accel-Redirect.
+    """
+    # The file name embeds the uuid7 ID, so it identifies the content
+    etag = file_name
+    if request.if_none_match.contains(etag):
+        return _cache_headers(Response(status=304), etag)
+
+    path = resolve_path(directory, file_name)
+    if path is None:
+        abort(404)
+
+    if AUDIO_ACCEL_REDIRECT_PREFIX:
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = (
+            AUDIO_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + path.removeprefix("public/")
+        )
+        return _cache_headers(response, etag)
+
+    response = await send_file(
+        path,
+        mimetype=mimetype,
+        add_etags=False,
+        cache_timeout=AUDIO_CACHE_MAX_AGE,
+    )
+    response.response.buffer_size = AUDIO_READ_BUFFER_SIZE
+    response.accept_ranges = "bytes"
+    _cache_headers(response, etag)
+    return await response.make_conditional(
+        request, accept_ranges=True, complete_length=response.content_length
+    )
@@ -0,0 +1,579 @@
+"""
+Storage engines for saved conversations and their analyses.
+
+STORAGE_BACKEND selects the engine: "file" keeps one JSON file per
+conversation in public/analyze, "sqlite" uses an indexed SQLite database in
+WAL mode. Existing JSON files can be imported with `python -m api.migrate`.
+
+Both engines also keep a cache of analyses keyed by a hash of their content
+(see api.txt2txt.analysis_cache_key), shared by every conversation with the
+same transcript.
+"""
+
+import asyncio
+import dataclasses
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import aiofiles
+
+from api.codec import (
+    analysis_from_dict,
+    analysis_to_dict,
+    decode,
+    encode,
+    overall_analysis_from_dict,
+)
+from api.layout import iter_files, legacy_path, resolve_path, write_path
+from api.metrics import span
+from api.models import (
+    AnalysisScore,
+    Conversation,
+    ConversationAnalysis,
+    ConversationOverallAnalysis,
+    Message,
+)
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "file")
+ANALYZE_DIR = os.environ.get("ANALYZE_DIR", "public/analyze")
+ANALYSIS_CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR", "public/analysis_cache")
+# Age after which cached analyses are no longer used. 0 keeps them forever.
+ANALYSIS_CACHE_TTL_SECONDS = float(
+    os.environ.get("ANALYSIS_CACHE_TTL_SECONDS", str(90 * 24 * 3600))
+)
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "public/leetpro.db")
+
+# Number of threads (each with its own connection) serving SQLite queries.
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", "4"))
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _cached_analysis(
+    analysis: dict, overall_score: Optional[int], overall_feedback: Optional[str]
+) -> ConversationOverallAnalysis:
+    return ConversationOverallAnalysis(
+        conversation=Conversation(messages=[]),
+        analysis=analysis_from_dict(analysis),
+        overall_score=overall_score,
+        overall_feedback=overall_feedback,
+    )
+
+
+class ConversationStore(ABC):
+    """Persists conversations and the results of analyzing them."""
+
+    @abstractmethod
+    async def save_conversation(
+        self, conversation_id: str, conversation: Conversation
+    ) -> None:
+        """Create or replace a conversation."""
+
+    @abstractmethod
+    async def load(self, conversation_id: str) -> Optional[ConversationOverallAnalysis]:
+        """
+        Load a conversation and its analysis.
+
+        Returns:
+            ConversationOverallAnalysis: The conversation, with analysis set to
+            None until it has been analyzed, or None if it does not exist.
+        """
+
+    @abstractmethod
+    async def save_analysis(
+        self, conversation_id: str, analysis: ConversationOverallAnalysis
+    ) -> None:
+        """Store the analysis of a saved conversation."""
+
+    @abstractmethod
+    async def list_conversations(
+        self, limit: int = 50, before: Optional[str] = None
+    ) -> List[str]:
+        """List conversation IDs, newest first, optionally older than `before`."""
+
+    @abstractmethod
+    async def load_cached_analysis(
+        self, key: str
+    ) -> Optional[ConversationOverallAnalysis]:
+        """
+        Load the analysis cached under a content key.
+
+        Returns:
+            ConversationOverallAnalysis: The cached analysis, with an empty
+            conversation, or None on a miss.
+        """
+
+    @abstractmethod
+    async def save_cached_analysis(
+        self, key: str, analysis: ConversationOverallAnalysis
+    ) -> None:
+        """Cache an analysis under a content key, without its conversation."""
+
+    async def close(self) -> None:
+        """Release any resources held by the store."""
+
+
+class FileConversationStore(ConversationStore):
+    """Stores each conversation as a JSON file, in the sharded layout of api.layout."""
+
+    def __init__(
+        self, directory: str = ANALYZE_DIR, cache_directory: str = ANALYSIS_CACHE_DIR
+    ):
+        self.directory = directory
+        self.cache_directory = cache_directory
+
+    @staticmethod
+    async def _write_file(path: str, json_data: dict) -> None:
+        # Write to a temporary file and rename it over the old one, so
+        # concurrent readers never see a partially written file
+        with span("store_write"):
+            async with aiofiles.open(f"{path}.tmp", "wb") as f:
+                await f.write(encode(json_data))
+            os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    async def _read_file(path: str) -> Optional[dict]:
+        try:
+            with span("store_read"):
+                async with aiofiles.open(path, "rb") as f:
+                    return decode(await f.read())
+        except FileNotFoundError:
+            return None
+
+    async def _write(self, conversation_id: str, json_data: dict) -> None:
+        file_name = f"{conversation_id}.json"
+        await self._write_file(write_path(self.directory, file_name), json_data)
+
+        # Drop the copy in the old flat layout, which would otherwise linger
+        old_path = legacy_path(self.directory, file_name)
+        if old_path is not None and os.path.exists(old_path):
+            os.remove(old_path)
+
+    async def _read(self, conversation_id: str) -> Optional[dict]:
+        path = resolve_path(self.directory, f"{conversation_id}.json")
+        if path is None:
+            return None
+        return await self._read_file(path)
+
+    async def save_conversation(
+        self, conversation_id: str, conversation: Conversation
+    ) -> None:
+        await self._write(conversation_id, {"conversation": conversation})
+
+    async def load(self, conversation_id: str) -> Optional[ConversationOverallAnalysis]:
+        json_data = await self._read(conversation_id)
+        if json_data is None:
+            return None
+        return overall_analysis_from_dict(json_data)
+
+    async def save_analysis(
+        self, conversation_id: str, analysis: ConversationOverallAnalysis
+    ) -> None:
+        await self._write(
+            conversation_id,
+            {
+                "conversation": analysis.conversation,
+                "analysis": analysis.analysis,
+                "overall_score": analysis.overall_score,
+                "overall_feedback": analysis.overall_feedback,
+            },
+        )
+
+    async def list_conversations(
+        self, limit: int = 50, before: Optional[str] = None
+    ) -> List[str]:
+        def scan() -> List[str]:
+            ids = [
+                entry.name[: -len(".json")]
+                for entry in iter_files(self.directory)
+                if entry.name.endswith(".json")
+            ]
+            # uuid7 IDs sort by creation time
+            ids.sort(reverse=True)
+            if before is not None:
+                ids = [id for id in ids if id < before]
+            return ids[:limit]
+
+        return await asyncio.to_thread(scan)
+
+    async def load_cached_analysis(
+        self, key: str
+    ) -> Optional[ConversationOverallAnalysis]:
+        path = legacy_path(self.cache_directory, f"{key}.json")
+        if path is None:
+            return None
+        json_data = await self._read_file(path)
+        if json_data is None:
+            return None
+        return _cached_analysis(
+            json_data["analysis"],
+            json_data.get("overall_score"),
+            json_data.get("overall_feedback"),
+        )
+
+    async def save_cached_analysis(
+        self, key: str, analysis: ConversationOverallAnalysis
+    ) -> None:
+        # Keys are hashes rather than uuid7s, so the cache isn't sharded
+        path = legacy_path(self.cache_directory, f"{key}.json")
+        if path is None:
+            raise ValueError(f"Invalid cache key {key!r}")
+        os.makedirs(self.cache_directory, exist_ok=True)
+        await self._write_file(
+            path,
+            {
+                "analysis": analysis.analysis,
+                "overall_score": analysis.overall_score,
+                "overall_feedback": analysis.overall_feedback,
+            },
+        )
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    analyzed_at TEXT,
+    overall_score INTEGER,
+    overall_feedback TEXT
+);
+CREATE INDEX IF NOT EXISTS conversations_created_at ON conversations (created_at);
+CREATE INDEX IF NOT EXISTS conversations_overall_score ON conversations (overall_score);
+
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT,
+    message_id TEXT,
+    PRIMARY KEY (conversation_id, position)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS analysis_scores (
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    criterion TEXT NOT NULL,
+    name TEXT NOT NULL,
+    human_name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    feedback TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, criterion)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS analysis_scores_criterion_score
+    ON analysis_scores (criterion, score);
+
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    key TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    overall_score INTEGER,
+    overall_feedback TEXT,
+    analysis TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS analysis_cache_created_at ON analysis_cache (created_at);
+"""
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Stores conversations in SQLite, using WAL mode so reads don't block writes.
+
+    Queries run on a small thread pool; each thread keeps its own connection.
+    """
+
+    def __init__(self, path: str = SQLITE_PATH, pool_size: int = SQLITE_POOL_SIZE):
+        self.path = path
+        self.pool_size = pool_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Only ever used from this thread, but closed from close()
+            connection = sqlite3.connect(
+                self.path, timeout=5, check_same_thread=False
+            )
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            with self._lock:
+                if not self._schema_ready:
+                    connection.executescript(SQLITE_SCHEMA)
+                    self._schema_ready = True
+                self._connections.append(connection)
+            self._local.connection = connection
+        return connection
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.pool_size, thread_name_prefix="sqlite"
+            )
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, fn, *args
+        )
+
+    def _save_conversation(self, conversation_id: str, conversation: Conversation):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                """
+                INSERT INTO conversations (id, created_at) VALUES (?, ?)
+                ON CONFLICT (id) DO NOTHING
+                """,
+                (conversation_id, datetime.now(timezone.utc).isoformat()),
+            )
+            connection.execute(
+                "DELETE FROM messages WHERE conversation_id = ?", (conversation_id,)
+            )
+            connection.executemany(
+                """
+                INSERT INTO messages
+                    (conversation_id, position, role, content, timestamp, message_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        conversation_id,
+                        position,
+                        msg.role,
+                        msg.content,
+                        msg.timestamp.isoformat() if msg.timestamp else None,
+                        msg.id,
+                    )
+                    for position, msg in enumerate(conversation.messages)
+                ],
+            )
+
+    async def save_conversation(
+        self, conversation_id: str, conversation: Conversation
+    ) -> None:
+        with span("store_write"):
+            await self._run(self._save_conversation, conversation_id, conversation)
+
+    def _load(self, conversation_id: str) -> Optional[ConversationOverallAnalysis]:
+        connection = self._connection()
+        row = connection.execute(
+            """
+            SELECT analyzed_at, overall_score, overall_feedback
+            FROM conversations WHERE id = ?
+            """,
+            (conversation_id,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        messages = [
+            Message(
+                role=msg["role"],
+                content=msg["content"],
+                timestamp=_parse_datetime(msg["timestamp"]),
+                id=msg["message_id"],
+            )
+            for msg in connection.execute(
+                """
+                SELECT role, content, timestamp, message_id FROM messages
+                WHERE conversation_id = ? ORDER BY position
+                """,
+                (conversation_id,),
+            )
+        ]
+
+        analysis = None
+        if row["analyzed_at"] is not None:
+            analysis = ConversationAnalysis()
+            for score in connection.execute(
+                """
+                SELECT criterion, name, human_name, description, score, feedback
+                FROM analysis_scores WHERE conversation_id = ?
+                """,
+                (conversation_id,),
+            ):
+                setattr(
+                    analysis,
+                    score["criterion"],
+                    AnalysisScore(
+                        name=score["name"],
+                        human_name=score["human_name"],
+                        description=score["description"],
+                        score=score["score"],
+                        feedback=score["feedback"],
+                    ),
+                )
+
+        return ConversationOverallAnalysis(
+            conversation=Conversation(messages=messages),
+            analysis=analysis,
+            overall_score=row["overall_score"],
+            overall_feedback=row["overall_feedback"],
+        )
+
+    async def load(self, conversation_id: str) -> Optional[ConversationOverallAnalysis]:
+        with span("store_read"):
+            return await self._run(self._load, conversation_id)
+
+    def _save_analysis(
+        self, conversation_id: str, analysis: ConversationOverallAnalysis
+    ) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                """
+                UPDATE conversations
+                SET analyzed_at = ?, overall_score = ?, overall_feedback = ?
+                WHERE id = ?
+                """,
+                (
+                    datetime.now(timezone.utc).isoformat(),
+                    analysis.overall_score,
+                    analysis.overall_feedback,
+                    conversation_id,
+                ),
+            )
+            # Criteria left ungraded by this analysis must not keep old scores
+            connection.execute(
+                "DELETE FROM analysis_scores WHERE conversation_id = ?",
+                (conversation_id,),
+            )
+            connection.executemany(
+                """
+                INSERT INTO analysis_scores
+                    (conversation_id, criterion, name, human_name, description,
+                     score, feedback)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        conversation_id,
+                        field.name,
+                        score.name,
+                        score.human_name,
+                        score.description,
+                        score.score,
+                        score.feedback,
+                    )
+                    for field in dataclasses.fields(ConversationAnalysis)
+                    if (score := getattr(analysis.analysis, field.name)) is not None
+                ],
+            )
+
+    async def save_analysis(
+        self, conversation_id: str, analysis: ConversationOverallAnalysis
+    ) -> None:
+        with span("store_write"):
+            await self._run(self._save_analysis, conversation_id, analysis)
+
+    def _list_conversations(self, limit: int, before: Optional[str]) -> List[str]:
+        connection = self._connection()
+        if before is None:
+            rows = connection.execute(
+                "SELECT id FROM conversations ORDER BY id DESC LIMIT ?", (limit,)
+            )
+        else:
+            rows = connection.execute(
+                """
+                SELECT id FROM conversations WHERE id < ?
+                ORDER BY id DESC LIMIT ?
+                """,
+                (before, limit),
+            )
+        return [row["id"] for row in rows]
+
+    async def list_conversations(
+        self, limit: int = 50, before: Optional[str] = None
+    ) -> List[str]:
+        return await self._run(self._list_conversations, limit, before)
+
+    @staticmethod
+    def _cache_cutoff() -> str:
+        if not ANALYSIS_CACHE_TTL_SECONDS:
+            return ""
+        cutoff = datetime.now(timezone.utc) - timedelta(
+            seconds=ANALYSIS_CACHE_TTL_SECONDS
+        )
+        return cutoff.isoformat()
+
+    def _load_cached_analysis(
+        self, key: str
+    ) -> Optional[ConversationOverallAnalysis]:
+        connection = self._connection()
+        row = connection.execute(
+            """
+            SELECT overall_score, overall_feedback, analysis
+            FROM analysis_cache WHERE key = ? AND created_at >= ?
+            """,
+            (key, self._cache_cutoff()),
+        ).fetchone()
+        if row is None:
+            return None
+        return _cached_analysis(
+            decode(row["analysis"]), row["overall_score"], row["overall_feedback"]
+        )
+
+    async def load_cached_analysis(
+        self, key: str
+    ) -> Optional[ConversationOverallAnalysis]:
+        with span("store_read"):
+            return await self._run(self._load_cached_analysis, key)
+
+    def _save_cached_analysis(
+        self, key: str, analysis: ConversationOverallAnalysis
+    ) -> None:
+        connection = self._connection()
+        with connection:
+            # The file cache is pruned by the retention sweeper instead
+            connection.execute(
+                "DELETE FROM analysis_cache WHERE created_at < ?",
+                (self._cache_cutoff(),),
+            )
+            connection.execute(
+                """
+                INSERT OR REPLACE INTO analysis_cache
+                    (key, created_at, overall_score, overall_feedback, analysis)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (
+                    key,
+                    datetime.now(timezone.utc).isoformat(),
+                    analysis.overall_score,
+                    analysis.overall_feedback,
+                    encode(analysis_to_dict(analysis.analysis)).decode(),
+                ),
+            )
+
+    async def save_cached_analysis(
+        self, key: str, analysis: ConversationOverallAnalysis
+    ) -> None:
+        with span("store_write"):
+            await self._run(self._save_cached_analysis, key, analysis)
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, wait=True)
+            self._executor = None
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+
+def create_conversation_store(backend: str = STORAGE_BACKEND) -> ConversationStore:
+    """Create the store selected by STORAGE_BACKEND."""
+    if backend == "sqlite":
+        return SQLiteConversationStore()
+    return FileConversationStore()
+
+
+conversation_store = create_conversation_store()
@@ -1,14 +1,28 @@
+import io
 import os
+import time
+from typing import IO, Optional
+
 import aiofiles
+from quart.formparser import FormDataParser
 from quart_schema.pydantic import File
-from deepgram import DeepgramClient, PrerecordedOptions, FileSource
-from uuid_extensions import uuid7str
+from werkzeug.formparser import default_stream_factory
+from deepgram import PrerecordedOptions
 from dotenv import load_dotenv
 
+from api.admission import limiters
+from api.clients import DEEPGRAM_BASE_URL, provider_clients
+from api.layout import SPEECH_IN_DIR, write_path
+from api.metrics import provider_bytes_total, record_provider_call, span
+
 load_dotenv()
 
 deepgram_api_key = os.environ.get("DEEPGRAM_API_KEY")
-deepgram_client = DeepgramClient(deepgram_api_key)
+
+MAX_SPEECH_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+
+# Whether uploaded speech is kept in public/speech_in for the /speech_in route.
+SPEECH_IN_PERSIST = os.environ.get("SPEECH_IN_PERSIST", "true").lower() == "true"
 
 deepgram_options = PrerecordedOptions(
     model="nova-2",
@@ -18,23 +32,101 @@ deepgram_options = PrerecordedOptions(
 )
 
 
-async def write_speech_file(audio_file: File) -> str:
-    speech_file_id = uuid7str()
-    await audio_file.save(f"public/speech_in/{speech_file_id}.wav")
-    return speech_file_id
+def speech_stream_factory(
+    total_content_length: Optional[int],
+    content_type: Optional[str],
+    filename: Optional[str],
+    content_length: Optional[int] = None,
+) -> IO[bytes]:
+    """
+    Buffer speech uploads in memory.
 
+    Werkzeug's default factory spools anything over 500 KB to a temporary
+    file, which would put most speech uploads on disk before we read them.
+    Quart does not pass the part length through for multipart bodies, so an
+    unknown length is also kept in memory; the body as a whole is already
+    bounded by the app's MAX_CONTENT_LENGTH.
+    """
+    if total_content_length is None or total_content_length <= MAX_SPEECH_FILE_SIZE:
+        return io.BytesIO()
+    return default_stream_factory(
+        total_content_length, content_type, filename, content_length
+    )
 
-async def transcribe_audio(speech_file_id: str) -> str:
-    async with aiofiles.open(f"public/speech_in/{speech_file_id}.wav", "rb") as file:
-        buffer_data = await file.read()
 
-    payload: FileSource = {"buffer": buffer_data}
+class SpeechFormDataParser(FormDataParser):
+    """Form data parser that keeps speech uploads in memory."""
 
-    res = await deepgram_client.listen.asyncrest.v("1").transcribe_file(
-        payload,
-        options=deepgram_options,
-    )
+    def __init__(self, *args, **kwargs) -> None:
+        kwargs.setdefault("stream_factory", speech_stream_factory)
+        super().__init__(*args, **kwargs)
+
+    async def parse(self, *args, **kwargs):
+        with span("upload_parse"):
+            return await super().parse(*args, **kwargs)
+
+
+def read_speech_file(audio_file: File) -> bytes:
+    """
+    Return the contents of an uploaded speech file.
+
+    Uploads buffered in memory by speech_stream_factory are returned
+    without copying the buffer.
+    """
+    stream = audio_file.stream
+    if isinstance(stream, io.BytesIO):
+        return stream.getvalue()
+    stream.seek(0)
+    return stream.read()
+
+
+async def write_speech_file(speech_file_id: str, audio: bytes) -> None:
+    """
+    Persist uploaded speech to public/speech_in.
+
+    Args:
+        speech_file_id (str): Unique identifier for the speech file.
+        audio (bytes): The uploaded audio.
+    """
+    with span("file_write"):
+        path = write_path(SPEECH_IN_DIR, f"{speech_file_id}.wav")
+        async with aiofiles.open(path, "wb") as out:
+            await out.write(audio)
+
+
+async def transcribe_audio(audio: bytes) -> str:
+    """
+    Transcribe speech with Deepgram's prerecorded API.
+
+    Args:
+        audio (bytes): The WAV audio to transcribe.
+
+    Returns:
+        str: The transcript.
 
-    # print("transcription res ", res)
+    Raises:
+        Overloaded: If Deepgram calls are being shed.
+    """
+    provider_bytes_total.inc(len(audio), provider="deepgram", direction="sent")
+    with span("stt"):
+        async with limiters["deepgram"].slot():
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                res = await provider_clients.http.post(
+                    f"{DEEPGRAM_BASE_URL}/listen",
+                    params=deepgram_options.to_dict(),
+                    headers={
+                        "Authorization": f"Token {deepgram_api_key}",
+                        "Content-Type": "audio/wav",
+                    },
+                    content=audio,
+                )
+                res.raise_for_status()
+                outcome = "ok"
+            finally:
+                record_provider_call(
+                    "deepgram", "stt", time.perf_counter() - start, outcome
+                )
 
-    return res.results.channels[0].alternatives[0].transcript
+    return res.json()["results"]["channels"][0]["alternatives"][0]["transcript"]
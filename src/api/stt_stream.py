@@ -0,0 +1,218 @@
+"""
+Live speech-to-text for audio streamed over a WebSocket.
+
+A StreamingSTTBackend relays audio frames to a streaming transcription
+service and yields TranscriptEvents back. UtteranceAssembler turns those into
+the messages sent to the client, including an "utterance_end" message as soon
+as the candidate stops talking, and an "error" message if the stream fails.
+"""
+
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+from deepgram import LiveOptions, LiveTranscriptionEvents
+
+from api.clients import provider_clients
+from api.stt import deepgram_options
+
+# "deepgram" or "fake"
+STT_STREAM_BACKEND = os.environ.get("STT_STREAM_BACKEND", "deepgram")
+
+# Silence (in ms) after which Deepgram marks a transcript as speech_final.
+STT_ENDPOINTING_MS = int(os.environ.get("STT_ENDPOINTING_MS", "300"))
+
+# Gap between words (in ms) after which Deepgram sends an UtteranceEnd, which
+# still fires when background noise keeps endpointing from triggering.
+STT_UTTERANCE_END_MS = int(os.environ.get("STT_UTTERANCE_END_MS", "1000"))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TranscriptEvent:
+    text: str
+    is_final: bool = False
+    # The speaker paused long enough for the backend to consider the
+    # utterance finished
+    speech_final: bool = False
+    # Set on the last event of a stream that failed
+    error: Optional[str] = None
+
+
+class StreamingSTTBackend(ABC):
+    """A single live transcription stream."""
+
+    def __init__(self) -> None:
+        self._events: "asyncio.Queue[Optional[TranscriptEvent]]" = asyncio.Queue()
+        self._closed = False
+
+    @abstractmethod
+    async def start(self) -> None:
+        """Open the stream."""
+
+    @abstractmethod
+    async def send(self, audio: bytes) -> None:
+        """Relay a frame of audio."""
+
+    @abstractmethod
+    async def finish(self) -> None:
+        """Flush pending transcripts and close the stream."""
+
+    async def events(self) -> AsyncIterator[TranscriptEvent]:
+        """Yield transcript events until the stream is finished or closed."""
+        while (event := await self._events.get()) is not None:
+            yield event
+
+    async def _close(self, error: Optional[str] = None) -> None:
+        """End events(), after an error event if the stream failed."""
+        if self._closed:
+            return
+        self._closed = True
+        if error is not None:
+            await self._events.put(TranscriptEvent(text="", error=error))
+        await self._events.put(None)
+
+
+class DeepgramStreamingBackend(StreamingSTTBackend):
+    """Streams audio to Deepgram's live transcription API."""
+
+    def __init__(
+        self, encoding: Optional[str] = None, sample_rate: Optional[int] = None
+    ) -> None:
+        super().__init__()
+        self.options = LiveOptions(
+            **deepgram_options.to_dict(),
+            encoding=encoding,
+            sample_rate=sample_rate,
+            interim_results=True,
+            endpointing=STT_ENDPOINTING_MS,
+            utterance_end_ms=str(STT_UTTERANCE_END_MS),
+            vad_events=True,
+        )
+        self._connection = provider_clients.deepgram.listen.asyncwebsocket.v("1")
+
+    async def start(self) -> None:
+        async def on_transcript(_client, result, **kwargs) -> None:
+            text = result.channel.alternatives[0].transcript
+            if text or result.speech_final:
+                await self._events.put(
+                    TranscriptEvent(
+                        text=text,
+                        is_final=result.is_final,
+                        speech_final=result.speech_final,
+                    )
+                )
+
+        async def on_utterance_end(_client, utterance_end, **kwargs) -> None:
+            await self._events.put(TranscriptEvent(text="", speech_final=True))
+
+        # Deepgram can close the stream on its own, e.g. after a network error
+        # or when no audio arrives for a while
+        async def on_close(_client, close, **kwargs) -> None:
+            await self._close()
+
+        async def on_error(_client, error, **kwargs) -> None:
+            logger.warning("Deepgram live stream failed: %r", error)
+            await self._close(error="transcription failed")
+
+        self._connection.on(LiveTranscriptionEvents.Transcript, on_transcript)
+        self._connection.on(LiveTranscriptionEvents.UtteranceEnd, on_utterance_end)
+        self._connection.on(LiveTranscriptionEvents.Close, on_close)
+        self._connection.on(LiveTranscriptionEvents.Error, on_error)
+        if not await self._connection.start(self.options):
+            raise ConnectionError("Could not open the Deepgram live stream")
+
+    async def send(self, audio: bytes) -> None:
+        await self._connection.send(audio)
+
+    async def finish(self) -> None:
+        try:
+            await self._connection.finalize()
+            await self._connection.finish()
+        finally:
+            await self._close()
+
+
+class FakeStreamingBackend(StreamingSTTBackend):
+    """
+    A local stand-in for tests and offline development.
+
+    Every non-silent frame "recognizes" the next word of the scripted
+    transcript as an interim result. A silent frame (all zero bytes) ends the
+    utterance, like the real backend's endpointing would.
+    """
+
+    def __init__(self, transcript: str = "this is a fake transcript") -> None:
+        super().__init__()
+        self._script = transcript.split()
+        self._position = 0
+        self._words: List[str] = []
+
+    async def start(self) -> None:
+        pass
+
+    async def send(self, audio: bytes) -> None:
+        if not audio.strip(b"\0"):
+            await self._endpoint()
+            return
+        self._words.append(self._script[self._position % len(self._script)])
+        self._position += 1
+        await self._events.put(TranscriptEvent(text=" ".join(self._words)))
+
+    async def _endpoint(self) -> None:
+        if self._words:
+            await self._events.put(
+                TranscriptEvent(
+                    text=" ".join(self._words), is_final=True, speech_final=True
+                )
+            )
+            self._words = []
+
+    async def finish(self) -> None:
+        await self._endpoint()
+        await self._close()
+
+
+def create_streaming_backend(
+    encoding: Optional[str] = None, sample_rate: Optional[int] = None
+) -> StreamingSTTBackend:
+    """Create a backend of the kind selected by STT_STREAM_BACKEND."""
+    if STT_STREAM_BACKEND == "fake":
+        return FakeStreamingBackend()
+    return DeepgramStreamingBackend(encoding=encoding, sample_rate=sample_rate)
+
+
+class UtteranceAssembler:
+    """Collects final transcript segments into complete utterances."""
+
+    def __init__(self) -> None:
+        self._segments: List[str] = []
+
+    def process(self, event: TranscriptEvent) -> List[Dict[str, str]]:
+        """
+        Turn a transcript event into the messages sent to the client.
+
+        Returns:
+            List[Dict[str, str]]: "interim", "final", "utterance_end" and
+            "error" messages, where "utterance_end" carries the whole
+            utterance.
+        """
+        messages = []
+        if event.text:
+            if event.is_final:
+                self._segments.append(event.text)
+                messages.append({"type": "final", "text": event.text})
+            else:
+                messages.append({"type": "interim", "text": event.text})
+        if event.speech_final and self._segments:
+            messages.append(
+                {"type": "utterance_end", "text": " ".join(self._segments)}
+            )
+            self._segments = []
+        if event.error is not None:
+            messages.append({"type": "error", "message": event.error})
+        return messages
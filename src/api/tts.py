@@ -1,53 +1,70 @@
 import base64
-import httpx
 import os
 from typing import Literal
-from deepgram import DeepgramClient, SpeakOptions
+from deepgram import SpeakOptions
 from dotenv import load_dotenv
 import aiofiles
 
+from api.admission import limiters
+from api.audio_formats import DEFAULT_AUDIO_FORMAT, MP3, AudioFormat
+from api.clients import DEEPGRAM_BASE_URL, RIME_BASE_URL, provider_clients
+from api.layout import VO_DIR, write_path
+from api.metrics import provider_bytes_total, span
+from api.tts_cache import TTSCache, tts_cache
+from api.tts_router import TTSError, TTSProvider, TTSRouter
+
 load_dotenv()
 
 VoiceName = Literal["tanya", "ana", "joy", "brittany", "tyler"]
 
-tts_base_url = "https://users.rime.ai/v1/rime-tts"
+# The interviewer's voice
+DEFAULT_SPEAKER: VoiceName = "joy"
+
+tts_base_url = f"{RIME_BASE_URL}/rime-tts"
 RIME_API_KEY = os.environ.get("RIME_API_KEY")
 
 deepgram_api_key = os.environ.get("DEEPGRAM_API_KEY")
-deepgram_client = DeepgramClient(deepgram_api_key)
+
+DEEPGRAM_TTS_MODEL = "aura-asteria-en"
+RIME_TTS_MODEL = "mist"
 
 
-async def generate_tts_rime(
+async def synthesize_rime(
     speaker: str = "tanya",
     text: str = "",
-    id: str = "",
-    model_id: str = "mist",
-    audio_format: str = "mp3",
+    audio_format: AudioFormat = MP3,
+    model_id: str = RIME_TTS_MODEL,
     sampling_rate: int = 22050,
     speed_alpha: float = 1.0,
     reduce_latency: bool = False,
-) -> None:
+) -> bytes:
     """
-    Generate text-to-speech audio using the Rime API.
+    Synthesize speech using the Rime API.
 
     Args:
         speaker (str): The voice to use for TTS. Default is "tanya".
         text (str): The text to convert to speech.
-        id (str): Unique identifier for the generated audio file.
+        audio_format (AudioFormat): The format of the output audio. Default is MP3.
         model_id (str): The model to use for TTS. Default is "mist".
-        audio_format (str): The format of the output audio. Default is "mp3".
         sampling_rate (int): The sampling rate of the output audio. Default is 22050.
         speed_alpha (float): The speed of the speech. Default is 1.0.
         reduce_latency (bool): Whether to reduce latency. Default is False.
 
+    Returns:
+        bytes: The synthesized audio.
+
     Raises:
-        ValueError: If the normalized text exceeds 1000 characters.
+        ValueError: If the normalized text exceeds 1000 characters, or Rime
+            does not support the audio format.
     """
+    if audio_format.rime_audio_format is None:
+        raise ValueError(f"Rime does not support {audio_format.name} output")
+
     payload = {
         "speaker": speaker,
         "text": text.replace("\n", " "),
         "modelId": model_id,
-        "audioFormat": audio_format,
+        "audioFormat": audio_format.rime_audio_format,
         "samplingRate": sampling_rate,
         "speedAlpha": speed_alpha,
         "reduceLatency": reduce_latency,
@@ -65,34 +82,31 @@ async def generate_tts_rime(
         "Content-Type": "application/json",
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(tts_base_url, json=payload, headers=headers)
-            response.raise_for_status()
-
-            ascii_mp3 = response.json()
-            audio_content = ascii_mp3["audioContent"]
-            audio_bytes = base64.b64decode(audio_content)
-
-            await write_audio(id=id, audio=audio_bytes)
-        except httpx.HTTPStatusError as e:
-            print(f"HTTP error occurred: {e}")
-        except Exception as e:
-            print(f"An error occurred: {e}")
+    async with limiters["rime"].slot():
+        response = await provider_clients.http.post(
+            tts_base_url, json=payload, headers=headers
+        )
+    response.raise_for_status()
+    audio = base64.b64decode(response.json()["audioContent"])
+    provider_bytes_total.inc(len(audio), provider="rime", direction="received")
+    return audio
 
 
-async def generate_tts_deepgram(
-    speaker: str = "aura-asteria-en",
+async def synthesize_deepgram(
+    speaker: str = DEEPGRAM_TTS_MODEL,
     text: str = "",
-    id: str = "",
-):
+    audio_format: AudioFormat = DEFAULT_AUDIO_FORMAT,
+) -> bytes:
     """
-    Generate text-to-speech audio using the Deepgram API.
+    Synthesize speech using the Deepgram API.
 
     Args:
         speaker (str): The voice to use for TTS. Default is "aura-asteria-en".
         text (str): The text to convert to speech.
-        id (str): Unique identifier for the generated audio file.
+        audio_format (AudioFormat): The format of the output audio.
+
+    Returns:
+        bytes: The synthesized audio.
 
     Raises:
         ValueError: If the text is empty.
@@ -100,29 +114,42 @@ async def generate_tts_deepgram(
     if not text:
         raise ValueError("Text is required")
 
-    try:
-        deepgram_options = SpeakOptions(model=speaker, encoding="linear16")
-        payload = {"text": text}
-        res = await deepgram_client.speak.asyncrest.v("1").stream_memory(
-            payload,
-            options=deepgram_options,
+    deepgram_options = SpeakOptions(
+        model=speaker,
+        encoding=audio_format.deepgram_encoding,
+        container=audio_format.deepgram_container,
+    )
+    payload = {"text": text}
+    async with limiters["deepgram"].slot():
+        res = await provider_clients.http.post(
+            f"{DEEPGRAM_BASE_URL}/speak",
+            params=deepgram_options.to_dict(),
+            headers={"Authorization": f"Token {deepgram_api_key}"},
+            json=payload,
         )
-        await write_audio(id=id, audio=res.stream_memory.getbuffer())
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    res.raise_for_status()
+    provider_bytes_total.inc(
+        len(res.content), provider="deepgram", direction="received"
+    )
+    return res.content
 
 
-async def write_audio(id: str, audio: bytes) -> None:
+async def write_audio(
+    id: str, audio: bytes, audio_format: AudioFormat = DEFAULT_AUDIO_FORMAT
+) -> None:
     """
     Write audio data to a file.
 
     Args:
         id (str): Unique identifier for the audio file.
         audio (bytes): The audio data to write.
+        audio_format (AudioFormat): The format of the audio data.
     """
-    async with aiofiles.open(f"public/vo/{id}.wav", "wb") as out:
-        await out.write(audio)
-        await out.flush()
+    with span("file_write"):
+        path = write_path(VO_DIR, audio_format.filename(id))
+        async with aiofiles.open(path, "wb") as out:
+            await out.write(audio)
+            await out.flush()
 
 
 def clean_tts_text(text: str) -> str:
@@ -138,14 +165,133 @@ def clean_tts_text(text: str) -> str:
     return text.replace("*", " ").replace("~", " ").replace("\n", "...")
 
 
-async def generate_tts(speaker: str, text: str, id: str) -> None:
+tts_router = TTSRouter(
+    [
+        TTSProvider(
+            name="deepgram",
+            synthesize=lambda speaker, text, audio_format: synthesize_deepgram(
+                text=text, audio_format=audio_format
+            ),
+            # Deepgram has a single interviewer voice, whatever the speaker
+            voice=lambda speaker: DEEPGRAM_TTS_MODEL,
+        ),
+        TTSProvider(
+            name="rime",
+            synthesize=lambda speaker, text, audio_format: synthesize_rime(
+                speaker=speaker, text=text, audio_format=audio_format
+            ),
+            supports=lambda audio_format: audio_format.rime_audio_format is not None,
+            voice=lambda speaker: f"{RIME_TTS_MODEL}/{speaker}",
+        ),
+    ]
+)
+
+
+class _FallbackAudio(Exception):
+    """Carries audio from a fallback provider, which is never cached."""
+
+    def __init__(self, provider: TTSProvider, audio: bytes):
+        super().__init__(f"Synthesized by fallback provider {provider.name}")
+        self.audio = audio
+
+
+async def generate_tts(
+    speaker: str,
+    text: str,
+    id: str,
+    audio_format: AudioFormat = DEFAULT_AUDIO_FORMAT,
+) -> None:
     """
     Generate text-to-speech audio.
 
+    Speech is synthesized through tts_router, so a slow or failing provider
+    is hedged or failed over. Audio for text that has been synthesized before
+    is served from the TTS cache instead of calling a provider again.
+
     Args:
-        speaker (str): The voice to use for TTS.
+        speaker (str): The voice to use for TTS, for providers with named voices.
         text (str): The text to convert to speech.
-        id (str): Unique identifier for the generated audio file.
+        id (str): Unique identifier for the generated audio file, which is
+            written to public/vo with the format's extension.
+        audio_format (AudioFormat): The format of the output audio.
+
+    Raises:
+        TTSError: If no provider could synthesize the text.
     """
-    # await generate_tts_rime(speaker=speaker, text=clean_tts_text(text), id=id)
-    await generate_tts_deepgram(text=clean_tts_text(text), id=id)
+    text = clean_tts_text(text)
+    if not text.strip():
+        raise TTSError("Text is required")
+
+    with span("tts"):
+        if not tts_cache.enabled:
+            _, audio = await tts_router.synthesize(speaker, text, audio_format)
+            await write_audio(id=id, audio=audio, audio_format=audio_format)
+            return
+
+        try:
+            cached_path = await synthesize_cached(speaker, text, audio_format)
+        except _FallbackAudio as e:
+            await write_audio(id=id, audio=e.audio, audio_format=audio_format)
+            return
+        await tts_cache.link(
+            cached_path, write_path(VO_DIR, audio_format.filename(id))
+        )
+
+
+async def synthesize_cached(
+    speaker: str, text: str, audio_format: AudioFormat
+) -> str:
+    """
+    Return the path of the cached audio for text, synthesizing it on a miss.
+
+    The cache only holds the preferred provider's rendering. Audio from a
+    fallback provider speaks with another voice, so caching it would keep
+    serving that voice after the preferred provider recovers.
+
+    Args:
+        speaker (str): The voice to use for TTS, for providers with named voices.
+        text (str): The text to synthesize, already cleaned with clean_tts_text.
+        audio_format (AudioFormat): The format of the audio.
+
+    Raises:
+        TTSError: If no provider could synthesize the text.
+        _FallbackAudio: If a fallback provider synthesized the audio.
+    """
+    preferred = tts_router.preferred(audio_format)
+    if preferred is None:
+        raise TTSError(f"No TTS provider available for {audio_format.name}")
+    key = TTSCache.make_key(
+        preferred.name, preferred.voice(speaker), audio_format.name, text
+    )
+
+    async def produce() -> bytes:
+        provider, audio = await tts_router.synthesize(speaker, text, audio_format)
+        if provider is not preferred:
+            raise _FallbackAudio(provider, audio)
+        return audio
+
+    return await tts_cache.get_or_create(
+        key, produce, extension=audio_format.extension
+    )
+
+
+async def presynthesize(
+    speaker: str, text: str, audio_format: AudioFormat = DEFAULT_AUDIO_FORMAT
+) -> None:
+    """
+    Synthesize text into the TTS cache ahead of its first use.
+
+    Later generate_tts calls for the same text and format link the cached
+    audio into public/vo instead of calling a provider.
+
+    Raises:
+        TTSError: If no provider could synthesize the text.
+    """
+    text = clean_tts_text(text)
+    if not text.strip():
+        raise TTSError("Text is required")
+    try:
+        await synthesize_cached(speaker, text, audio_format)
+    except _FallbackAudio:
+        # The preferred provider will be tried again on first use
+        pass
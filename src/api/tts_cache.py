@@ -0,0 +1,193 @@
+"""
+Content-addressed cache for synthesized voice output.
+
+Interviewers repeat themselves a lot ("Can you elaborate?"), so synthesized
+audio is stored under a hash of everything that determines its bytes and
+hard-linked into public/vo on a hit instead of calling the provider again.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict
+
+import aiofiles
+
+from api.metrics import span
+
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", "public/tts_cache")
+
+# Total size of cached audio before least recently used entries are evicted.
+# Set to 0 to disable the cache.
+TTS_CACHE_MAX_BYTES = int(
+    os.environ.get("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024))
+)
+
+
+class _ProducerCancelled(Exception):
+    """Set on an in-flight entry whose producing request was cancelled."""
+
+
+class TTSCache:
+    """
+    An LRU, size-bounded cache of audio files keyed by content hash.
+
+    Concurrent misses for the same key share a single provider call.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        # Sizes of the cached files, keyed by "<key>.<extension>"
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loaded = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(provider: str, voice: str, encoding: str, text: str) -> str:
+        """
+        Build the cache key for a synthesis request.
+
+        Args:
+            provider (str): The TTS provider name.
+            voice (str): The voice or model used by the provider.
+            encoding (str): The audio encoding requested from the provider.
+            text (str): The text to synthesize, already cleaned with clean_tts_text.
+
+        Returns:
+            str: The hex digest identifying the audio.
+        """
+        material = json.dumps([provider, voice, encoding, text], ensure_ascii=False)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self) -> None:
+        """Index the files already on disk, least recently used first."""
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._size += size
+        self._loaded = True
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+    async def get_or_create(
+        self,
+        key: str,
+        producer: Callable[[], Awaitable[bytes]],
+        extension: str = "wav",
+    ) -> str:
+        """
+        Return the path of the cached audio for key, producing it on a miss.
+
+        Args:
+            key (str): The cache key from make_key.
+            producer (Callable[[], Awaitable[bytes]]): Synthesizes the audio.
+            extension (str): The file extension of the audio format.
+
+        Returns:
+            str: The path of the cached audio file.
+        """
+        self._load()
+
+        name = f"{key}.{extension}"
+        path = self.path(name)
+        if name in self._entries:
+            if os.path.exists(path):
+                self.hits += 1
+                self._entries.move_to_end(name)
+                return path
+            self._size -= self._entries.pop(name)
+
+        while (inflight := self._inflight.get(key)) is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except _ProducerCancelled:
+                # The request producing the audio went away, but this one
+                # still wants it: produce it here instead
+                continue
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # Mark the exception as retrieved when nobody else was waiting for it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            audio = await producer()
+
+            with span("file_write"):
+                tmp_path = f"{path}.tmp"
+                async with aiofiles.open(tmp_path, "wb") as out:
+                    await out.write(audio)
+                os.replace(tmp_path, path)
+
+            self._entries[name] = len(audio)
+            self._size += len(audio)
+            self._evict()
+            future.set_result(path)
+            return path
+        except asyncio.CancelledError:
+            # Only the producing request is cancelled, not those waiting on it
+            future.set_exception(_ProducerCancelled())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def link(self, cached_path: str, destination: str) -> None:
+        """
+        Expose a cached file at destination without copying it when possible.
+
+        A hard link keeps the audio served even after the cache evicts it.
+        """
+        try:
+            os.link(cached_path, destination)
+        except OSError:
+            await asyncio.to_thread(shutil.copyfile, cached_path, destination)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._size,
+        }
+
+
+tts_cache = TTSCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
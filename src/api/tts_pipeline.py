@@ -0,0 +1,166 @@
+"""
+Sentence-pipelined text-to-speech for streamed completions.
+
+Streamed completion tokens are split at sentence boundaries and every complete
+sentence is sent to TTS straight away, so the first sentence can be played
+while later ones are still being generated.
+"""
+
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+import aiofiles
+
+from api.audio_formats import DEFAULT_AUDIO_FORMAT, AudioFormat
+from api.layout import VO_DIR, write_path
+from api.tts import generate_tts
+from api.tts_router import TTSError
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of sentences being synthesized at once for a single reply.
+TTS_PIPELINE_CONCURRENCY = int(os.environ.get("TTS_PIPELINE_CONCURRENCY", "3"))
+
+# Sentences shorter than this are merged into the next one, so that short
+# fragments ("Great.") don't each pay for a separate TTS call.
+TTS_PIPELINE_MIN_SENTENCE_LENGTH = int(
+    os.environ.get("TTS_PIPELINE_MIN_SENTENCE_LENGTH", "24")
+)
+
+# Terminal punctuation (optionally followed by closing quotes or brackets) and
+# whitespace, or a line break.
+SENTENCE_BOUNDARY = re.compile(r"[.!?]+[\"')\]]*\s+|\n+")
+
+
+class SentenceSplitter:
+    """Incrementally split streamed text into complete sentences."""
+
+    def __init__(self, min_length: int = TTS_PIPELINE_MIN_SENTENCE_LENGTH):
+        self.min_length = min_length
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Add streamed text and return the sentences it completed.
+
+        Args:
+            text (str): The next piece of streamed text.
+
+        Returns:
+            List[str]: The sentences completed by this piece, in order.
+        """
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(self._buffer):
+            if match.end() - start < self.min_length:
+                continue
+            sentence = self._buffer[start : match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Return whatever text is left once the stream has finished."""
+        sentence = self._buffer.strip()
+        self._buffer = ""
+        return sentence or None
+
+
+@dataclass
+class AudioSegment:
+    index: int
+    id: str
+    text: str
+    # False when the sentence could not be synthesized
+    ok: bool = True
+
+
+class TTSPipeline:
+    """
+    Synthesize the sentences of a reply concurrently, preserving their order.
+
+    Each sentence is written as its own voice output file with the ID
+    "<vo_id>-<index>", and the reply as a whole is exposed as an M3U playlist
+    of those segments.
+    """
+
+    def __init__(
+        self,
+        speaker: str,
+        vo_id: str,
+        audio_format: AudioFormat = DEFAULT_AUDIO_FORMAT,
+        max_in_flight: int = TTS_PIPELINE_CONCURRENCY,
+    ):
+        self.speaker = speaker
+        self.vo_id = vo_id
+        self.audio_format = audio_format
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._pending: List[asyncio.Task] = []
+        self._count = 0
+        self.segments: List[AudioSegment] = []
+
+    def submit(self, text: str) -> None:
+        """Start synthesizing the next sentence of the reply."""
+        segment = AudioSegment(
+            index=self._count, id=f"{self.vo_id}-{self._count}", text=text
+        )
+        self._count += 1
+        self._pending.append(asyncio.create_task(self._synthesize(segment)))
+
+    async def _synthesize(self, segment: AudioSegment) -> AudioSegment:
+        async with self._semaphore:
+            try:
+                await generate_tts(
+                    speaker=self.speaker,
+                    text=segment.text,
+                    id=segment.id,
+                    audio_format=self.audio_format,
+                )
+            except TTSError as e:
+                logger.warning("Error synthesizing segment %s: %r", segment.id, e)
+                segment.ok = False
+            except Exception:
+                # E.g. a failed write; the rest of the reply still plays
+                logger.exception("Error synthesizing segment %s", segment.id)
+                segment.ok = False
+        return segment
+
+    def ready(self) -> List[AudioSegment]:
+        """Return the segments that have finished, in order, without waiting."""
+        segments = []
+        while self._pending and self._pending[0].done():
+            segments.append(self._pending.pop(0).result())
+        self.segments.extend(segments)
+        return segments
+
+    async def next(self) -> Optional[AudioSegment]:
+        """Wait for the next segment in order, or return None once all are done."""
+        if not self._pending:
+            return None
+        segment = await self._pending.pop(0)
+        self.segments.append(segment)
+        return segment
+
+    async def cancel(self) -> None:
+        """Cancel any segments that are still being synthesized."""
+        for task in self._pending:
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+        self._pending.clear()
+
+    async def write_playlist(self) -> None:
+        """Write the finished segments as the playlist <vo_id>.m3u in public/vo."""
+        lines = ["#EXTM3U"]
+        for segment in self.segments:
+            if segment.ok:
+                lines.append(self.audio_format.filename(segment.id))
+        path = write_path(VO_DIR, f"{self.vo_id}.m3u")
+        async with aiofiles.open(path, "w") as out:
+            await out.write("\n".join(lines) + "\n")
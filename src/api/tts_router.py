@@ -0,0 +1,196 @@
+"""
+Fault-tolerant routing of text-to-speech requests across providers.
+
+Providers are tried in priority order. Each attempt has a timeout and is
+retried with jittered backoff, and a circuit breaker takes a failing provider
+out of rotation for a while. When hedging is on and the current provider
+hasn't answered within its p95 latency, the next provider is started as well
+and whichever answers first wins. If every provider fails, TTSError is raised.
+
+The providers speak with different voices, so hedging is off by default:
+otherwise the interviewer's voice could change between the sentences of a
+single reply whenever the first provider is slow.
+"""
+
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from api.audio_formats import AudioFormat
+from api.resilience import (
+    CircuitBreaker,
+    FailoverError,
+    LatencyWindow,
+    backoff_delay,
+    failover,
+    guarded_call,
+)
+
+TTS_TIMEOUT_SECONDS = float(os.environ.get("TTS_TIMEOUT_SECONDS", "10"))
+TTS_RETRIES = int(os.environ.get("TTS_RETRIES", "1"))
+TTS_RETRY_BACKOFF_SECONDS = float(os.environ.get("TTS_RETRY_BACKOFF_SECONDS", "0.2"))
+TTS_BREAKER_FAILURES = int(os.environ.get("TTS_BREAKER_FAILURES", "5"))
+TTS_BREAKER_RESET_SECONDS = float(os.environ.get("TTS_BREAKER_RESET_SECONDS", "30"))
+
+TTS_HEDGE = os.environ.get("TTS_HEDGE", "false").lower() == "true"
+# Hedge delay used until a provider has TTS_HEDGE_MIN_SAMPLES latencies
+TTS_HEDGE_DEFAULT_DELAY_SECONDS = float(
+    os.environ.get("TTS_HEDGE_DEFAULT_DELAY_SECONDS", "2")
+)
+TTS_HEDGE_MIN_SAMPLES = int(os.environ.get("TTS_HEDGE_MIN_SAMPLES", "20"))
+
+
+class TTSError(Exception):
+    """Raised when no provider could synthesize the text."""
+
+
+Synthesizer = Callable[[str, str, AudioFormat], Awaitable[bytes]]
+
+
+@dataclass
+class TTSProvider:
+    name: str
+    # Called with the speaker, the text and the audio format
+    synthesize: Synthesizer
+    supports: Callable[[AudioFormat], bool] = lambda audio_format: True
+    # The provider's voice for a speaker, which determines how it sounds
+    voice: Callable[[str], str] = lambda speaker: speaker
+    timeout: float = TTS_TIMEOUT_SECONDS
+    breaker: CircuitBreaker = field(
+        default_factory=lambda: CircuitBreaker(
+            TTS_BREAKER_FAILURES, TTS_BREAKER_RESET_SECONDS
+        )
+    )
+    latencies: LatencyWindow = field(default_factory=LatencyWindow)
+    requests: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    wins: int = 0
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < TTS_HEDGE_MIN_SAMPLES:
+            return TTS_HEDGE_DEFAULT_DELAY_SECONDS
+        return self.latencies.percentile(0.95)
+
+
+class TTSRouter:
+    """Synthesizes speech with the first healthy provider that answers."""
+
+    def __init__(
+        self,
+        providers: List[TTSProvider],
+        retries: int = TTS_RETRIES,
+        retry_backoff: float = TTS_RETRY_BACKOFF_SECONDS,
+        hedge: bool = TTS_HEDGE,
+    ):
+        self.providers = providers
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.hedge = hedge
+        self.hedges = 0
+
+    def preferred(self, audio_format: AudioFormat) -> Optional[TTSProvider]:
+        """Return the provider tried first for a format, healthy or not."""
+        for provider in self.providers:
+            if provider.supports(audio_format):
+                return provider
+        return None
+
+    async def _attempt(
+        self, provider: TTSProvider, speaker: str, text: str, audio_format: AudioFormat
+    ) -> bytes:
+        async def synthesize() -> bytes:
+            audio = await provider.synthesize(speaker, text, audio_format)
+            if not audio:
+                raise TTSError(f"{provider.name} returned no audio")
+            return audio
+
+        return await guarded_call(
+            synthesize,
+            provider.timeout,
+            provider,
+            provider.latencies,
+            provider.name,
+            "tts",
+        )
+
+    async def _call(
+        self, provider: TTSProvider, speaker: str, text: str, audio_format: AudioFormat
+    ) -> bytes:
+        """Call a provider, retrying with backoff while its breaker allows."""
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt(provider, speaker, text, audio_format)
+            except Exception:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, self.retry_backoff))
+                if not provider.breaker.allow():
+                    raise
+
+    async def synthesize(
+        self, speaker: str, text: str, audio_format: AudioFormat
+    ) -> Tuple[TTSProvider, bytes]:
+        """
+        Synthesize speech, failing over and hedging across providers.
+
+        Args:
+            speaker (str): The voice to use, for providers with named voices.
+            text (str): The text to convert to speech.
+            audio_format (AudioFormat): The format of the output audio.
+
+        Returns:
+            Tuple[TTSProvider, bytes]: The provider that synthesized the
+            audio, and the audio.
+
+        Raises:
+            TTSError: If no provider could synthesize the text.
+        """
+        candidates = [
+            provider
+            for provider in self.providers
+            if provider.supports(audio_format) and provider.breaker.state != "open"
+        ]
+
+        def on_hedge() -> None:
+            self.hedges += 1
+
+        try:
+            provider, audio = await failover(
+                candidates,
+                lambda provider: self._call(provider, speaker, text, audio_format),
+                hedge_delay=(
+                    (lambda provider: provider.hedge_delay()) if self.hedge else None
+                ),
+                on_hedge=on_hedge,
+            )
+        except FailoverError as e:
+            if not e.failures:
+                raise TTSError(
+                    f"No TTS provider available for {audio_format.name}"
+                ) from None
+            raise TTSError(
+                "All TTS providers failed: "
+                + "; ".join(
+                    f"{provider.name}: {error!r}" for provider, error in e.failures
+                )
+            ) from None
+        provider.wins += 1
+        return provider, audio
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            provider.name: {
+                "requests": provider.requests,
+                "failures": provider.failures,
+                "timeouts": provider.timeouts,
+                "wins": provider.wins,
+                "p95_seconds": provider.latencies.percentile(0.95) or 0.0,
+                "error_rate": provider.latencies.error_rate,
+                "breaker_open": provider.breaker.state == "open",
+            }
+            for provider in self.providers
+        }
@@ -1,42 +1,137 @@
+import asyncio
 from copy import deepcopy
+import hashlib
+import logging
 import os
-from typing import Dict, List
-from openai import AsyncOpenAI
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from openai import NOT_GIVEN
 from dotenv import load_dotenv
 
+from api.admission import Overloaded, limiters
+from api.clients import provider_clients
+from api.metrics import observe_stage, provider_tokens_total, span
+from api.model_router import ModelRouter, analysis_router, chat_router
 from api.models import (
     AnalysisScore,
     Conversation,
     ConversationAnalysis,
     ConversationOverallAnalysis,
 )
+from api.resilience import backoff_delay
 
 load_dotenv()
 
-openai_client = AsyncOpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.environ.get("OPENROUTER_API_KEY"),
-    default_headers={
-        "HTTP-Referer": "https://tryleetpro.com",
-        "X-Title": "LeetPro - Practice Interviews Online",
-    },
-)
+logger = logging.getLogger(__name__)
 
 
-async def get_txt2txt_completion(messages: List[Dict[str, str]], model: str = "openai/gpt-4o-2024-08-06") -> str:
-    chat_completion = await openai_client.chat.completions.create(
-        model=model,
-        messages=messages,
+def record_usage(model_id: str, usage: Any) -> None:
+    """Count the tokens a completion's usage reports, if it reports any."""
+    if usage is None:
+        return
+    provider_tokens_total.inc(
+        usage.prompt_tokens or 0, provider=model_id, kind="prompt"
+    )
+    provider_tokens_total.inc(
+        usage.completion_tokens or 0, provider=model_id, kind="completion"
     )
-    print("OpenAI completion done")
 
-    try:
-        res = chat_completion.choices[0].message.content
-        return res
-    except Exception as e:
-        print("Error getting completion", e)
-        return ""
-    
+
+async def get_txt2txt_completion(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    response_format: Optional[Dict[str, Any]] = None,
+    router: ModelRouter = chat_router,
+) -> str:
+    """
+    Get a chat completion, routed across the candidate models of a use case.
+
+    Args:
+        messages (List[Dict[str, str]]): The messages to send to the model.
+        model (str, optional): Use this OpenRouter model ID instead of the
+            router's candidates.
+        response_format (Dict[str, Any], optional): The response format.
+        router (ModelRouter): The use case's router. Default is chat_router.
+
+    Returns:
+        str: The completion's content.
+
+    Raises:
+        LLMError: If no model produced a completion.
+        Overloaded: If OpenRouter calls are being shed.
+    """
+
+    async def complete(model_id: str) -> str:
+        chat_completion = await provider_clients.openai.chat.completions.create(
+            model=model_id,
+            messages=messages,
+            response_format=response_format or NOT_GIVEN,
+        )
+        record_usage(model_id, chat_completion.usage)
+        content = chat_completion.choices[0].message.content
+        if not content:
+            raise ValueError(f"{model_id} returned an empty completion")
+        return content
+
+    with span(f"llm_{router.name}"):
+        # One slot per completion, however many models the router tries
+        async with limiters["openrouter"].slot():
+            return await router.run(complete, models=[model] if model else None)
+
+
+async def stream_txt2txt_completion(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    router: ModelRouter = chat_router,
+) -> AsyncIterator[str]:
+    """
+    Stream a chat completion, yielding content tokens as they arrive.
+
+    Falls back to the router's next candidate until the first token arrives.
+
+    Args:
+        messages (List[Dict[str, str]]): The messages to send to the model.
+        model (str, optional): Use this OpenRouter model ID instead of the
+            router's candidates.
+        router (ModelRouter): The use case's router. Default is chat_router.
+
+    Yields:
+        str: The next non-empty piece of the completion's content.
+    """
+
+    async def open_stream(model_id: str) -> AsyncIterator[str]:
+        stream = await provider_clients.openai.chat.completions.create(
+            model=model_id,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        # Closes the response when the router falls back, the client goes
+        # away or the completion ends, instead of leaving the connection open
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    # The final chunk carries the usage and no choices
+                    record_usage(model_id, getattr(chunk, "usage", None))
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    yield token
+
+    start = time.perf_counter()
+    first = True
+    async with limiters["openrouter"].slot():
+        async for token in router.stream(
+            open_stream, models=[model] if model else None
+        ):
+            if first:
+                observe_stage(
+                    f"llm_{router.name}_first_token", time.perf_counter() - start
+                )
+                first = False
+            yield token
+    observe_stage(f"llm_{router.name}", time.perf_counter() - start)
 
 
 
@@ -206,112 +301,415 @@ def calculate_score(verdict: str) -> int:
         return 40
     elif "Neutral" in verdict:
         return 60
-    elif "Strong" in verdict:
-        return 80
     elif "Very Strong" in verdict:
         return 100
+    elif "Strong" in verdict:
+        return 80
     else:
         return 0
 
 
-async def analyze_conversation(
+# "per_criterion" grades each rubric criterion with its own completion,
+# "structured" grades every criterion in a single JSON-schema completion.
+ANALYSIS_MODE = os.environ.get("ANALYSIS_MODE", "per_criterion")
+
+# Structured mode needs a model that supports json_schema response formats
+ANALYSIS_STRUCTURED_MODEL = os.environ.get(
+    "ANALYSIS_STRUCTURED_MODEL", "openai/gpt-4o-2024-08-06"
+)
+
+VERDICTS = ["Very Weak or Missing", "Weak", "Neutral", "Strong", "Very Strong"]
+
+# Called with (completed, total) steps as an analysis makes progress
+AnalysisProgress = Callable[[int, int], None]
+
+# Maximum number of rubric completions in flight for a single analysis.
+ANALYSIS_CONCURRENCY = int(os.environ.get("ANALYSIS_CONCURRENCY", "4"))
+
+# Times a failed rubric completion is retried before its criterion is left
+# ungraded, and the base delay between the retries.
+ANALYSIS_RETRIES = int(os.environ.get("ANALYSIS_RETRIES", "1"))
+ANALYSIS_RETRY_BACKOFF_SECONDS = float(
+    os.environ.get("ANALYSIS_RETRY_BACKOFF_SECONDS", "1")
+)
+
+ANALYSIS_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are an expert at evaluating product management interviews. Your task is to analyze a conversation and provide a grade based on specific criteria, along with justification from the conversation.",
+}
+
+# Prompt templates of the grading completions. They are part of
+# analysis_cache_key, so editing one invalidates the cached analyses.
+CRITERION_PROMPT = "Please evaluate the following conversation based on the criterion '{criterion}'. Use the following rubric:\n\n{rubric}\n\nProvide your verdict (e.g. 'Very Weak or Missing', 'Strong') and justify it with specific examples from the conversation. Please provide your verdict on one line and justrification on two different lines. For justification, use direct quotes from the conversation when possible."
+OVERALL_FEEDBACK_PROMPT = "Based on your analysis of the conversation, please provide an overall feedback summary."
+STRUCTURED_PROMPT = "Please evaluate the following conversation against each of these criteria, using the rubric given for each one:\n\n{rubrics}\n\nFor every criterion, provide your verdict (one of {verdicts}) and justify it with specific examples from the conversation, using direct quotes when possible. Then provide an overall feedback summary."
+
+# Bump to invalidate the cached analyses when grading changes in a way the
+# prompts and rubrics don't show, e.g. how verdicts are scored
+ANALYSIS_VERSION = 1
+
+
+def format_transcript(conversation: Conversation) -> str:
+    """
+    Flatten a conversation into the transcript sent to the grading model.
+
+    System messages are intentionally ignored.
+    """
+    conversation_messages = ""
+    for msg in conversation.messages:
+        if msg.role == "user":
+            conversation_messages += f"User: {msg.content}\n"
+        elif msg.role == "assistant":
+            conversation_messages += f"Assistant: {msg.content}\n"
+    return conversation_messages
+
+
+async def evaluate_criterion(
+    criterion: str,
+    rubric: Dict[str, str],
+    transcript: str,
+    semaphore: asyncio.Semaphore,
+) -> AnalysisScore:
+    """
+    Grade the transcript against a single rubric criterion.
+
+    Raises:
+        ValueError: If the model returned no usable verdict.
+    """
+    user_message = {
+        "role": "user",
+        "content": CRITERION_PROMPT.format(criterion=criterion, rubric=rubric),
+    }
+    messages = [
+        ANALYSIS_SYSTEM_MESSAGE,
+        {"role": "user", "content": transcript},
+        user_message,
+    ]
+
+    async with semaphore:
+        analysis_result = await get_txt2txt_completion(
+            messages, router=analysis_router
+        )
+
+    # The verdict is on the first line and the justification follows it
+    verdict, _, justification = analysis_result.strip().partition("\n")
+    if not verdict:
+        raise ValueError(f"Empty verdict for criterion {criterion}")
+
+    return AnalysisScore(
+        name=criterion,
+        description=rubric["criteria"],
+        human_name=rubric["human_name"],
+        score=calculate_score(verdict.strip()),
+        feedback=justification.strip(),
+    )
+
+
+async def get_overall_feedback(transcript: str, semaphore: asyncio.Semaphore) -> str:
+    """Ask the grading model for an overall feedback summary of the transcript."""
+    overall_feedback_message = {
+        "role": "user",
+        "content": OVERALL_FEEDBACK_PROMPT,
+    }
+    messages = [
+        ANALYSIS_SYSTEM_MESSAGE,
+        {"role": "user", "content": transcript},
+        overall_feedback_message,
+    ]
+
+    async with semaphore:
+        return await get_txt2txt_completion(messages, router=analysis_router)
+
+
+async def with_retries(
+    step: Callable[[], Awaitable[Any]], retries: int = ANALYSIS_RETRIES
+) -> Any:
+    """
+    Run one completion of an analysis, retrying it when it fails.
+
+    Overloaded is never retried here: the analysis job is requeued instead.
+
+    Raises:
+        Exception: The error of the last attempt.
+    """
+    for attempt in range(1, retries + 2):
+        try:
+            return await step()
+        except Overloaded:
+            raise
+        except Exception as e:
+            if attempt > retries:
+                raise
+            logger.warning("Analysis step failed, retrying: %r", e)
+            await asyncio.sleep(backoff_delay(attempt, ANALYSIS_RETRY_BACKOFF_SECONDS))
+
+
+async def analyze_conversation_per_criterion(
     conversation: Conversation,
+    progress: Optional[AnalysisProgress] = None,
 ) -> ConversationOverallAnalysis:
+    """
+    Grade a conversation with one completion per rubric criterion.
 
+    The per-criterion completions run concurrently (bounded by
+    ANALYSIS_CONCURRENCY) and each one is retried ANALYSIS_RETRIES times on
+    its own. A criterion that still fails is left ungraded (None) and out of
+    the overall score, and the overall feedback likewise, so one bad call
+    doesn't sink the rest of the analysis.
 
-    analysis_model = "cohere/command-r-plus-08-2024"
+    Raises:
+        LLMError: If no criterion could be graded.
+        ValueError: If no criterion could be graded.
+        Overloaded: If OpenRouter calls are being shed.
+    """
     # Make a copy of default_conversation_overall_analysis
     conversation_overall_analysis = deepcopy(default_conversation_overall_analysis)
 
     # Add the conversation to the conversation_overall_analysis
     conversation_overall_analysis.conversation = conversation
 
-    # Prepare messages for the LLM
-    system_message = {
-        "role": "system",
-        "content": "You are an expert at evaluating product management interviews. Your task is to analyze a conversation and provide a grade based on specific criteria, along with justification from the conversation.",
-    }
+    transcript = format_transcript(conversation)
+    semaphore = asyncio.Semaphore(ANALYSIS_CONCURRENCY)
+    errors: List[Exception] = []
 
-    # Iterate through each rubric criterion
-    for criterion, rubric in RUBRICS.items():
-        user_message = {
-            "role": "user",
-            "content": f"Please evaluate the following conversation based on the criterion '{criterion}'. Use the following rubric:\n\n{rubric}\n\nProvide your verdict (e.g. 'Very Weak or Missing', 'Strong') and justify it with specific examples from the conversation. Please provide your verdict on one line and justrification on two different lines. For justification, use direct quotes from the conversation when possible.",
-        }
-
-        # Prepare the conversation for the LLM
-        # intentionally ignore system messages
-        conversation_messages = ""
-        for msg in conversation["messages"]:
-            if msg["role"] == "user":
-                conversation_messages += f"User: {msg['content']}\n"
-            elif msg["role"] == "assistant":
-                conversation_messages += f"Assistant: {msg['content']}\n"
-
-        # Combine all messages
-        messages = [
-            system_message,
-            {"role": "user", "content": conversation_messages},
-            user_message,
-        ]
-
-        print("messages", messages)
-        # Get the LLM's analysis
-        analysis_result = await get_txt2txt_completion(messages, model=analysis_model)
-        print("analysis_result", analysis_result)
-
-        # Parse the result (assuming the LLM returns the verdict in the first line and justification after)
-        verdict, justification = analysis_result.split("\n", 1)
-        verdict = verdict.strip()
-        justification = justification.strip()
-
-        # Map the criterion to the corresponding field in ConversationAnalysis
-        field_mapping = {
-            "business_acumen": "business_acumen",
-            "user_centricity": "user_centricity",
-            "product_vision": "product_vision",
-            "clarifying_questions": "clarifying_questions",
-            "ability_to_discuss_tradeoffs_and_possible_errors": "ability_to_discuss_tradeoffs_and_possible_errors",
-            "passion_and_creativity": "passion_and_creativity",
-            "communication": "communication",
-            "collaboration": "collaboration",
-        }
-
-        field = field_mapping.get(criterion)
-        if field:
-            setattr(
-                conversation_overall_analysis.analysis,
-                field,
-                AnalysisScore(
-                    name=criterion,
-                    description=rubric["criteria"],
-                    human_name=rubric["human_name"],
-                    score=calculate_score(verdict),
-                    feedback=justification,
-                ),
+    async def grade(
+        criterion: str, rubric: Dict[str, str]
+    ) -> Tuple[str, Optional[AnalysisScore]]:
+        try:
+            analysis_score = await with_retries(
+                lambda: evaluate_criterion(criterion, rubric, transcript, semaphore)
             )
+        except Overloaded:
+            raise
+        except Exception as e:
+            logger.warning("Could not grade criterion %s: %r", criterion, e)
+            errors.append(e)
+            return criterion, None
+        return criterion, analysis_score
 
-    # Calculate overall score and feedback
-    scores = [
-        getattr(conversation_overall_analysis.analysis, field).score
-        for field in field_mapping.values()
-        if hasattr(conversation_overall_analysis.analysis, field)
+    async def overall_feedback() -> Optional[str]:
+        try:
+            return await with_retries(
+                lambda: get_overall_feedback(transcript, semaphore)
+            )
+        except Overloaded:
+            raise
+        except Exception as e:
+            logger.warning("Could not get the overall feedback: %r", e)
+            return None
+
+    # The overall feedback only needs the transcript, so it is started first
+    overall_feedback_task = asyncio.create_task(overall_feedback())
+    criterion_tasks = [
+        asyncio.create_task(grade(criterion, rubric))
+        for criterion, rubric in RUBRICS.items()
     ]
+
+    # Every criterion plus the overall feedback
+    total = len(RUBRICS) + 1
+    scores = []
+    try:
+        for completed, next_result in enumerate(
+            asyncio.as_completed(criterion_tasks), start=1
+        ):
+            criterion, analysis_score = await next_result
+            if progress:
+                progress(completed, total)
+            setattr(conversation_overall_analysis.analysis, criterion, analysis_score)
+            if analysis_score is not None:
+                scores.append(analysis_score.score)
+
+        conversation_overall_analysis.overall_feedback = await overall_feedback_task
+    finally:
+        # Nothing is left running if the calls were shed or we were cancelled
+        tasks = [*criterion_tasks, overall_feedback_task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if not scores:
+        raise errors[0]
     conversation_overall_analysis.overall_score = sum(scores) // len(scores)
+    if progress:
+        progress(total, total)
 
-    overall_feedback_message = {
+    return conversation_overall_analysis
+
+
+def build_analysis_response_format() -> Dict[str, Any]:
+    """Build the json_schema response format covering every rubric criterion."""
+    criterion_schema = {
+        "type": "object",
+        "properties": {
+            "verdict": {"type": "string", "enum": VERDICTS},
+            "feedback": {"type": "string"},
+        },
+        "required": ["verdict", "feedback"],
+        "additionalProperties": False,
+    }
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "conversation_analysis",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    **{criterion: criterion_schema for criterion in RUBRICS},
+                    "overall_feedback": {"type": "string"},
+                },
+                "required": [*RUBRICS, "overall_feedback"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def parse_structured_analysis(analysis_result: str) -> ConversationOverallAnalysis:
+    """
+    Validate a structured analysis completion into the analysis models.
+
+    Raises:
+        ValueError: If the completion does not match the analysis schema.
+    """
+    data = json.loads(analysis_result)
+    if not isinstance(data, dict):
+        raise ValueError("Structured analysis is not a JSON object")
+
+    overall_feedback = data.get("overall_feedback")
+    if not isinstance(overall_feedback, str):
+        raise ValueError("Structured analysis is missing overall_feedback")
+
+    analysis = ConversationAnalysis()
+    for criterion, rubric in RUBRICS.items():
+        result = data.get(criterion)
+        if not isinstance(result, dict):
+            raise ValueError(f"Structured analysis is missing {criterion}")
+        verdict = result.get("verdict")
+        feedback = result.get("feedback")
+        if verdict not in VERDICTS or not isinstance(feedback, str):
+            raise ValueError(f"Invalid structured result for {criterion}")
+
+        setattr(
+            analysis,
+            criterion,
+            AnalysisScore(
+                name=criterion,
+                description=rubric["criteria"],
+                human_name=rubric["human_name"],
+                score=calculate_score(verdict),
+                feedback=feedback.strip(),
+            ),
+        )
+
+    scores = [getattr(analysis, criterion).score for criterion in RUBRICS]
+    return ConversationOverallAnalysis(
+        conversation=Conversation(messages=[]),
+        analysis=analysis,
+        overall_score=sum(scores) // len(scores),
+        overall_feedback=overall_feedback.strip(),
+    )
+
+
+async def analyze_conversation_structured(
+    conversation: Conversation,
+    progress: Optional[AnalysisProgress] = None,
+) -> ConversationOverallAnalysis:
+    """
+    Grade a conversation against every rubric criterion in a single completion.
+
+    The transcript is sent once and the model answers with a JSON object
+    holding a verdict and feedback per criterion plus the overall feedback.
+
+    Raises:
+        ValueError: If the completion does not match the analysis schema.
+    """
+    rubric_text = "\n\n".join(
+        f"Criterion '{criterion}' ({rubric['human_name']}):{rubric['criteria']}"
+        for criterion, rubric in RUBRICS.items()
+    )
+    user_message = {
         "role": "user",
-        "content": "Based on your analysis of the conversation, please provide an overall feedback summary.",
+        "content": STRUCTURED_PROMPT.format(
+            rubrics=rubric_text, verdicts=", ".join(VERDICTS)
+        ),
     }
     messages = [
-        system_message,
-        {"role": "user", "content": conversation_messages},
-        overall_feedback_message,
+        ANALYSIS_SYSTEM_MESSAGE,
+        {"role": "user", "content": format_transcript(conversation)},
+        user_message,
     ]
 
-    conversation_overall_analysis.overall_feedback = await get_txt2txt_completion(
+    analysis_result = await get_txt2txt_completion(
         messages,
-        model=analysis_model,
+        model=ANALYSIS_STRUCTURED_MODEL,
+        response_format=build_analysis_response_format(),
+        router=analysis_router,
     )
 
+    conversation_overall_analysis = parse_structured_analysis(analysis_result)
+    conversation_overall_analysis.conversation = conversation
+    if progress:
+        progress(1, 1)
     return conversation_overall_analysis
+
+
+def analysis_cache_key(conversation: Conversation) -> str:
+    """
+    Build the key under which a conversation's analysis is cached.
+
+    The key covers the transcript the graders see, so saves of the same
+    conversation share it regardless of message IDs and timestamps, plus the
+    rubrics, prompt templates, verdicts, mode, models and ANALYSIS_VERSION,
+    so changing any of them invalidates earlier results.
+
+    Returns:
+        str: The hex digest identifying the analysis.
+    """
+    models = analysis_router.models
+    if ANALYSIS_MODE == "structured":
+        models = [ANALYSIS_STRUCTURED_MODEL, *models]
+    material = json.dumps(
+        [
+            ANALYSIS_VERSION,
+            ANALYSIS_MODE,
+            models,
+            RUBRICS,
+            VERDICTS,
+            ANALYSIS_SYSTEM_MESSAGE,
+            CRITERION_PROMPT,
+            OVERALL_FEEDBACK_PROMPT,
+            STRUCTURED_PROMPT,
+            format_transcript(conversation),
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+async def analyze_conversation(
+    conversation: Conversation,
+    progress: Optional[AnalysisProgress] = None,
+) -> ConversationOverallAnalysis:
+    """
+    Grade a conversation using the analysis mode selected by ANALYSIS_MODE.
+
+    If the structured completion fails or does not validate, the analysis
+    falls back to the per-criterion mode.
+
+    Args:
+        conversation (Conversation): The conversation to grade.
+        progress (AnalysisProgress, optional): Called with (completed, total)
+            as the analysis makes progress.
+    """
+    if ANALYSIS_MODE == "structured":
+        try:
+            return await analyze_conversation_structured(conversation, progress)
+        except Overloaded:
+            # Grading per criterion would only be shed as well
+            raise
+        except Exception as e:
+            logger.warning("Structured analysis failed, grading per criterion: %r", e)
+
+    return await analyze_conversation_per_criterion(conversation, progress)
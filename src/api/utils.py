@@ -1,5 +1,23 @@
+from typing import Any
+
 from uuid_extensions import uuid7str
 
+from api.codec import encode
+
 
 def generate_uuid() -> str:
     return uuid7str()
+
+
+def format_sse(event: str, data: Any) -> bytes:
+    """
+    Format a Server-Sent Event with a JSON payload.
+
+    Args:
+        event (str): The event name.
+        data (Any): A JSON-serializable payload.
+
+    Returns:
+        bytes: The encoded event, ready to be written to the response.
+    """
+    return b"event: %s\ndata: %s\n\n" % (event.encode(), encode(data))
@@ -0,0 +1,149 @@
+"""
+Startup warmup.
+
+Right after a deploy or scale-up the first requests would pay the DNS, TCP
+and TLS setup to every provider and synthesize the interviewer's fixed lines
+live. When the app starts serving, the warmup opens pooled connections to
+the providers and pre-synthesizes WARMUP_UTTERANCES into the TTS cache, and
+/health fails until it is done, so load balancers only route candidates to
+warm instances. Afterwards the connections are kept open by pinging each
+provider every WARMUP_KEEPALIVE_INTERVAL_SECONDS.
+
+A warmup that fails or runs past WARMUP_TIMEOUT_SECONDS still marks the
+instance ready: a cold instance is better than one that never serves.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+from api.admission import BATCH, traffic_class
+from api.audio_formats import AUDIO_FORMATS, VO_FORMAT, AudioFormat
+from api.clients import PROVIDER_KEEPALIVE_EXPIRY, provider_clients
+from api.tts import DEFAULT_SPEAKER, presynthesize
+from api.tts_cache import tts_cache
+
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "true").lower() == "true"
+# Connections opened to each provider
+WARMUP_CONNECTIONS = int(os.environ.get("WARMUP_CONNECTIONS", "4"))
+# Fixed interviewer lines, separated by "|". Streamed replies are synthesized
+# sentence by sentence, so list single sentences.
+WARMUP_UTTERANCES = [
+    utterance.strip()
+    for utterance in os.environ.get("WARMUP_UTTERANCES", "").split("|")
+    if utterance.strip()
+]
+# Comma-separated voice output formats to pre-synthesize them in
+WARMUP_FORMATS = [
+    AUDIO_FORMATS[name.strip()]
+    for name in os.environ.get("WARMUP_FORMATS", VO_FORMAT).split(",")
+    if name.strip() in AUDIO_FORMATS
+]
+WARMUP_TIMEOUT_SECONDS = float(os.environ.get("WARMUP_TIMEOUT_SECONDS", "30"))
+# Below the pool's keep-alive expiry, so idle connections never expire.
+# Set to 0 to stop pinging after the warmup.
+WARMUP_KEEPALIVE_INTERVAL_SECONDS = float(
+    os.environ.get(
+        "WARMUP_KEEPALIVE_INTERVAL_SECONDS", str(PROVIDER_KEEPALIVE_EXPIRY / 2)
+    )
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Warms the instance up in the background and reports when it is ready."""
+
+    def __init__(
+        self,
+        utterances: List[str] = WARMUP_UTTERANCES,
+        audio_formats: List[AudioFormat] = WARMUP_FORMATS,
+        connections: int = WARMUP_CONNECTIONS,
+        timeout: float = WARMUP_TIMEOUT_SECONDS,
+        keepalive_interval: float = WARMUP_KEEPALIVE_INTERVAL_SECONDS,
+        enabled: bool = WARMUP_ENABLED,
+    ):
+        self.utterances = utterances
+        self.audio_formats = audio_formats
+        self.connections = connections
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+        self.enabled = enabled
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if not self.enabled:
+            self.ready = True
+        elif self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def warm_once(self) -> None:
+        """Open the provider connections and pre-synthesize the utterances."""
+        failures, _ = await asyncio.gather(
+            provider_clients.warm(self.connections), self._presynthesize()
+        )
+        if failures:
+            logger.warning("Warmup could not reach a provider %d times", failures)
+
+    async def _presynthesize(self) -> None:
+        if not self.utterances:
+            return
+        if not tts_cache.enabled:
+            logger.warning("The TTS cache is disabled, not pre-synthesizing")
+            return
+
+        jobs = [
+            (text, audio_format)
+            for text in self.utterances
+            for audio_format in self.audio_formats
+        ]
+        results = await asyncio.gather(
+            *(
+                presynthesize(DEFAULT_SPEAKER, text, audio_format)
+                for text, audio_format in jobs
+            ),
+            return_exceptions=True,
+        )
+        for (text, audio_format), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    "Could not pre-synthesize %r as %s: %r",
+                    text,
+                    audio_format.name,
+                    result,
+                )
+
+    async def _run(self) -> None:
+        # Leave provider slots to the candidates' requests if they come early
+        traffic_class.set(BATCH)
+
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self.warm_once(), self.timeout)
+            logger.info("Warmup finished in %.1fs", time.monotonic() - start)
+        except asyncio.TimeoutError:
+            logger.warning("Warmup timed out after %.0fs", self.timeout)
+        except Exception:
+            logger.exception("Error warming up")
+        self.ready = True
+
+        if not self.keepalive_interval:
+            return
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            try:
+                await provider_clients.warm(self.connections)
+            except Exception:
+                logger.exception("Error keeping provider connections alive")
+
+
+warmup = Warmup()
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from api.admission import (
+    BATCH,
+    INTERACTIVE,
+    Overloaded,
+    PriorityLimiter,
+    traffic_class,
+)
+
+
+async def hold(limiter, release, cls=INTERACTIVE, timeout=5.0, started=None):
+    traffic_class.set(cls)
+    async with limiter.slot(timeout):
+        if started is not None:
+            started.append(cls)
+        await release.wait()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_full_queue_is_shed():
+    async def main():
+        limiter = PriorityLimiter("test", limit=1, max_queue=1, enabled=True)
+        release = asyncio.Event()
+        holders = [asyncio.create_task(hold(limiter, release)) for _ in range(2)]
+        await settle()
+        assert limiter.in_use == 1
+        assert limiter.queue_depth(INTERACTIVE) == 1
+
+        with pytest.raises(Overloaded) as info:
+            await hold(limiter, release, timeout=2.0)
+        assert info.value.reason == "queue_full"
+        assert info.value.retry_after == 2.0
+
+        release.set()
+        await asyncio.gather(*holders)
+        assert limiter.in_use == 0
+
+    asyncio.run(main())
+
+
+def test_waiting_past_the_deadline_is_shed():
+    async def main():
+        limiter = PriorityLimiter("test", limit=1, enabled=True)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, release))
+        await settle()
+
+        with pytest.raises(Overloaded) as info:
+            await hold(limiter, release, timeout=0.01)
+        assert info.value.reason == "deadline"
+        assert limiter.queue_depth(INTERACTIVE) == 0
+
+        release.set()
+        await holder
+        assert limiter.in_use == 0
+
+    asyncio.run(main())
+
+
+def test_batch_calls_are_capped_at_their_share():
+    async def main():
+        limiter = PriorityLimiter("test", limit=4, batch_share=0.5, enabled=True)
+        release = asyncio.Event()
+        started = []
+        holders = [
+            asyncio.create_task(hold(limiter, release, BATCH, started=started))
+            for _ in range(3)
+        ]
+        holders.append(asyncio.create_task(hold(limiter, release, started=started)))
+        await settle()
+
+        assert started == [BATCH, BATCH, INTERACTIVE]
+        assert limiter.queue_depth(BATCH) == 1
+
+        release.set()
+        await asyncio.gather(*holders)
+        assert started == [BATCH, BATCH, INTERACTIVE, BATCH]
+
+    asyncio.run(main())
+
+
+def test_freed_slots_go_to_interactive_calls_first():
+    async def main():
+        limiter = PriorityLimiter("test", limit=1, enabled=True)
+        release = asyncio.Event()
+        started = []
+        holder = asyncio.create_task(hold(limiter, release))
+        await settle()
+        waiters = [
+            asyncio.create_task(hold(limiter, release, BATCH, started=started)),
+            asyncio.create_task(hold(limiter, release, started=started)),
+        ]
+        await settle()
+        assert started == []
+
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        assert started == [INTERACTIVE, BATCH]
+
+    asyncio.run(main())
+
+
+def test_disabled_limiter_admits_everything():
+    async def main():
+        limiter = PriorityLimiter("test", limit=1, max_queue=0, enabled=False)
+        release = asyncio.Event()
+        release.set()
+        await asyncio.gather(*(hold(limiter, release) for _ in range(5)))
+        assert limiter.in_use == 0
+
+    asyncio.run(main())
@@ -0,0 +1,179 @@
+import asyncio
+
+import pytest
+
+from api import txt2txt
+from api.admission import Overloaded
+from api.models import Conversation, Message
+from api.txt2txt import (
+    RUBRICS,
+    analysis_cache_key,
+    analyze_conversation_per_criterion,
+)
+
+CONVERSATION = Conversation(
+    messages=[
+        Message(role="assistant", content="How would you improve Google Maps?"),
+        Message(role="user", content="Who are the users we care about most?"),
+    ]
+)
+
+
+def criterion_of(messages) -> str:
+    prompt = messages[-1]["content"]
+    for criterion in RUBRICS:
+        if f"criterion '{criterion}'" in prompt:
+            return criterion
+    return "overall_feedback"
+
+
+class FakeGrader:
+    """Answers analysis completions, failing the calls it is told to."""
+
+    def __init__(self, monkeypatch, failures=None, delay=0.01):
+        # Number of times each criterion fails before succeeding
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        monkeypatch.setattr(txt2txt, "get_txt2txt_completion", self.complete)
+        monkeypatch.setattr(txt2txt, "ANALYSIS_RETRY_BACKOFF_SECONDS", 0)
+
+    async def complete(self, messages, router=None, **kwargs):
+        criterion = criterion_of(messages)
+        self.calls.append(criterion)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+
+        failure = self.failures.get(criterion)
+        if isinstance(failure, Exception):
+            raise failure
+        if failure:
+            self.failures[criterion] -= 1
+            raise ValueError(f"bad completion for {criterion}")
+        if criterion == "overall_feedback":
+            return "A thoughtful interview."
+        return f"Strong\nThe candidate did well on {criterion}."
+
+
+def analyze():
+    return asyncio.run(analyze_conversation_per_criterion(CONVERSATION))
+
+
+def test_criteria_are_graded_concurrently(monkeypatch):
+    monkeypatch.setattr(txt2txt, "ANALYSIS_CONCURRENCY", 4)
+    grader = FakeGrader(monkeypatch)
+
+    result = analyze()
+
+    assert grader.max_in_flight == 4
+    assert sorted(grader.calls) == sorted([*RUBRICS, "overall_feedback"])
+    assert result.overall_score == 80
+    assert result.overall_feedback == "A thoughtful interview."
+    for criterion in RUBRICS:
+        assert getattr(result.analysis, criterion).score == 80
+
+
+def test_failed_criterion_is_retried_alone(monkeypatch):
+    grader = FakeGrader(monkeypatch, failures={"communication": 1})
+
+    result = analyze()
+
+    assert grader.calls.count("communication") == 2
+    assert grader.calls.count("collaboration") == 1
+    assert result.analysis.communication.score == 80
+
+
+def test_criterion_that_keeps_failing_is_left_ungraded(monkeypatch):
+    grader = FakeGrader(
+        monkeypatch, failures={"communication": 10, "collaboration": 10}
+    )
+
+    result = analyze()
+
+    assert grader.calls.count("communication") == 1 + txt2txt.ANALYSIS_RETRIES
+    assert result.analysis.communication is None
+    assert result.analysis.collaboration is None
+    assert result.analysis.business_acumen.score == 80
+    # Ungraded criteria are left out of the average rather than counted as 0
+    assert result.overall_score == 80
+    assert result.overall_feedback == "A thoughtful interview."
+
+
+def test_failed_overall_feedback_keeps_the_scores(monkeypatch):
+    FakeGrader(monkeypatch, failures={"overall_feedback": 10})
+
+    result = analyze()
+
+    assert result.overall_feedback is None
+    assert result.overall_score == 80
+
+
+def test_analysis_fails_when_nothing_could_be_graded(monkeypatch):
+    FakeGrader(monkeypatch, failures={criterion: 10 for criterion in RUBRICS})
+
+    with pytest.raises(ValueError):
+        analyze()
+
+
+def test_shed_calls_fail_the_analysis_and_cancel_the_rest(monkeypatch):
+    grader = FakeGrader(
+        monkeypatch,
+        failures={"business_acumen": Overloaded("openrouter", "deadline", 1.0)},
+    )
+
+    async def complete(messages, **kwargs):
+        if criterion_of(messages) != "business_acumen":
+            await asyncio.sleep(10)
+        return await grader.complete(messages, **kwargs)
+
+    monkeypatch.setattr(txt2txt, "get_txt2txt_completion", complete)
+
+    async def main():
+        with pytest.raises(Overloaded):
+            await analyze_conversation_per_criterion(CONVERSATION)
+        # Shed calls aren't retried, and nothing is left running
+        assert grader.calls == ["business_acumen"]
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    asyncio.run(main())
+
+
+def test_cache_key_ignores_message_ids_and_timestamps():
+    resaved = Conversation(
+        messages=[
+            Message(role=msg.role, content=msg.content, id="other")
+            for msg in CONVERSATION.messages
+        ]
+    )
+
+    assert analysis_cache_key(resaved) == analysis_cache_key(CONVERSATION)
+
+
+@pytest.mark.parametrize(
+    "setting, value",
+    [
+        (
+            "RUBRICS",
+            {
+                **RUBRICS,
+                "communication": {**RUBRICS["communication"], "criteria": "Clear."},
+            },
+        ),
+        ("CRITERION_PROMPT", txt2txt.CRITERION_PROMPT + " Be strict."),
+        ("OVERALL_FEEDBACK_PROMPT", "Summarize the interview."),
+        ("STRUCTURED_PROMPT", txt2txt.STRUCTURED_PROMPT + " Be strict."),
+        ("ANALYSIS_VERSION", txt2txt.ANALYSIS_VERSION + 1),
+    ],
+)
+def test_cache_key_changes_with_the_rubrics_and_prompts(monkeypatch, setting, value):
+    key = analysis_cache_key(CONVERSATION)
+
+    monkeypatch.setattr(txt2txt, setting, value)
+
+    assert analysis_cache_key(CONVERSATION) != key
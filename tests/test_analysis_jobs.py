@@ -0,0 +1,191 @@
+import asyncio
+import importlib
+
+import pytest
+
+import api
+from api.admission import Overloaded
+from api.analysis_jobs import AnalysisJobManager
+from api.models import (
+    Conversation,
+    ConversationAnalysis,
+    ConversationOverallAnalysis,
+    Message,
+)
+
+# The module, which api's analysis_jobs singleton shadows as an attribute
+analysis_jobs = importlib.import_module("api.analysis_jobs")
+
+CONVERSATION = Conversation(
+    messages=[Message(role="user", content="Who are the users we care about?")]
+)
+
+
+class FakeAnalyzer:
+    """Stores analyses like run_conversation_analysis, once released."""
+
+    def __init__(self, monkeypatch, failures=None):
+        # Errors raised by the first runs, in order
+        self.failures = list(failures or [])
+        self.released = asyncio.Event()
+        self.calls = []
+        self.analyses = {}
+        monkeypatch.setattr(analysis_jobs, "run_conversation_analysis", self.run)
+
+    async def run(self, conversation_id, progress=None):
+        self.calls.append(conversation_id)
+        await self.released.wait()
+        if self.failures:
+            raise self.failures.pop(0)
+        progress(1, 1)
+        self.analyses[conversation_id] = ConversationOverallAnalysis(
+            conversation=CONVERSATION,
+            analysis=ConversationAnalysis(),
+            overall_score=80,
+            overall_feedback="A thoughtful interview.",
+        )
+
+
+def test_jobs_for_a_conversation_are_shared(monkeypatch):
+    async def main():
+        analyzer = FakeAnalyzer(monkeypatch)
+        jobs = AnalysisJobManager(workers=2)
+        await jobs.start()
+        try:
+            first = jobs.enqueue("a")
+            assert jobs.enqueue("a") is first
+            other = jobs.enqueue("b")
+            await asyncio.sleep(0)
+
+            analyzer.released.set()
+            await asyncio.wait_for(first.done.wait(), 1)
+            await asyncio.wait_for(other.done.wait(), 1)
+        finally:
+            await jobs.stop(drain_timeout=0)
+        return analyzer, first
+
+    analyzer, job = asyncio.run(main())
+
+    assert sorted(analyzer.calls) == ["a", "b"]
+    assert (job.status, job.progress) == ("done", 1.0)
+
+
+def test_failed_job_is_reported_then_retried(monkeypatch):
+    async def main():
+        analyzer = FakeAnalyzer(monkeypatch, failures=[ValueError("bad grade")])
+        analyzer.released.set()
+        jobs = AnalysisJobManager(workers=1)
+        await jobs.start()
+        try:
+            failed = jobs.enqueue("a")
+            await asyncio.wait_for(failed.done.wait(), 1)
+            assert (failed.status, failed.error) == ("failed", "bad grade")
+            # A failed job isn't shared: enqueuing again starts a new one
+            retried = jobs.enqueue("a")
+            assert retried is not failed
+            await asyncio.wait_for(retried.done.wait(), 1)
+            assert retried.status == "done"
+        finally:
+            await jobs.stop(drain_timeout=0)
+
+    asyncio.run(main())
+
+
+def test_shed_job_is_requeued_after_retry_after(monkeypatch):
+    async def main():
+        analyzer = FakeAnalyzer(
+            monkeypatch, failures=[Overloaded("openrouter", "queue full", 0.01)]
+        )
+        analyzer.released.set()
+        jobs = AnalysisJobManager(workers=1)
+        await jobs.start()
+        try:
+            job = jobs.enqueue("a")
+            await asyncio.wait_for(job.done.wait(), 1)
+        finally:
+            await jobs.stop(drain_timeout=0)
+        return analyzer, job
+
+    analyzer, job = asyncio.run(main())
+
+    assert analyzer.calls == ["a", "a"]
+    assert (job.status, job.retries) == ("done", 1)
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    analyzer = FakeAnalyzer(monkeypatch)
+    jobs = AnalysisJobManager(workers=1)
+    monkeypatch.setattr(api, "analysis_jobs", jobs)
+
+    async def get_conversation_analysis(conversation_id):
+        if conversation_id == "missing":
+            return None
+        return analyzer.analyses.get(
+            conversation_id,
+            ConversationOverallAnalysis(
+                conversation=CONVERSATION,
+                analysis=None,
+                overall_score=0,
+                overall_feedback="",
+            ),
+        )
+
+    monkeypatch.setattr(api, "get_conversation_analysis", get_conversation_analysis)
+    return analyzer, jobs
+
+
+def test_analysis_is_accepted_until_it_is_ready(jobs):
+    analyzer, manager = jobs
+
+    async def main():
+        client = api.app.test_client()
+        await manager.start()
+        try:
+            first = await client.get("/analysis/a")
+            second = await client.get("/analysis/a")
+            analyzer.released.set()
+            await asyncio.wait_for(manager.get("a").done.wait(), 1)
+            done = await client.get("/analysis/a")
+            return [
+                (response.status_code, await response.get_json())
+                for response in (first, second, done)
+            ]
+        finally:
+            await manager.stop(drain_timeout=0)
+
+    (first, first_body), (second, _), (done, done_body) = asyncio.run(main())
+
+    assert (first, second, done) == (202, 202, 200)
+    assert first_body == {"conversation_id": "a", "status": "queued", "progress": 0.0}
+    assert done_body["overall_score"] == 80
+    # Polling while the job was in flight didn't start a second analysis
+    assert analyzer.calls == ["a"]
+
+
+def test_unknown_conversation_is_not_found(jobs):
+    async def main():
+        response = await api.app.test_client().get("/analysis/missing")
+        return response.status_code
+
+    assert asyncio.run(main()) == 404
+
+
+def test_failed_analysis_is_reported_once(jobs):
+    analyzer, manager = jobs
+    analyzer.failures = [ValueError("bad grade")]
+    analyzer.released.set()
+
+    async def main():
+        client = api.app.test_client()
+        await manager.start()
+        try:
+            await client.get("/analysis/a")
+            await asyncio.wait_for(manager.get("a").done.wait(), 1)
+            failed = await client.get("/analysis/a")
+            retried = await client.get("/analysis/a")
+            return failed.status_code, retried.status_code
+        finally:
+            await manager.stop(drain_timeout=0)
+
+    assert asyncio.run(main()) == (502, 202)
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from werkzeug.datastructures import MIMEAccept
+
+import api
+from api.audio_formats import (
+    DEFAULT_AUDIO_FORMAT,
+    MP3,
+    OPUS,
+    WAV,
+    negotiate_audio_format,
+)
+
+CONVERSATION = {
+    "messages": [{"role": "user", "content": "Who are the users we care about?"}]
+}
+
+
+def test_format_parameter_takes_precedence():
+    assert negotiate_audio_format("MP3", MIMEAccept([("audio/ogg", 1)])) is MP3
+    assert negotiate_audio_format("opus") is OPUS
+
+
+def test_unsupported_format_parameter_is_rejected():
+    with pytest.raises(ValueError, match="flac"):
+        negotiate_audio_format("flac")
+
+
+def test_best_accepted_audio_type_is_chosen():
+    accept = MIMEAccept([("audio/wav", 0.5), ("audio/opus", 0.9), ("audio/mpeg", 0)])
+
+    assert negotiate_audio_format(None, accept) is OPUS
+
+
+def test_refused_and_non_audio_types_fall_back_to_the_default():
+    accept = MIMEAccept([("audio/mpeg", 0), ("application/json", 1), ("*/*", 0.1)])
+
+    assert negotiate_audio_format(None, accept) is DEFAULT_AUDIO_FORMAT
+    assert negotiate_audio_format(None) is DEFAULT_AUDIO_FORMAT
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    formats = []
+
+    async def get_txt2txt_completion(messages, **kwargs):
+        return "Tell me more."
+
+    async def generate_tts(speaker, text, id, audio_format):
+        formats.append(audio_format)
+
+    monkeypatch.setattr(api, "get_txt2txt_completion", get_txt2txt_completion)
+    monkeypatch.setattr(api, "generate_tts", generate_tts)
+    return formats
+
+
+def chat(path: str, **headers):
+    async def main():
+        response = await api.app.test_client().post(
+            path, json={"conversation": CONVERSATION}, headers=headers
+        )
+        return response.status_code, await response.get_json()
+
+    return asyncio.run(main())
+
+
+def test_chat_voice_output_uses_the_negotiated_format(replies):
+    status, output = chat("/chat", Accept="audio/ogg, application/json;q=0.5")
+
+    assert status == 200
+    assert replies == [OPUS]
+    assert output["vo_id"].endswith(".ogg")
+
+
+def test_chat_format_parameter_overrides_accept(replies):
+    status, output = chat("/chat?format=wav", Accept="audio/mpeg")
+
+    assert status == 200
+    assert replies == [WAV]
+    assert output["vo_id"].endswith(".wav")
+
+
+def test_chat_rejects_an_unsupported_format(replies):
+    status, _ = chat("/chat?format=flac")
+
+    assert status == 400
+    assert replies == []
@@ -0,0 +1,133 @@
+import asyncio
+
+from api import context
+from api.context import ContextManager, count_message_tokens
+
+SYSTEM = {"role": "system", "content": "You are a product management interviewer."}
+
+
+def turns(count: int):
+    return [
+        {
+            "role": "user" if i % 2 else "assistant",
+            "content": f"Turn {i}: " + "lorem ipsum dolor sit amet " * 10,
+        }
+        for i in range(count)
+    ]
+
+
+def budget_for(messages) -> int:
+    return sum(count_message_tokens(message) for message in messages)
+
+
+def fake_summarizer(monkeypatch, summary="The candidate picked a market."):
+    prompts = []
+
+    async def complete(prompt, model):
+        prompts.append(prompt)
+        return summary
+
+    monkeypatch.setattr(context, "get_txt2txt_completion", complete)
+    return prompts
+
+
+def test_conversation_within_the_budget_is_unchanged():
+    messages = [SYSTEM] + turns(4)
+    manager = ContextManager(budget=budget_for(messages), keep_recent=2)
+
+    assert manager.compact(messages, key="session") is messages
+    assert manager.stats.last_tokens_saved == 0
+
+
+def test_older_turns_are_dropped_without_a_key(monkeypatch):
+    prompts = fake_summarizer(monkeypatch)
+    messages = [SYSTEM] + turns(10)
+    manager = ContextManager(budget=budget_for(messages[:4]), keep_recent=2)
+
+    async def main():
+        compacted = manager.compact(messages)
+        await asyncio.sleep(0)
+        return compacted
+
+    compacted = asyncio.run(main())
+    assert compacted == [SYSTEM] + messages[-3:]
+    assert manager.stats.last_tokens_saved > 0
+    assert prompts == []
+
+
+def test_keep_recent_is_sent_even_over_the_budget():
+    messages = [SYSTEM] + turns(10)
+    manager = ContextManager(budget=1, keep_recent=4)
+
+    async def main():
+        return manager.compact(messages)
+
+    assert asyncio.run(main()) == [SYSTEM] + messages[-4:]
+
+
+def test_older_turns_are_folded_into_a_running_summary(monkeypatch):
+    prompts = fake_summarizer(monkeypatch)
+    messages = [SYSTEM] + turns(10)
+    manager = ContextManager(budget=budget_for(messages[:4]), keep_recent=2)
+
+    async def main():
+        first = manager.compact(messages, key="session")
+        await manager._states["session"].refresh
+        second = manager.compact(messages, key="session")
+        await manager._states["session"].refresh
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == [SYSTEM] + messages[-3:]
+    # The summarizer was sent the turns that no longer fit
+    assert "Current summary:\n(none)" in prompts[0][1]["content"]
+    assert "Turn 0:" in prompts[0][1]["content"]
+    assert "Turn 6:" in prompts[0][1]["content"]
+    assert "Turn 7:" not in prompts[0][1]["content"]
+
+    assert second[0] == SYSTEM
+    assert second[1]["role"] == "system"
+    assert "The candidate picked a market." in second[1]["content"]
+    assert second[2:] == messages[-2:]
+    # Only the turn pushed out by the summary is added to it
+    prompt = prompts[1][1]["content"]
+    assert "Current summary:\nThe candidate picked a market." in prompt
+    assert "Turn 6:" not in prompt
+    assert "Turn 7:" in prompt
+    assert manager.stats.summary_refreshes == 2
+
+
+def test_rewritten_history_discards_the_summary(monkeypatch):
+    prompts = fake_summarizer(monkeypatch)
+    messages = [SYSTEM] + turns(10)
+    manager = ContextManager(budget=budget_for(messages[:4]), keep_recent=2)
+
+    async def main():
+        manager.compact(messages, key="session")
+        await manager._states["session"].refresh
+        compacted = manager.compact([SYSTEM] + turns(6), key="session")
+        await manager._states["session"].refresh
+        return compacted
+
+    compacted = asyncio.run(main())
+    assert compacted == [SYSTEM] + turns(6)[-3:]
+    assert "Current summary:\n(none)" in prompts[1][1]["content"]
+    assert manager._states["session"].covered == 3
+
+
+def test_summary_failures_are_counted(monkeypatch):
+    async def fail(prompt, model):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(context, "get_txt2txt_completion", fail)
+    messages = [SYSTEM] + turns(10)
+    manager = ContextManager(budget=budget_for(messages[:4]), keep_recent=2)
+
+    async def main():
+        compacted = manager.compact(messages, key="session")
+        await manager._states["session"].refresh
+        return compacted
+
+    assert asyncio.run(main()) == [SYSTEM] + messages[-3:]
+    assert manager.stats.summary_failures == 1
+    assert manager._states["session"].covered == 0
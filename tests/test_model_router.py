@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from api import model_router
+from api.model_router import LLMError, ModelRouter
+
+
+@pytest.fixture
+def models(monkeypatch):
+    # Model stats are shared between routers
+    monkeypatch.setattr(ModelRouter, "_stats", {})
+    return ["primary", "fallback"]
+
+
+def test_failed_model_falls_back_to_the_next(models):
+    primary, fallback = models
+    router = ModelRouter("chat", models, timeout=1)
+
+    async def call(model):
+        if model == primary:
+            raise ConnectionError(f"{model} is down")
+        return model
+
+    assert asyncio.run(router.run(call)) == fallback
+    assert ModelRouter.stats_for(primary).failures == 1
+    assert ModelRouter.stats_for(primary).latencies["chat"].error_rate == 1.0
+
+
+def test_timed_out_model_falls_back_to_the_next(models):
+    primary, fallback = models
+    router = ModelRouter("chat", models, timeout=0.01)
+
+    async def call(model):
+        if model == primary:
+            await asyncio.sleep(1)
+        return model
+
+    assert asyncio.run(router.run(call)) == fallback
+    assert ModelRouter.stats_for(primary).timeouts == 1
+
+
+def test_router_raises_when_every_model_fails(models):
+    router = ModelRouter("chat", models, timeout=1)
+
+    async def call(model):
+        raise ConnectionError(f"{model} is down")
+
+    with pytest.raises(LLMError):
+        asyncio.run(router.run(call))
+
+
+def test_latencies_are_kept_per_operation(models):
+    model = models[0]
+    chat = ModelRouter("chat", [model], timeout=1)
+    analysis = ModelRouter("analysis", [model], timeout=1)
+
+    async def call(model):
+        return model
+
+    async def fail(model):
+        raise ConnectionError(f"{model} is down")
+
+    async def main():
+        await chat.run(call)
+        with pytest.raises(LLMError):
+            await analysis.run(fail)
+
+    asyncio.run(main())
+
+    latencies = ModelRouter.stats_for(model).latencies
+    assert (len(latencies["chat"]), latencies["chat"].error_rate) == (1, 0.0)
+    assert (len(latencies["analysis"]), latencies["analysis"].error_rate) == (0, 1.0)
+    stats = ModelRouter.stats()[model]
+    assert stats["chat_error_rate"] == 0.0
+    assert stats["analysis_error_rate"] == 1.0
+
+
+def test_model_failing_an_operation_is_tried_last_for_it(models):
+    primary, fallback = models
+    stats = ModelRouter.stats_for(primary)
+    for _ in range(3):
+        stats.latencies["analysis"].record(1.0, ok=False)
+
+    router = ModelRouter("chat", models, timeout=1)
+
+    assert [model.model for model in router.candidates("analysis")] == [
+        fallback,
+        primary,
+    ]
+    assert [model.model for model in router.candidates("chat")] == models
+
+
+def test_stalled_stream_is_recorded_as_a_failure(models, monkeypatch):
+    monkeypatch.setattr(model_router, "LLM_TOKEN_TIMEOUT_SECONDS", 0.01)
+    model = models[0]
+    router = ModelRouter("chat", [model], timeout=1)
+
+    async def open_stream(model):
+        yield "Who "
+        await asyncio.sleep(1)
+        yield "are the users?"
+
+    async def main():
+        tokens = []
+        with pytest.raises(LLMError, match="stalled"):
+            async for token in router.stream(open_stream):
+                tokens.append(token)
+        return tokens
+
+    assert asyncio.run(main()) == ["Who "]
+    stats = ModelRouter.stats_for(model)
+    assert (stats.failures, stats.timeouts) == (1, 1)
+    assert stats.breaker.failures == 1
+    latencies = stats.latencies["chat_first_token"]
+    # The first token succeeded, then the stream stalled
+    assert (len(latencies), latencies.error_rate) == (1, 0.5)
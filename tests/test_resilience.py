@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+
+from api import resilience
+from api.resilience import (
+    CircuitBreaker,
+    FailoverError,
+    LatencyWindow,
+    backoff_delay,
+    failover,
+    guarded_call,
+)
+
+
+def open_breaker(reset_timeout: float) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_a_single_trial_through():
+    breaker = open_breaker(reset_timeout=0)
+
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = open_breaker(reset_timeout=0)
+    assert breaker.allow()
+
+    breaker.reset_timeout = 60
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_released_trial_can_be_retried():
+    breaker = open_breaker(reset_timeout=0)
+    assert breaker.allow()
+
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_backoff_delay_grows_exponentially_up_to_the_cap(monkeypatch):
+    # Full jitter draws from [0, bound]; take the upper end to see the bound
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+
+    delays = [backoff_delay(attempt, 0.5, cap=3) for attempt in range(1, 6)]
+    assert delays == [0.5, 1.0, 2.0, 3, 3]
+
+
+def test_backoff_delay_is_jittered():
+    delays = [backoff_delay(3, 1.0) for _ in range(100)]
+
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+class Candidate:
+    def __init__(self, name: str, delay: float = 0, down: bool = False):
+        self.name = name
+        self.delay = delay
+        self.down = down
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        self.latencies = LatencyWindow()
+        self.requests = self.failures = self.timeouts = 0
+        self.finished = False
+
+    async def call(self) -> str:
+        await asyncio.sleep(self.delay)
+        if self.down:
+            raise ConnectionError(f"{self.name} is down")
+        self.finished = True
+        return self.name
+
+
+def attempt(candidate: Candidate, timeout: float = 1):
+    return guarded_call(
+        candidate.call,
+        timeout,
+        candidate,
+        candidate.latencies,
+        candidate.name,
+        "test",
+    )
+
+
+def test_failover_moves_on_from_a_failed_candidate():
+    first, second = Candidate("first", down=True), Candidate("second")
+
+    winner, result = asyncio.run(failover([first, second], attempt))
+
+    assert (winner, result) == (second, "second")
+    assert (first.failures, first.latencies.error_rate) == (1, 1.0)
+    assert first.breaker.state == "open"
+
+
+def test_failover_skips_candidates_whose_breaker_is_open():
+    first, second = Candidate("first"), Candidate("second")
+    first.breaker.record_failure()
+
+    winner, _ = asyncio.run(failover([first, second], attempt))
+
+    assert winner is second
+    assert first.requests == 0
+
+
+def test_failover_hedges_a_slow_candidate_and_cancels_the_loser():
+    first, second = Candidate("first", delay=1), Candidate("second")
+    hedges = []
+
+    winner, _ = asyncio.run(
+        failover(
+            [first, second],
+            attempt,
+            hedge_delay=lambda candidate: 0.01,
+            on_hedge=lambda: hedges.append(1),
+        )
+    )
+
+    assert winner is second
+    assert len(hedges) == 1
+    assert not first.finished
+    # A cancelled call says nothing about the candidate's health
+    assert (first.failures, first.breaker.state) == (0, "closed")
+
+
+def test_failover_reports_every_failure():
+    first = Candidate("first", down=True)
+    second = Candidate("second", delay=1)
+
+    with pytest.raises(FailoverError) as e:
+        asyncio.run(
+            failover(
+                [first, second],
+                lambda candidate: attempt(candidate, timeout=0.01),
+            )
+        )
+
+    assert [candidate for candidate, _ in e.value.failures] == [first, second]
+    assert isinstance(e.value.failures[1][1], asyncio.TimeoutError)
+    assert second.timeouts == 1
+
+
+def test_failover_without_an_available_candidate():
+    candidate = Candidate("first")
+    candidate.breaker.record_failure()
+
+    with pytest.raises(FailoverError) as e:
+        asyncio.run(failover([candidate], attempt))
+
+    assert e.value.failures == []
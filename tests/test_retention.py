@@ -0,0 +1,90 @@
+import os
+import time
+
+from api.layout import write_path
+from api.retention import RetentionPolicy, sweep_directory
+from api.utils import generate_uuid
+
+DAY = 24 * 3600
+# Setting a file's mtime updates its ctime, which the sweep also goes by, so
+# files can only be aged into the past of a clock that runs ahead
+NOW = time.time() + 10 * DAY
+
+
+def make_file(directory: str, id: str, size: int, age: float, suffix=".wav") -> str:
+    path = write_path(directory, f"{id}{suffix}")
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (NOW - age, NOW - age))
+    return path
+
+
+def test_expired_files_are_deleted(tmp_path):
+    directory = str(tmp_path)
+    old = make_file(directory, generate_uuid(), 10, age=8 * DAY)
+    new = make_file(directory, generate_uuid(), 10, age=DAY)
+
+    result = sweep_directory(RetentionPolicy(directory, ttl=7 * DAY), set(), now=NOW)
+
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+    assert (result.files, result.bytes) == (2, 20)
+    assert (result.deleted_files, result.deleted_bytes) == (1, 10)
+
+
+def test_oldest_files_are_deleted_over_the_quota(tmp_path):
+    directory = str(tmp_path)
+    paths = [
+        make_file(directory, generate_uuid(), 10, age=age) for age in (30, 20, 10)
+    ]
+
+    result = sweep_directory(RetentionPolicy(directory, max_bytes=15), set(), now=NOW)
+
+    assert [os.path.exists(path) for path in paths] == [False, False, True]
+    assert result.deleted_bytes == 20
+
+
+def test_protected_ids_and_their_segments_are_kept(tmp_path):
+    directory = str(tmp_path)
+    id = generate_uuid()
+    reply = make_file(directory, id, 10, age=8 * DAY)
+    segment = make_file(directory, id, 10, age=8 * DAY, suffix="-0.wav")
+
+    result = sweep_directory(RetentionPolicy(directory, ttl=DAY), {id}, now=NOW)
+
+    assert os.path.exists(reply)
+    assert os.path.exists(segment)
+    assert result.deleted_files == 0
+
+
+def test_dry_run_reports_without_deleting(tmp_path):
+    directory = str(tmp_path)
+    old = make_file(directory, generate_uuid(), 10, age=8 * DAY)
+
+    result = sweep_directory(
+        RetentionPolicy(directory, ttl=DAY), set(), now=NOW, dry_run=True
+    )
+
+    assert os.path.exists(old)
+    assert (result.deleted_files, result.deleted_bytes) == (1, 10)
+
+
+def test_missing_directory_is_empty(tmp_path):
+    result = sweep_directory(
+        RetentionPolicy(str(tmp_path / "missing"), ttl=DAY), set(), now=NOW
+    )
+
+    assert (result.files, result.deleted_files) == (0, 0)
+
+
+def test_file_linked_from_an_old_one_is_kept(tmp_path):
+    cached = make_file(str(tmp_path / "cache"), generate_uuid(), 10, age=0)
+    os.utime(cached, (time.time() - 30 * DAY, time.time() - 30 * DAY))
+    directory = str(tmp_path / "vo")
+    linked = write_path(directory, f"{generate_uuid()}.wav")
+    os.link(cached, linked)
+
+    result = sweep_directory(RetentionPolicy(directory, ttl=DAY), set())
+
+    assert os.path.exists(linked)
+    assert result.deleted_files == 0
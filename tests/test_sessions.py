@@ -0,0 +1,70 @@
+from api.models import Message
+from api.sessions import SessionStore
+
+
+def message(content: str, id: str = None) -> Message:
+    return Message(role="user", content=content, id=id)
+
+
+def test_least_recently_used_session_is_evicted_over_the_count():
+    store = SessionStore(ttl=60, max_count=2, max_bytes=1024)
+    a = store.create()
+    b = store.create()
+    # Using "a" makes "b" the least recently used
+    assert store.get(a.id) is a
+
+    c = store.create()
+    assert len(store) == 2
+    assert store.get(b.id) is None
+    assert store.get(a.id) is a
+    assert store.get(c.id) is c
+
+
+def test_sessions_are_evicted_over_the_byte_limit():
+    store = SessionStore(ttl=60, max_count=10, max_bytes=10)
+    a = store.create([message("12345")])
+    b = store.create([message("12345")])
+    assert len(store) == 2
+
+    store.append(b, message("1"))
+    assert store.get(a.id) is None
+    assert store.get(b.id) is b
+
+
+def test_only_session_is_kept_however_large():
+    store = SessionStore(ttl=60, max_count=10, max_bytes=4)
+    session = store.create([message("a long system prompt")])
+
+    assert store.get(session.id) is session
+
+
+def test_pop_and_delete_release_their_bytes():
+    store = SessionStore(ttl=60, max_count=10, max_bytes=10)
+    a = store.create([message("12345")])
+    store.append(a, message("12345"))
+    store.pop(a)
+    assert a.size == 5
+
+    store.delete(a.id)
+    b = store.create([message("1234567890")])
+    c = store.create()
+    assert store.get(b.id) is b
+    assert store.get(c.id) is c
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(ttl=60, max_count=10, max_bytes=1024)
+    session = store.create()
+    session.last_active -= 61
+
+    assert store.get(session.id) is None
+    assert len(store) == 0
+
+
+def test_active_ids_lists_the_message_ids_of_live_sessions():
+    store = SessionStore(ttl=60, max_count=10, max_bytes=1024)
+    expired = store.create([message("bye", id="first")])
+    expired.last_active -= 61
+    store.create([message("hi", id="second"), message("no id")])
+
+    assert store.active_ids() == {"second"}
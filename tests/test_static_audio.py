@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from api import app, static_audio
+from api.layout import VO_DIR, write_path
+from api.utils import generate_uuid
+
+AUDIO = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def vo_id(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    vo_id = generate_uuid()
+    with open(write_path(VO_DIR, f"{vo_id}.wav"), "wb") as f:
+        f.write(AUDIO)
+    return vo_id
+
+
+def get(path: str, **headers):
+    async def main():
+        response = await app.test_client().get(path, headers=headers)
+        return response, await response.get_data()
+
+    return asyncio.run(main())
+
+
+def test_audio_is_served_with_an_etag_and_cached_forever(vo_id):
+    response, body = get(f"/vo/{vo_id}.wav")
+
+    assert response.status_code == 200
+    assert body == AUDIO
+    assert response.mimetype == "audio/wav"
+    assert response.headers["ETag"] == f'"{vo_id}.wav"'
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == static_audio.AUDIO_CACHE_MAX_AGE
+
+
+def test_matching_etag_is_not_modified(vo_id):
+    response, body = get(f"/vo/{vo_id}.wav", **{"If-None-Match": f'"{vo_id}.wav"'})
+
+    assert response.status_code == 304
+    assert body == b""
+    assert response.headers["ETag"] == f'"{vo_id}.wav"'
+
+
+def test_etag_is_checked_before_the_file(vo_id):
+    missing = generate_uuid()
+
+    response, _ = get(f"/vo/{missing}.wav", **{"If-None-Match": f'"{missing}.wav"'})
+
+    assert response.status_code == 304
+
+
+def test_range_is_served_partially(vo_id):
+    response, body = get(f"/vo/{vo_id}.wav", Range="bytes=10-19")
+
+    assert response.status_code == 206
+    assert body == AUDIO[10:20]
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(AUDIO)}"
+
+
+def test_missing_audio_is_not_found(vo_id):
+    response, _ = get(f"/vo/{generate_uuid()}.wav")
+
+    assert response.status_code == 404
+
+
+def test_accel_redirect_leaves_the_bytes_to_the_proxy(vo_id, monkeypatch):
+    monkeypatch.setattr(static_audio, "AUDIO_ACCEL_REDIRECT_PREFIX", "/_public/")
+
+    response, body = get(f"/vo/{vo_id}.wav")
+
+    assert body == b""
+    assert response.headers["X-Accel-Redirect"] == (
+        f"/_public/vo/{vo_id[:6]}/{vo_id}.wav"
+    )
+    assert response.headers["ETag"] == f'"{vo_id}.wav"'
@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from api import storage
+from api.models import (
+    AnalysisScore,
+    Conversation,
+    ConversationAnalysis,
+    ConversationOverallAnalysis,
+    Message,
+)
+from api.storage import FileConversationStore, SQLiteConversationStore
+from api.utils import generate_uuid
+
+CONVERSATION = Conversation(
+    messages=[
+        Message(
+            role="assistant",
+            content="How would you improve Google Maps?",
+            timestamp=datetime(2024, 9, 1, 12, 0, tzinfo=timezone.utc),
+            id=generate_uuid(),
+        ),
+        Message(
+            role="user",
+            content="I'd start by asking who the users are.",
+            timestamp=datetime(2024, 9, 1, 12, 1, tzinfo=timezone.utc),
+            id=generate_uuid(),
+        ),
+    ]
+)
+
+ANALYSIS = ConversationOverallAnalysis(
+    conversation=CONVERSATION,
+    analysis=ConversationAnalysis(
+        clarifying_questions=AnalysisScore(
+            name="clarifying_questions",
+            human_name="Clarifying Questions",
+            description="Asks questions before answering.",
+            score=8,
+            feedback="Good start.",
+        )
+    ),
+    overall_score=8,
+    overall_feedback="Solid.",
+)
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "file":
+        store = FileConversationStore(
+            str(tmp_path / "analyze"), str(tmp_path / "analysis_cache")
+        )
+    else:
+        store = SQLiteConversationStore(str(tmp_path / "test.db"), pool_size=2)
+    yield store
+    asyncio.run(store.close())
+
+
+def test_conversation_round_trip(store):
+    async def main():
+        conversation_id = generate_uuid()
+        await store.save_conversation(conversation_id, CONVERSATION)
+        return await store.load(conversation_id)
+
+    loaded = asyncio.run(main())
+    assert loaded.conversation == CONVERSATION
+    assert loaded.analysis is None
+    assert loaded.overall_score is None
+
+
+def test_analysis_round_trip(store):
+    async def main():
+        conversation_id = generate_uuid()
+        await store.save_conversation(conversation_id, CONVERSATION)
+        await store.save_analysis(conversation_id, ANALYSIS)
+        return await store.load(conversation_id)
+
+    assert asyncio.run(main()) == ANALYSIS
+
+
+def test_missing_conversation_loads_as_none(store):
+    assert asyncio.run(store.load(generate_uuid())) is None
+
+
+def test_conversations_are_listed_newest_first(store):
+    async def main():
+        ids = sorted(generate_uuid() for _ in range(3))
+        for conversation_id in ids:
+            await store.save_conversation(conversation_id, CONVERSATION)
+        listed = await store.list_conversations()
+        page = await store.list_conversations(limit=1, before=ids[2])
+        return ids, listed, page
+
+    ids, listed, page = asyncio.run(main())
+    assert listed == ids[::-1]
+    assert page == [ids[1]]
+
+
+def test_cached_analysis_round_trip(store):
+    async def main():
+        assert await store.load_cached_analysis("0" * 64) is None
+        await store.save_cached_analysis("0" * 64, ANALYSIS)
+        return await store.load_cached_analysis("0" * 64)
+
+    cached = asyncio.run(main())
+    # The cache is shared between conversations, so it holds no transcript
+    assert cached.conversation == Conversation(messages=[])
+    assert cached.analysis == ANALYSIS.analysis
+    assert cached.overall_score == 8
+    assert cached.overall_feedback == "Solid."
+
+
+def test_expired_cached_analysis_is_ignored(tmp_path, monkeypatch):
+    store = SQLiteConversationStore(str(tmp_path / "test.db"), pool_size=1)
+
+    async def main():
+        await store.save_cached_analysis("0" * 64, ANALYSIS)
+        monkeypatch.setattr(storage, "ANALYSIS_CACHE_TTL_SECONDS", 1e-6)
+        await asyncio.sleep(0.01)
+        try:
+            return await store.load_cached_analysis("0" * 64)
+        finally:
+            await store.close()
+
+    assert asyncio.run(main()) is None
@@ -0,0 +1,147 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from deepgram import LiveTranscriptionEvents
+
+from api import stt_stream
+from api.stt_stream import (
+    DeepgramStreamingBackend,
+    FakeStreamingBackend,
+    TranscriptEvent,
+    UtteranceAssembler,
+)
+
+SPEECH = b"\x01\x02"
+SILENCE = b"\0\0"
+
+
+async def assemble(frames):
+    backend = FakeStreamingBackend("tell me about a product you love")
+    assembler = UtteranceAssembler()
+    await backend.start()
+    for frame in frames:
+        await backend.send(frame)
+    await backend.finish()
+    return [
+        message
+        async for event in backend.events()
+        for message in assembler.process(event)
+    ]
+
+
+def test_silence_ends_the_utterance():
+    messages = asyncio.run(assemble([SPEECH, SPEECH, SILENCE, SPEECH]))
+
+    assert messages == [
+        {"type": "interim", "text": "tell"},
+        {"type": "interim", "text": "tell me"},
+        {"type": "final", "text": "tell me"},
+        {"type": "utterance_end", "text": "tell me"},
+        {"type": "interim", "text": "about"},
+        # finish() flushes the utterance still in progress
+        {"type": "final", "text": "about"},
+        {"type": "utterance_end", "text": "about"},
+    ]
+
+
+def test_silence_without_speech_sends_nothing():
+    assert asyncio.run(assemble([SILENCE, SILENCE])) == []
+
+
+def test_final_segments_are_joined_until_speech_final():
+    assembler = UtteranceAssembler()
+
+    assert assembler.process(TranscriptEvent("I would", is_final=True)) == [
+        {"type": "final", "text": "I would"}
+    ]
+    assert assembler.process(
+        TranscriptEvent("start with users", is_final=True, speech_final=True)
+    ) == [
+        {"type": "final", "text": "start with users"},
+        {"type": "utterance_end", "text": "I would start with users"},
+    ]
+    # The next utterance starts from scratch
+    assert assembler.process(TranscriptEvent("", speech_final=True)) == []
+
+
+class FakeConnection:
+    """Stands in for Deepgram's live WebSocket client."""
+
+    def __init__(self):
+        self.handlers = {}
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    async def start(self, options):
+        return True
+
+    async def emit(self, event, **kwargs):
+        await self.handlers[event](self, **kwargs)
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    connection = FakeConnection()
+    deepgram = SimpleNamespace(
+        listen=SimpleNamespace(
+            asyncwebsocket=SimpleNamespace(v=lambda version: connection)
+        )
+    )
+    monkeypatch.setattr(
+        stt_stream, "provider_clients", SimpleNamespace(deepgram=deepgram)
+    )
+    return connection
+
+
+def transcript(text, is_final=False, speech_final=False):
+    return SimpleNamespace(
+        channel=SimpleNamespace(alternatives=[SimpleNamespace(transcript=text)]),
+        is_final=is_final,
+        speech_final=speech_final,
+    )
+
+
+async def messages_until_closed(backend):
+    assembler = UtteranceAssembler()
+    return [
+        message
+        async for event in backend.events()
+        for message in assembler.process(event)
+    ]
+
+
+def test_deepgram_error_ends_the_stream_with_an_error(connection):
+    async def main():
+        backend = DeepgramStreamingBackend()
+        await backend.start()
+        await connection.emit(
+            LiveTranscriptionEvents.Transcript, result=transcript("tell me")
+        )
+        await connection.emit(LiveTranscriptionEvents.Error, error="timeout")
+        # Deepgram closes the connection after the error
+        await connection.emit(LiveTranscriptionEvents.Close, close=None)
+        return await asyncio.wait_for(messages_until_closed(backend), 1)
+
+    assert asyncio.run(main()) == [
+        {"type": "interim", "text": "tell me"},
+        {"type": "error", "message": "transcription failed"},
+    ]
+
+
+def test_deepgram_close_ends_the_stream(connection):
+    async def main():
+        backend = DeepgramStreamingBackend()
+        await backend.start()
+        await connection.emit(
+            LiveTranscriptionEvents.Transcript,
+            result=transcript("tell me", is_final=True, speech_final=True),
+        )
+        await connection.emit(LiveTranscriptionEvents.Close, close=None)
+        return await asyncio.wait_for(messages_until_closed(backend), 1)
+
+    assert asyncio.run(main()) == [
+        {"type": "final", "text": "tell me"},
+        {"type": "utterance_end", "text": "tell me"},
+    ]
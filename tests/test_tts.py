@@ -0,0 +1,111 @@
+import asyncio
+import os
+
+import pytest
+
+from api import tts
+from api.audio_formats import DEFAULT_AUDIO_FORMAT
+from api.layout import VO_DIR, resolve_path
+from api.tts_cache import TTSCache
+from api.tts_router import TTSError, TTSProvider, TTSRouter
+
+
+class FakeProvider:
+    def __init__(self, name: str):
+        self.name = name
+        self.down = False
+        self.calls = 0
+
+    async def synthesize(self, speaker, text, audio_format) -> bytes:
+        self.calls += 1
+        if self.down:
+            raise ConnectionError(f"{self.name} is down")
+        return f"{self.name}:{speaker}:{text}".encode()
+
+    def provider(self) -> TTSProvider:
+        return TTSProvider(
+            name=self.name,
+            synthesize=self.synthesize,
+            voice=lambda speaker: f"{self.name}/{speaker}",
+        )
+
+
+@pytest.fixture
+def providers(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    primary, fallback = FakeProvider("primary"), FakeProvider("fallback")
+    router = TTSRouter([primary.provider(), fallback.provider()], retries=0)
+    monkeypatch.setattr(tts, "tts_router", router)
+    monkeypatch.setattr(tts, "tts_cache", TTSCache(str(tmp_path / "cache"), 1024))
+    return primary, fallback
+
+
+def read_vo(id: str) -> bytes:
+    path = resolve_path(VO_DIR, DEFAULT_AUDIO_FORMAT.filename(id))
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_router_returns_the_provider_that_answered(providers):
+    primary, fallback = providers
+    primary.down = True
+
+    provider, audio = asyncio.run(
+        tts.tts_router.synthesize("joy", "Hello.", DEFAULT_AUDIO_FORMAT)
+    )
+
+    assert provider.name == "fallback"
+    assert audio == b"fallback:joy:Hello."
+
+
+def test_router_does_not_hedge_by_default():
+    router = TTSRouter([FakeProvider("primary").provider()])
+
+    assert router.hedge is False
+
+
+def test_router_raises_when_every_provider_fails(providers):
+    for provider in providers:
+        provider.down = True
+
+    with pytest.raises(TTSError):
+        asyncio.run(tts.tts_router.synthesize("joy", "Hello.", DEFAULT_AUDIO_FORMAT))
+
+
+def test_preferred_provider_audio_is_cached(providers):
+    primary, _ = providers
+
+    async def main():
+        await tts.generate_tts("joy", "Can you elaborate?", "first")
+        await tts.generate_tts("joy", "Can you elaborate?", "second")
+
+    asyncio.run(main())
+
+    assert read_vo("first") == read_vo("second") == b"primary:joy:Can you elaborate?"
+    assert primary.calls == 1
+
+
+def test_fallback_audio_is_served_but_not_cached(providers):
+    primary, _ = providers
+    primary.down = True
+
+    asyncio.run(tts.generate_tts("joy", "Can you elaborate?", "first"))
+    assert read_vo("first") == b"fallback:joy:Can you elaborate?"
+    assert tts.tts_cache.stats()["entries"] == 0
+
+    # Once the preferred provider answers again, its voice is used and cached
+    primary.down = False
+    asyncio.run(tts.generate_tts("joy", "Can you elaborate?", "second"))
+    assert read_vo("second") == b"primary:joy:Can you elaborate?"
+    assert tts.tts_cache.stats()["entries"] == 1
+
+
+def test_cache_is_keyed_on_the_preferred_provider_voice(providers):
+    async def main():
+        await tts.generate_tts("joy", "Hello.", "joy")
+        await tts.generate_tts("tyler", "Hello.", "tyler")
+
+    asyncio.run(main())
+
+    assert read_vo("joy") != read_vo("tyler")
+    assert len(os.listdir(tts.tts_cache.directory)) == 2
@@ -0,0 +1,134 @@
+import asyncio
+import os
+
+import pytest
+
+from api.tts_cache import TTSCache
+
+
+def producer(audio: bytes, calls: list, delay: float = 0):
+    async def produce() -> bytes:
+        calls.append(audio)
+        await asyncio.sleep(delay)
+        return audio
+
+    return produce
+
+
+def test_hit_reuses_the_cached_file(tmp_path):
+    async def main():
+        cache = TTSCache(str(tmp_path), max_bytes=1024)
+        calls = []
+        key = TTSCache.make_key("rime", "cove", "wav", "Can you elaborate?")
+
+        first = await cache.get_or_create(key, producer(b"audio", calls))
+        second = await cache.get_or_create(key, producer(b"audio", calls))
+
+        assert first == second == os.path.join(str(tmp_path), f"{key}.wav")
+        with open(first, "rb") as f:
+            assert f.read() == b"audio"
+        assert calls == [b"audio"]
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    asyncio.run(main())
+
+
+def test_concurrent_misses_share_one_call(tmp_path):
+    async def main():
+        cache = TTSCache(str(tmp_path), max_bytes=1024)
+        calls = []
+        paths = await asyncio.gather(
+            *(
+                cache.get_or_create("key", producer(b"audio", calls, delay=0.01))
+                for _ in range(5)
+            )
+        )
+
+        assert len(set(paths)) == 1
+        assert calls == [b"audio"]
+        assert cache.stats()["coalesced"] == 4
+
+    asyncio.run(main())
+
+
+def test_errors_reach_every_waiter(tmp_path):
+    async def main():
+        cache = TTSCache(str(tmp_path), max_bytes=1024)
+
+        async def fail() -> bytes:
+            await asyncio.sleep(0.01)
+            raise RuntimeError("provider down")
+
+        results = await asyncio.gather(
+            *(cache.get_or_create("key", fail) for _ in range(3)),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert cache.stats()["entries"] == 0
+
+    asyncio.run(main())
+
+
+def test_waiter_takes_over_when_the_producer_is_cancelled(tmp_path):
+    async def main():
+        cache = TTSCache(str(tmp_path), max_bytes=1024)
+        calls = []
+        leader = asyncio.create_task(
+            cache.get_or_create("key", producer(b"first", calls, delay=10))
+        )
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(
+            cache.get_or_create("key", producer(b"second", calls))
+        )
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        path = await follower
+
+        with open(path, "rb") as f:
+            assert f.read() == b"second"
+        assert calls == [b"first", b"second"]
+
+    asyncio.run(main())
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    async def main():
+        cache = TTSCache(str(tmp_path), max_bytes=10)
+        calls = []
+        a = await cache.get_or_create("a", producer(b"aaaa", calls))
+        await cache.get_or_create("b", producer(b"bbbb", calls))
+        # Touch "a", so "b" is the least recently used
+        await cache.get_or_create("a", producer(b"aaaa", calls))
+        await cache.get_or_create("c", producer(b"cccc", calls))
+
+        assert os.path.exists(a)
+        assert not os.path.exists(cache.path("b.wav"))
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] == 8
+
+        await cache.get_or_create("b", producer(b"bbbb", calls))
+        assert calls == [b"aaaa", b"bbbb", b"cccc", b"bbbb"]
+
+    asyncio.run(main())
+
+
+def test_existing_files_are_loaded_and_trimmed(tmp_path):
+    for name in ("a.wav", "b.wav", "c.wav"):
+        (tmp_path / name).write_bytes(b"1234")
+    (tmp_path / "d.wav.tmp").write_bytes(b"partial")
+    os.utime(tmp_path / "a.wav", (1, 1))
+
+    async def main():
+        cache = TTSCache(str(tmp_path), max_bytes=8)
+        calls = []
+        await cache.get_or_create("b", producer(b"1234", calls))
+
+        assert calls == []
+        assert not (tmp_path / "a.wav").exists()
+        assert cache.stats()["entries"] == 2
+
+    asyncio.run(main())
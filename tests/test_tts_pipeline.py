@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from api import tts_pipeline
+from api.layout import VO_DIR, resolve_path
+from api.tts_pipeline import SentenceSplitter, TTSPipeline
+from api.tts_router import TTSError
+
+
+def test_splitter_merges_short_sentences():
+    splitter = SentenceSplitter(min_length=10)
+
+    sentences = splitter.feed("Great. Who are the users? ") + splitter.feed("Tell")
+
+    assert sentences == ["Great. Who are the users?"]
+    assert splitter.flush() == "Tell"
+
+
+@pytest.mark.parametrize("error", [TTSError("no provider"), OSError("disk full")])
+def test_failed_segment_is_skipped_and_the_rest_play(monkeypatch, tmp_path, error):
+    monkeypatch.chdir(tmp_path)
+
+    async def generate_tts(speaker, text, id, audio_format):
+        if text == "Second.":
+            raise error
+
+    monkeypatch.setattr(tts_pipeline, "generate_tts", generate_tts)
+
+    async def main():
+        pipeline = TTSPipeline(speaker="joy", vo_id="reply")
+        for text in ("First.", "Second.", "Third."):
+            pipeline.submit(text)
+        segments = []
+        while segment := await pipeline.next():
+            segments.append(segment)
+        await pipeline.write_playlist()
+        return segments
+
+    segments = asyncio.run(main())
+
+    assert [(segment.text, segment.ok) for segment in segments] == [
+        ("First.", True),
+        ("Second.", False),
+        ("Third.", True),
+    ]
+    with open(resolve_path(VO_DIR, "reply.m3u")) as f:
+        assert f.read().splitlines() == ["#EXTM3U", "reply-0.wav", "reply-2.wav"]
@@ -0,0 +1,129 @@
+import asyncio
+import io
+import json
+
+import pytest
+from quart.datastructures import FileStorage
+
+import api
+from api import tts_pipeline
+from api.sessions import sessions
+
+CONVERSATION = {
+    "messages": [
+        {"role": "assistant", "content": "How would you improve Google Maps?"}
+    ]
+}
+REPLY = ["Who ", "are ", "the ", "users?"]
+
+
+@pytest.fixture(autouse=True)
+def providers(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+
+    async def transcribe_audio(audio):
+        return "I'd start with the users."
+
+    async def get_txt2txt_completion(messages, **kwargs):
+        return "".join(REPLY)
+
+    async def stream_txt2txt_completion(messages, **kwargs):
+        for token in REPLY:
+            yield token
+
+    async def generate_tts(speaker, text, id, audio_format):
+        pass
+
+    monkeypatch.setattr(api, "transcribe_audio", transcribe_audio)
+    monkeypatch.setattr(api, "get_txt2txt_completion", get_txt2txt_completion)
+    monkeypatch.setattr(api, "stream_txt2txt_completion", stream_txt2txt_completion)
+    monkeypatch.setattr(api, "generate_tts", generate_tts)
+    monkeypatch.setattr(tts_pipeline, "generate_tts", generate_tts)
+
+
+def post_turn(path: str, **form):
+    async def main():
+        files = {
+            "file": FileStorage(
+                stream=io.BytesIO(b"RIFF"),
+                filename="speech.wav",
+                content_type="audio/wav",
+            )
+        }
+        response = await api.app.test_client().post(path, form=form, files=files)
+        return response.status_code, await response.get_data(as_text=True)
+
+    return asyncio.run(main())
+
+
+def events(body: str):
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        yield lines["event"], json.loads(lines["data"])
+
+
+@pytest.mark.parametrize("path", ["/turn", "/turn/stream"])
+@pytest.mark.parametrize(
+    "conversation",
+    [
+        "not json",
+        "[]",
+        json.dumps({"messages": [{"role": "user", "content": None}]}),
+        json.dumps({"messages": [{"content": "Hi"}]}),
+    ],
+)
+def test_invalid_conversation_is_rejected(path, conversation):
+    status, body = post_turn(path, conversation=conversation)
+
+    assert status == 400
+    assert body.startswith("conversation is not a valid Conversation")
+
+
+@pytest.mark.parametrize("path", ["/turn", "/turn/stream"])
+def test_conversation_or_session_is_required(path):
+    status, _ = post_turn(path)
+
+    assert status == 400
+
+
+@pytest.mark.parametrize("path", ["/turn", "/turn/stream"])
+def test_unknown_session_is_not_found(path):
+    status, _ = post_turn(path, session_id="missing")
+
+    assert status == 404
+
+
+def test_turn_replies_to_the_transcript():
+    status, body = post_turn("/turn", conversation=json.dumps(CONVERSATION))
+
+    assert status == 200
+    output = json.loads(body)
+    assert output["transcript"] == "I'd start with the users."
+    assert output["content"] == "Who are the users?"
+
+
+def test_turn_adds_the_transcript_and_reply_to_the_session():
+    session = sessions.create([])
+    try:
+        status, _ = post_turn("/turn", session_id=session.id)
+
+        assert status == 200
+        assert [(m.role, m.content) for m in session.messages] == [
+            ("user", "I'd start with the users."),
+            ("assistant", "Who are the users?"),
+        ]
+    finally:
+        sessions.delete(session.id)
+
+
+def test_turn_stream_sends_the_transcript_then_the_reply():
+    status, body = post_turn("/turn/stream", conversation=json.dumps(CONVERSATION))
+
+    assert status == 200
+    sent = list(events(body))
+    name, transcript = sent[0]
+    assert (name, transcript["text"]) == ("transcript", "I'd start with the users.")
+    assert [data["content"] for name, data in sent if name == "token"] == REPLY
+    name, done = sent[-1]
+    assert name == "done"
+    assert done["content"] == "Who are the users?"
@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from api import txt2txt
+from api.model_router import LLMError, ModelRouter
+
+MESSAGES = [{"role": "user", "content": "Who are the users?"}]
+
+
+def chunk(token):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(delta=SimpleNamespace(content=token))]
+    )
+
+
+class FakeStream:
+    """Stands in for the OpenAI AsyncStream of a streamed completion."""
+
+    def __init__(self, tokens, fail_after=None):
+        self.tokens = tokens
+        self.fail_after = fail_after
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+    async def __aiter__(self):
+        for i, token in enumerate(self.tokens):
+            if i == self.fail_after:
+                raise ConnectionError("connection reset")
+            yield chunk(token)
+
+
+@pytest.fixture
+def streams(monkeypatch):
+    streams = {}
+
+    async def create(model, **kwargs):
+        return streams[model]
+
+    openai = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+    monkeypatch.setattr(txt2txt, "provider_clients", SimpleNamespace(openai=openai))
+    return streams
+
+
+def stream(router, take=None):
+    async def main():
+        tokens = []
+        completion = txt2txt.stream_txt2txt_completion(MESSAGES, router=router)
+        try:
+            async for token in completion:
+                tokens.append(token)
+                if len(tokens) == take:
+                    break
+        finally:
+            await completion.aclose()
+        return tokens
+
+    return asyncio.run(main())
+
+
+def test_stream_is_closed_when_the_completion_ends(streams):
+    streams["a"] = FakeStream(["Who ", "are ", "the ", "users?"])
+
+    tokens = stream(ModelRouter("test-end", ["a"], timeout=1))
+
+    assert "".join(tokens) == "Who are the users?"
+    assert streams["a"].closed
+
+
+def test_stream_is_closed_when_the_client_goes_away(streams):
+    streams["a"] = FakeStream(["Who ", "are ", "the ", "users?"])
+
+    tokens = stream(ModelRouter("test-away", ["a"], timeout=1), take=1)
+
+    assert tokens == ["Who "]
+    assert streams["a"].closed
+
+
+def test_failed_stream_is_closed_before_falling_back(streams):
+    streams["a"] = FakeStream(["Who "], fail_after=0)
+    streams["b"] = FakeStream(["Who ", "are ", "the ", "users?"])
+
+    tokens = stream(ModelRouter("test-fallback", ["a", "b"], timeout=1))
+
+    assert "".join(tokens) == "Who are the users?"
+    assert streams["a"].closed
+    assert streams["b"].closed
+
+
+def test_stream_fails_when_every_model_fails(streams):
+    streams["a"] = FakeStream(["Who "], fail_after=0)
+
+    with pytest.raises(LLMError):
+        stream(ModelRouter("test-fail", ["a"], timeout=1))
+
+    assert streams["a"].closed